@@ -95,6 +95,69 @@ DATABASES = {
     }
 }
 
+# Write-behind buffer for incoming readings (sensors/services/ingest_buffer.py).
+# When enabled, readings are committed by a single writer thread in batches,
+# which avoids "database is locked" stalls with SQLite under concurrent writers.
+# DURABILITY: 'commit' acks a reading once its batch is committed,
+#             'enqueue' acks as soon as it is queued (unflushed readings are lost on a crash;
+#             POST /readings/ then answers 202 Accepted, without an id)
+#             and only applies to the ingest endpoints; the simulate endpoint always
+#             waits for the commit, since it goes on to use the stored reading
+READING_BUFFER = {
+    'ENABLED': False,
+    'MAX_QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 0.05,  # seconds
+    'DURABILITY': 'commit',
+    'ENQUEUE_TIMEOUT': 5.0,  # seconds
+}
+
+# Seconds the dashboard's latest-reading snapshot stays cached. Ingestion
+# updates it in place; the TTL only bounds staleness across processes.
+DASHBOARD_SNAPSHOT_TTL = 10
+
+# Memory budget of the per-process cache of trained models
+# (sensors/services/model_cache.py), measured by artifact size on disk
+MODEL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Seconds a forecast from the fleet forecasting job (manage.py forecast_drift)
+# is served before drift endpoints fall back to computing on demand
+DRIFT_FORECAST_MAX_AGE = 3600
+
+# Worker processes for ModelTrainer.train_all_models (None: one per CPU,
+# 1: train in-process) and the address-space cap of each worker in bytes
+MODEL_TRAINING_WORKERS = None
+MODEL_TRAINING_WORKER_MEMORY = 4 * 1024 * 1024 * 1024
+
+# Change-driven retraining (sensors/services/retraining.py, manage.py auto_train_models).
+# A model is retrained once MIN_NEW_READINGS readings (MIN_NEW_CALIBRATIONS for
+# calibration models) arrived after its training data, or sooner when the mean of
+# at least MIN_DRIFT_READINGS new readings moved DRIFT_THRESHOLD training standard
+# deviations. At most MAX_CONCURRENT models train at once.
+MODEL_RETRAINING = {
+    'MIN_NEW_READINGS': 1000,
+    'MIN_NEW_CALIBRATIONS': 5,
+    'DRIFT_THRESHOLD': 0.5,
+    'MIN_DRIFT_READINGS': 50,
+    'MAX_CONCURRENT': 2,
+}
+
+# ML analytics snapshot (sensors/services/analytics_snapshot.py). /ml/analytics/ serves
+# the last snapshot and recomputes it in the background once it is MAX_AGE seconds
+# old or MIN_NEW_READINGS readings arrived after it (also: manage.py refresh_ml_analytics).
+# A refresh not finished after REFRESH_TIMEOUT seconds is presumed dead. Until the first
+# snapshot exists, requests that find it being computed elsewhere get a 503 with Retry-After.
+ML_ANALYTICS_SNAPSHOT = {
+    'MAX_AGE': 300,
+    'MIN_NEW_READINGS': 1000,
+    'REFRESH_TIMEOUT': 600,
+    'RETRY_AFTER': 5,
+}
+
+# Where SimulateReadingAPIView keeps the adaptive calibration of each simulated
+# reading: 'calibration' creates a Calibration row (which also feeds the adaptive
+# fit), 'reading' stores it in the reading's corrected_value column instead
+SIMULATED_CALIBRATION_STORAGE = 'calibration'
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
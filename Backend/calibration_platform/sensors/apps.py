@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SensorsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sensors'
+
+    def ready(self):
+        # Keeps the adaptive calibration fits in step with saved calibrations
+        from . import signals  # noqa: F401
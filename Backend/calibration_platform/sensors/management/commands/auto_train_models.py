@@ -1,25 +1,33 @@
 from django.core.management.base import BaseCommand
 from sensors.services.ml_analytics import MLAnalyticsService
+from sensors.services.retraining import RetrainingScheduler
 import time
 
 class Command(BaseCommand):
-    help = 'Automatically train ML models in the background'
+    help = 'Retrain ML models in the background as new data arrives'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--interval',
             type=int,
-            default=3600,  # 1 hour default
-            help='Training interval in seconds (default: 3600)',
+            default=300,
+            help='Seconds between checks for new data (default: 300)',
         )
         parser.add_argument(
             '--run-once',
             action='store_true',
             help='Run training once and exit',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Models trained at once (default: MODEL_RETRAINING["MAX_CONCURRENT"])',
+        )
 
     def handle(self, *args, **options):
         analytics_service = MLAnalyticsService()
+        # One scheduler for the whole run, so failed jobs wait for new data
+        scheduler = RetrainingScheduler()
         interval = options['interval']
         run_once = options['run_once']
         
@@ -29,14 +37,17 @@ class Command(BaseCommand):
         
         try:
             while True:
-                self.stdout.write('Checking for models that need training...')
+                self.stdout.write('Checking for models with enough new data...')
                 
                 # Get current statistics
                 stats = analytics_service.get_ml_statistics()
                 self.stdout.write(f'Current models: {stats["total_models"]} total, {stats["active_models"]} active')
                 
                 # Auto-train models
-                results = analytics_service.auto_train_models_if_needed()
+                try:
+                    results = scheduler.run(workers=options['workers'])
+                except Exception as e:
+                    results = [{'error': str(e)}]
                 
                 if results:
                     self.stdout.write('Training results:')
@@ -49,22 +60,23 @@ class Command(BaseCommand):
                             sensor_name = result.get('sensor_name', 'Unknown')
                             model_type = result.get('model_type', 'Unknown')
                             training_result = result.get('result', {})
+                            reason = result.get('reason', '')
                             
                             if training_result.get('status') == 'success':
                                 self.stdout.write(
-                                    self.style.SUCCESS(f'{sensor_name} - {model_type}: {training_result.get("message", "Trained successfully")}')
+                                    self.style.SUCCESS(f'{sensor_name} - {model_type} ({reason}): {training_result.get("message", "Trained successfully")}')
                                 )
                             else:
                                 self.stdout.write(
                                     self.style.WARNING(f'{sensor_name} - {model_type}: {training_result.get("message", "Training failed")}')
                                 )
                 else:
-                    self.stdout.write('No models need training at this time.')
+                    self.stdout.write('No models have enough new data to retrain.')
                 
                 if run_once:
                     break
                 
-                self.stdout.write(f'Waiting {interval} seconds until next training cycle...')
+                self.stdout.write(f'Waiting {interval} seconds until the next check...')
                 time.sleep(interval)
                 
         except KeyboardInterrupt:
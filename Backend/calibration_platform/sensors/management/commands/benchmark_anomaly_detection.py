@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from sensors.models import Sensor, Reading
+from sensors.services.anomaly import classify_reading, recent_values
+from sensors.services.streaming_anomaly import StreamingAnomalyDetector
+import random
+import time
+from datetime import timedelta
+
+
+class Command(BaseCommand):
+    help = 'Compare the query-based and streaming anomaly detectors on replayed readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--readings',
+            type=int,
+            default=2000,
+            help='Number of readings to replay (default: 2000)',
+        )
+        parser.add_argument(
+            '--sensors',
+            type=int,
+            default=5,
+            help='Number of existing sensors to replay readings for',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the replayed values',
+        )
+
+    def handle(self, *args, **options):
+        sensors = list(Sensor.objects.order_by('id')[:options['sensors']])
+        if not sensors:
+            self.stdout.write(self.style.ERROR('No sensors found. Run generate_sample_data first.'))
+            return
+
+        rng = random.Random(options['seed'])
+        detector = StreamingAnomalyDetector()
+        query_time = 0.0
+        stream_time = 0.0
+        mismatches = 0
+        detected = 0
+        timestamp = timezone.now()
+
+        self.stdout.write(f'Replaying {options["readings"]:,} readings over {len(sensors)} sensor(s)...')
+
+        # Readings are inserted for real so both detectors see the same
+        # database state, then rolled back at the end
+        with transaction.atomic():
+            for _ in range(options['readings']):
+                sensor = rng.choice(sensors)
+                baseline = sensor.value or 1
+                value = rng.gauss(baseline, abs(baseline) * 0.1)
+                if rng.random() < 0.05:
+                    value *= rng.choice([0.2, 1.6])
+                timestamp += timedelta(seconds=1)
+
+                reading = Reading(sensor=sensor, raw_value=value, timestamp=timestamp)
+                Reading.objects.bulk_create([reading])
+
+                started = time.perf_counter()
+                expected = classify_reading(value, sensor.value or 0, recent_values(sensor))
+                query_time += time.perf_counter() - started
+
+                started = time.perf_counter()
+                detector.observe([reading])
+                actual = detector.classify(reading)
+                stream_time += time.perf_counter() - started
+
+                if expected != actual:
+                    mismatches += 1
+                if expected:
+                    detected += 1
+
+            transaction.set_rollback(True)
+
+        count = options['readings']
+        self.stdout.write(f'Anomalies detected: {detected:,}')
+        self.stdout.write(
+            f'detect_anomaly rules (query per reading): {count / query_time:,.0f} readings/s'
+        )
+        self.stdout.write(
+            f'StreamingAnomalyDetector:                 {count / stream_time:,.0f} readings/s'
+        )
+        self.stdout.write(f'Speedup: {query_time / stream_time:.1f}x')
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'{mismatches} reading(s) classified differently'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Results identical for every reading'))
@@ -0,0 +1,238 @@
+from django.core.management.base import BaseCommand, CommandError
+from sensors.models import Sensor, Reading, Anomaly, Calibration
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Hot query shapes used by the services and views
+QUERIES = [
+    (
+        'latest readings (detect_anomaly, dashboard)',
+        'SELECT id, raw_value, timestamp FROM {reading} WHERE sensor_id = :sensor '
+        'ORDER BY timestamp DESC LIMIT 10',
+    ),
+    (
+        'reading window (drift, training)',
+        'SELECT id, raw_value, timestamp FROM {reading} WHERE sensor_id = :sensor '
+        'AND timestamp >= :start ORDER BY timestamp',
+    ),
+    (
+        'history by sensor name (ReadingHistoryAPIView)',
+        'SELECT r.id, r.raw_value, r.timestamp FROM {reading} r JOIN {sensor} s ON s.id = r.sensor_id '
+        'WHERE s.name = :name AND r.timestamp BETWEEN :start AND :end',
+    ),
+    (
+        'open anomalies (AnomalyListCreateAPIView)',
+        'SELECT id, type, timestamp FROM {anomaly} WHERE sensor_id = :sensor AND resolved = 0 '
+        'ORDER BY timestamp DESC LIMIT 50',
+    ),
+    (
+        'latest calibrations (CalibrationScheduler)',
+        'SELECT id, corrected_value, applied_at FROM {calibration} WHERE sensor_id = :sensor '
+        'ORDER BY applied_at DESC LIMIT 5',
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the time-series indexes on a synthetic SQLite database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--readings',
+            type=int,
+            default=10_000_000,
+            help='Number of readings to generate (default: 10,000,000)',
+        )
+        parser.add_argument(
+            '--sensors',
+            type=int,
+            default=100,
+            help='Number of sensors to spread the readings over',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Executions per query (random sensor each time)',
+        )
+        parser.add_argument(
+            '--db-path',
+            type=str,
+            help='SQLite file to build the benchmark in; must not exist yet (default: a temporary file)',
+        )
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Replace an existing --db-path file',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the benchmark database instead of deleting it',
+        )
+
+    def handle(self, *args, **options):
+        path = options['db_path']
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='sensorguard_index_benchmark_', suffix='.sqlite3')
+            os.close(fd)
+            os.remove(path)  # Only the unique name is needed; sqlite3 creates the file
+        elif os.path.exists(path):
+            if not options['overwrite']:
+                raise CommandError(f'{path} already exists; pass --overwrite to replace it')
+            if not os.path.isfile(path):
+                raise CommandError(f'{path} is not a regular file')
+            with open(path, 'rb') as f:
+                if f.read(16) not in (b'SQLite format 3\x00', b''):
+                    raise CommandError(f'{path} is not an SQLite database')
+            os.remove(path)
+
+        self.tables = {
+            'sensor': Sensor._meta.db_table,
+            'reading': Reading._meta.db_table,
+            'anomaly': Anomaly._meta.db_table,
+            'calibration': Calibration._meta.db_table,
+        }
+        self.sensor_count = options['sensors']
+        self.start_time = datetime(2025, 1, 1)
+        # One reading per sensor per minute
+        self.span = timedelta(minutes=max(1, options['readings'] // self.sensor_count))
+
+        db = sqlite3.connect(path)
+        try:
+            self.stdout.write(f'Building {options["readings"]:,} readings in {path}...')
+            started = time.perf_counter()
+            self._create_schema(db)
+            self._populate(db, options['readings'])
+            self.stdout.write(f'Populated in {time.perf_counter() - started:.1f}s\n')
+
+            before = self._run_queries(db, 'BEFORE (foreign-key indexes only)', options['repeat'])
+
+            started = time.perf_counter()
+            self._create_time_series_indexes(db)
+            db.execute('ANALYZE')
+            self.stdout.write(f'\nCreated time-series indexes in {time.perf_counter() - started:.1f}s\n')
+
+            after = self._run_queries(db, 'AFTER (time-series indexes)', options['repeat'])
+
+            self.stdout.write('\n=== Summary (mean ms per query) ===')
+            for label, _ in QUERIES:
+                speedup = before[label] / after[label] if after[label] else float('inf')
+                self.stdout.write(
+                    self.style.SUCCESS(f'{label}: {before[label]:.3f} -> {after[label]:.3f} ({speedup:.1f}x)')
+                )
+        finally:
+            db.close()
+            if not options['keep'] and os.path.exists(path):
+                os.remove(path)
+
+    def _create_schema(self, db):
+        """Tables and foreign-key indexes as created by 0001_initial"""
+        t = self.tables
+        db.executescript(f'''
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE {t['sensor']} (
+                id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, type VARCHAR(20) NOT NULL,
+                value REAL NOT NULL, unit VARCHAR(20) NOT NULL, status VARCHAR(20) NOT NULL,
+                last_updated DATETIME NOT NULL, drift REAL NOT NULL);
+            CREATE TABLE {t['reading']} (
+                id INTEGER PRIMARY KEY, raw_value REAL NOT NULL, timestamp DATETIME NOT NULL,
+                sensor_id BIGINT NOT NULL);
+            CREATE TABLE {t['anomaly']} (
+                id INTEGER PRIMARY KEY, type VARCHAR(50) NOT NULL, value REAL NOT NULL,
+                expected REAL NOT NULL, deviation REAL NOT NULL, severity VARCHAR(20) NOT NULL,
+                resolved BOOL NOT NULL, timestamp DATETIME NOT NULL, sensor_id BIGINT NOT NULL);
+            CREATE TABLE {t['calibration']} (
+                id INTEGER PRIMARY KEY, method VARCHAR(50) NOT NULL, params TEXT NOT NULL,
+                corrected_value REAL NOT NULL, applied_at DATETIME NOT NULL, sensor_id BIGINT NOT NULL);
+            CREATE INDEX {t['reading']}_sensor_id ON {t['reading']} (sensor_id);
+            CREATE INDEX {t['anomaly']}_sensor_id ON {t['anomaly']} (sensor_id);
+            CREATE INDEX {t['calibration']}_sensor_id ON {t['calibration']} (sensor_id);
+        ''')
+
+    def _populate(self, db, readings_count):
+        t = self.tables
+        now = self.start_time.isoformat(sep=' ')
+        db.executemany(
+            f"INSERT INTO {t['sensor']} VALUES (?, ?, 'Temperature', 50.0, 'C', 'online', ?, 0.0)",
+            ((i, f'Sensor {i}', now) for i in range(1, self.sensor_count + 1))
+        )
+
+        per_sensor = readings_count // self.sensor_count
+        rng = random.Random(42)
+
+        def readings():
+            # Interleave sensors the way live ingestion does
+            for minute in range(per_sensor):
+                ts = (self.start_time + timedelta(minutes=minute)).isoformat(sep=' ')
+                for sensor_id in range(1, self.sensor_count + 1):
+                    yield (50.0 + rng.uniform(-5, 5), ts, sensor_id)
+
+        db.executemany(f"INSERT INTO {t['reading']} (raw_value, timestamp, sensor_id) VALUES (?, ?, ?)", readings())
+
+        def events(count):
+            for _ in range(count):
+                ts = self.start_time + timedelta(minutes=rng.randrange(per_sensor))
+                yield (rng.randint(1, self.sensor_count), ts.isoformat(sep=' '), rng.randint(0, 1))
+
+        db.executemany(
+            f"INSERT INTO {t['anomaly']} (type, value, expected, deviation, severity, resolved, timestamp, sensor_id) "
+            f"VALUES ('Drift', 60.0, 50.0, 20.0, 'High', ?3, ?2, ?1)",
+            events(max(1, readings_count // 50))
+        )
+        db.executemany(
+            f"INSERT INTO {t['calibration']} (method, params, corrected_value, applied_at, sensor_id) "
+            f"VALUES ('linear', '{{}}', 50.0, ?2, ?1)",
+            (event[:2] for event in events(max(1, readings_count // 200)))
+        )
+        db.commit()
+        db.execute('ANALYZE')
+
+    def _create_time_series_indexes(self, db):
+        """The indexes declared in the models' Meta (migration 0002)"""
+        for model in (Reading, Anomaly, Calibration):
+            for index in model._meta.indexes:
+                columns = ', '.join(model._meta.get_field(f).column for f in index.fields)
+                db.execute(f'CREATE INDEX {index.name} ON {model._meta.db_table} ({columns})')
+
+        name_column = Sensor._meta.get_field('name').column
+        db.execute(f'CREATE INDEX {Sensor._meta.db_table}_name ON {Sensor._meta.db_table} ({name_column})')
+        db.commit()
+
+    def _run_queries(self, db, title, repeat):
+        self.stdout.write(f'\n=== {title} ===')
+        rng = random.Random(7)
+        timings = {}
+
+        for label, template in QUERIES:
+            sql = template.format(**self.tables)
+            samples = []
+            for _ in range(repeat):
+                params = self._random_params(rng)
+                started = time.perf_counter()
+                db.execute(sql, params).fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+
+            plan = db.execute(f'EXPLAIN QUERY PLAN {sql}', self._random_params(rng)).fetchall()
+            timings[label] = sum(samples) / len(samples)
+
+            self.stdout.write(f'\n{label}: mean {timings[label]:.3f} ms, max {max(samples):.3f} ms')
+            for row in plan:
+                self.stdout.write(f'    {row[-1]}')
+
+        return timings
+
+    def _random_params(self, rng):
+        sensor = rng.randint(1, self.sensor_count)
+        start = self.start_time + self.span * rng.uniform(0, 0.9)
+        return {
+            'sensor': sensor,
+            'name': f'Sensor {sensor}',
+            'start': start.isoformat(sep=' '),
+            'end': (start + self.span * 0.01).isoformat(sep=' '),
+        }
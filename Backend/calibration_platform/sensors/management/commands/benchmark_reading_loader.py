@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from sensors.models import Sensor, Reading
+from sensors.services.reading_arrays import load_readings
+from datetime import timedelta
+import numpy as np
+import time
+import tracemalloc
+
+
+def measure(load):
+    """
+    Run load() twice: once timed, once under tracemalloc (which slows it
+    down too much to time). Returns (result, seconds, peak traced bytes).
+    """
+    started = time.perf_counter()
+    result = load()
+    seconds = time.perf_counter() - started
+    del result
+
+    tracemalloc.start()
+    result = load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+class Command(BaseCommand):
+    help = 'Compare loading readings as ORM instances with the columnar NumPy loader'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--readings',
+            type=int,
+            default=1000000,
+            help='Number of readings to load (default: 1000000)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the generated values',
+        )
+
+    def handle(self, *args, **options):
+        count = options['readings']
+        rng = np.random.default_rng(options['seed'])
+
+        # The readings are inserted for real and rolled back at the end
+        with transaction.atomic():
+            self.stdout.write(f'Inserting {count:,} readings...')
+            sensor = Sensor.objects.create(name='Loader Benchmark', type='Temperature', value=25.0, unit='C')
+            start = timezone.now() - timedelta(seconds=count)
+            values = rng.normal(25.0, 1.0, count)
+            for offset in range(0, count, 50000):
+                Reading.objects.bulk_create([
+                    Reading(sensor=sensor, raw_value=float(value), timestamp=start + timedelta(seconds=offset + i))
+                    for i, value in enumerate(values[offset:offset + 50000])
+                ])
+
+            def orm_instances():
+                readings = Reading.objects.filter(sensor=sensor).order_by('timestamp', 'id')
+                return (
+                    np.array([r.timestamp.replace(tzinfo=None) for r in readings], dtype='datetime64[us]'),
+                    np.array([r.raw_value for r in readings]),
+                )
+
+            (orm_timestamps, orm_values), orm_time, orm_peak = measure(orm_instances)
+            (timestamps, loaded_values), loader_time, loader_peak = measure(lambda: load_readings(sensor))
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f'ORM instances:   {orm_time:6.2f}s, peak {orm_peak / 2**20:8.1f} MiB'
+        )
+        self.stdout.write(
+            f'Columnar loader: {loader_time:6.2f}s, peak {loader_peak / 2**20:8.1f} MiB'
+        )
+        self.stdout.write(f'Speedup: {orm_time / loader_time:.1f}x, memory: {orm_peak / loader_peak:.1f}x less')
+
+        if np.array_equal(orm_values, loaded_values) and np.array_equal(orm_timestamps, timestamps):
+            self.stdout.write(self.style.SUCCESS('Arrays identical'))
+        else:
+            self.stdout.write(self.style.ERROR('Arrays differ'))
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from sensors.services.compiled_forest import CompiledIsolationForest, compiled_path
+import glob
+import joblib
+import numpy as np
+import os
+
+
+def probe_samples(compiled, samples, seed=42):
+    """
+    Inputs that exercise every split: each threshold itself (where the
+    float32 cast matters), random values across the split range of each
+    feature, and a row of NaNs.
+    """
+    rng = np.random.default_rng(seed)
+    internal = compiled.left != -1
+    columns = []
+    for feature in range(compiled.n_features):
+        thresholds = compiled.threshold[internal & (compiled.feature == feature)]
+        if len(thresholds) == 0:
+            thresholds = np.array([0.0])
+        low, high = thresholds.min(), thresholds.max()
+        margin = (high - low) * 0.1 + 1.0
+        column = np.concatenate((
+            rng.permutation(thresholds),
+            rng.uniform(low - margin, high + margin, samples),
+        ))
+        columns.append(column)
+
+    length = max(len(c) for c in columns)
+    X = np.column_stack([np.resize(c, length) for c in columns])
+    return np.vstack((X, np.full((1, compiled.n_features), np.nan)))
+
+
+class Command(BaseCommand):
+    help = 'Compile trained anomaly models to .npz arrays and verify them against sklearn'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Check existing compiled models instead of writing new ones',
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=10000,
+            help='Random probe rows per model, in addition to every split threshold',
+        )
+
+    def handle(self, *args, **options):
+        models_dir = os.path.join(settings.BASE_DIR, 'trained_models')
+        paths = sorted(glob.glob(os.path.join(models_dir, 'anomaly_model_*.joblib')))
+        if not paths:
+            self.stdout.write('No trained anomaly models found.')
+            return
+
+        failures = 0
+        for path in paths:
+            name = os.path.basename(path)
+            model = joblib.load(path)
+            target = compiled_path(path)
+
+            if options['verify_only']:
+                if not os.path.exists(target):
+                    self.stdout.write(self.style.ERROR(f'{name}: no compiled model'))
+                    failures += 1
+                    continue
+                compiled = CompiledIsolationForest.load(target)
+            else:
+                compiled = CompiledIsolationForest.from_sklearn(model)
+
+            X = probe_samples(compiled, options['samples'])
+            expected = model.decision_function(X)
+            actual = compiled.decision_function(X)
+            mismatches = int(np.sum(expected != actual))
+            if mismatches:
+                failures += 1
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: {mismatches} of {len(X)} scores differ '
+                    f'(max abs diff {np.max(np.abs(expected - actual)):.3e})'
+                ))
+                continue
+
+            if not options['verify_only']:
+                compiled.save(target)
+            self.stdout.write(self.style.SUCCESS(f'{name}: {len(X)} scores identical'))
+
+        if failures:
+            self.stdout.write(self.style.ERROR(f'{failures} model(s) failed verification'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(paths)} model(s) verified'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from sensors.services.fleet_forecast import FORECAST_POINTS, forecast_fleet
+
+
+class Command(BaseCommand):
+    help = 'Precompute drift forecasts for all sensors'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sensor-id',
+            type=int,
+            action='append',
+            help='Only forecast this sensor (can be repeated)',
+        )
+        parser.add_argument(
+            '--future-points',
+            type=int,
+            default=FORECAST_POINTS,
+            help=f'Number of future points to forecast (default: {FORECAST_POINTS})',
+        )
+
+    def handle(self, *args, **options):
+        result = forecast_fleet(options['sensor_id'], options['future_points'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast {result['sensors']} sensor(s): {result['model_based']} with trained models, "
+            f"{result['trend_based']} from linear trends"
+        ))
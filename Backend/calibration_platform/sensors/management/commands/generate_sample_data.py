@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from sensors.models import Sensor, Reading, Calibration, Anomaly
+from sensors.services.ingestion import persist_readings
 from django.utils import timezone
 import random
 from datetime import datetime, timedelta
@@ -58,6 +59,7 @@ class Command(BaseCommand):
         base_value = sensor.value or 50.0
         current_time = timezone.now() - timedelta(days=30)  # Start 30 days ago
         
+        readings = []
         readings_created = 0
         calibrations_created = 0
         
@@ -87,16 +89,19 @@ class Command(BaseCommand):
                 value += random.uniform(-20, 20)
             
             # Create reading
-            Reading.objects.create(
+            readings.append(Reading(
                 sensor=sensor,
                 raw_value=round(value, 2),
                 timestamp=current_time
-            )
+            ))
             readings_created += 1
             
             # Move time forward
             current_time += timedelta(minutes=random.randint(10, 60))
         
+        # Store all readings in one batch (this also keeps the rollups current)
+        persist_readings(readings, detect_drift=False)
+
         # Generate calibrations
         calibration_times = []
         for i in range(calibrations_count):
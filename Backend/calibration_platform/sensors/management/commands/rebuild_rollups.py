@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime, parse_date
+from django.utils import timezone
+from datetime import datetime
+from sensors.models import Sensor
+from sensors.services.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Backfill or repair the minute/hour/day reading rollups from raw readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sensor-id',
+            type=int,
+            help='Rebuild rollups for a specific sensor ID only',
+        )
+        parser.add_argument(
+            '--from',
+            dest='start',
+            type=str,
+            help='Start of the range to rebuild (ISO date or datetime, widened to whole days)',
+        )
+        parser.add_argument(
+            '--to',
+            dest='end',
+            type=str,
+            help='End of the range to rebuild (ISO date or datetime, widened to whole days)',
+        )
+
+    def handle(self, *args, **options):
+        sensor_ids = None
+        if options['sensor_id']:
+            if not Sensor.objects.filter(id=options['sensor_id']).exists():
+                raise CommandError(f'Sensor with ID {options["sensor_id"]} not found')
+            sensor_ids = [options['sensor_id']]
+
+        start = self._parse(options['start'])
+        end = self._parse(options['end'])
+
+        self.stdout.write('Rebuilding reading rollups...')
+        written = rebuild_rollups(sensor_ids=sensor_ids, start=start, end=end)
+        for resolution, count in written.items():
+            self.stdout.write(self.style.SUCCESS(f'{resolution}: {count} buckets'))
+
+    def _parse(self, value):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            if date is None:
+                raise CommandError(f'Invalid date: {value}')
+            parsed = datetime(date.year, date.month, date.day)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
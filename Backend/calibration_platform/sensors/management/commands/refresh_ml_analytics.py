@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from sensors.models import AnalyticsSnapshot
+from sensors.services.analytics_snapshot import SNAPSHOT_ID, is_stale, refresh_snapshot, snapshot_config
+import time
+
+
+class Command(BaseCommand):
+    help = 'Recompute the ML analytics snapshot served by /ml/analytics/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            help='Keep running, checking every this many seconds whether the snapshot is due',
+        )
+        parser.add_argument(
+            '--if-stale',
+            action='store_true',
+            help='Only recompute when the snapshot is older than MAX_AGE or enough new readings arrived',
+        )
+
+    def refresh(self, config, if_stale):
+        snapshot = AnalyticsSnapshot.objects.filter(id=SNAPSHOT_ID, computed_at__isnull=False).first()
+        if if_stale and snapshot is not None and not is_stale(snapshot, config):
+            return
+        snapshot = refresh_snapshot(config)
+        if snapshot is None:
+            self.stdout.write(self.style.WARNING('Another process is already refreshing the snapshot'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'ML analytics snapshot computed in {snapshot.computation_seconds:.2f}s'
+            ))
+
+    def handle(self, *args, **options):
+        config = snapshot_config()
+        interval = options['interval']
+        if not interval:
+            self.refresh(config, options['if_stale'])
+            return
+
+        # On a schedule, only when due
+        try:
+            while True:
+                self.refresh(config, True)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('\nSnapshot refresh stopped by user.'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.utils import timezone
+from sensors.models import Sensor, TrainedModel
+from sensors.services.model_registry import MODEL_TYPES, register_model
+from datetime import datetime
+import glob
+import os
+
+
+class Command(BaseCommand):
+    help = 'Register model artifacts in trained_models/ that the TrainedModel registry does not know about'
+
+    def handle(self, *args, **options):
+        models_dir = os.path.join(settings.BASE_DIR, 'trained_models')
+        sensor_ids = set(Sensor.objects.values_list('id', flat=True))
+        active = {
+            (trained.sensor_id, trained.model_type): trained
+            for trained in TrainedModel.objects.filter(is_active=True)
+        }
+
+        registered = 0
+        for path in sorted(glob.glob(os.path.join(models_dir, '*_model_*.joblib'))):
+            filename = os.path.basename(path)
+            # {model_type}_model_{sensor name}_{sensor id or "all"}.joblib
+            model_type = filename.split('_')[0]
+            owner = filename[:-len('.joblib')].rsplit('_', 1)[1]
+            sensor_id = None if owner == 'all' else int(owner) if owner.isdigit() else -1
+            if model_type not in MODEL_TYPES or (sensor_id is not None and sensor_id not in sensor_ids):
+                self.stdout.write(self.style.WARNING(f'{filename}: no matching sensor, skipped'))
+                continue
+
+            current = active.get((sensor_id, model_type))
+            if current is not None and current.path == filename:
+                continue
+
+            created_at = timezone.make_aware(datetime.fromtimestamp(os.path.getmtime(path)))
+            register_model(sensor_id, model_type, path, created_at=created_at)
+            registered += 1
+            self.stdout.write(self.style.SUCCESS(f'{filename}: registered'))
+
+        # Active entries whose artifact was deleted
+        missing = [
+            trained.id for trained in active.values()
+            if not os.path.exists(os.path.join(models_dir, trained.path))
+        ]
+        TrainedModel.objects.filter(id__in=missing).update(is_active=False)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{registered} model(s) registered, {len(missing)} missing model(s) deactivated'
+        ))
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from sensors.services.model_training import ModelTrainer
+from sensors.services.training_pool import TRAINING_TASKS
 from sensors.models import Sensor
+import time
 
 class Command(BaseCommand):
     help = 'Train AI/ML models for sensor data'
@@ -23,25 +25,64 @@ class Command(BaseCommand):
             action='store_true',
             help='Train models for all sensors',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Worker processes for --all-sensors (default: settings.MODEL_TRAINING_WORKERS, one per CPU)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Refit on the full history instead of updating existing models with new data',
+        )
+
+    def report_progress(self, done, total, sensor_id, model_type, result, seconds):
+        self.stdout.write(f'[{done}/{total}] sensor {sensor_id} {model_type}: {result["status"]} ({seconds:.1f}s)')
+
+    def write_timing_summary(self, results, elapsed):
+        """Total and slowest wall time per model type, next to the elapsed time"""
+        if not results:
+            return
+        self.stdout.write('\n=== Training Time ===')
+        busy = 0.0
+        for model_type in TRAINING_TASKS:
+            timings = [
+                (sensor_results[model_type]['training_seconds'], sensor_name)
+                for sensor_name, sensor_results in results.items()
+            ]
+            total = sum(seconds for seconds, _ in timings)
+            slowest, slowest_sensor = max(timings)
+            busy += total
+            self.stdout.write(
+                f'{model_type}: {total:.1f}s total, {total / len(timings):.2f}s avg, '
+                f'slowest {slowest:.1f}s ({slowest_sensor})'
+            )
+        self.stdout.write(f'Elapsed {elapsed:.1f}s for {busy:.1f}s of training')
 
     def handle(self, *args, **options):
         trainer = ModelTrainer()
+        incremental = not options['full']
         
         if options['all_sensors']:
             self.stdout.write('Training models for all sensors...')
-            results = trainer.train_all_models()
+            started = time.perf_counter()
+            results = trainer.train_all_models(
+                workers=options['workers'], progress=self.report_progress, incremental=incremental
+            )
             
             for sensor_name, sensor_results in results.items():
                 self.stdout.write(f'\n=== {sensor_name} ===')
                 for model_type, result in sensor_results.items():
                     if result['status'] == 'success':
                         self.stdout.write(
-                            self.style.SUCCESS(f'{model_type}: {result["message"]}')
+                            self.style.SUCCESS(f'{model_type}: {result["message"]} ({result["training_seconds"]:.1f}s)')
                         )
                     else:
                         self.stdout.write(
-                            self.style.ERROR(f'{model_type}: {result["message"]}')
+                            self.style.ERROR(f'{model_type}: {result["message"]} ({result["training_seconds"]:.1f}s)')
                         )
+            
+            self.write_timing_summary(results, time.perf_counter() - started)
         
         elif options['sensor_id']:
             sensor_id = options['sensor_id']
@@ -52,7 +93,7 @@ class Command(BaseCommand):
                 self.stdout.write(f'Training {model_type} model for sensor: {sensor.name}')
                 
                 if model_type == 'all':
-                    results = trainer.train_all_models(sensor_id)
+                    results = trainer.train_all_models(sensor_id, incremental=incremental)
                     for model_type, result in results[sensor.name].items():
                         if result['status'] == 'success':
                             self.stdout.write(
@@ -63,12 +104,7 @@ class Command(BaseCommand):
                                 self.style.ERROR(f'{model_type}: {result["message"]}')
                             )
                 else:
-                    if model_type == 'anomaly':
-                        result = trainer.train_anomaly_detection_model(sensor_id)
-                    elif model_type == 'drift':
-                        result = trainer.train_drift_prediction_model(sensor_id)
-                    elif model_type == 'calibration':
-                        result = trainer.train_calibration_model(sensor_id)
+                    result = trainer.train_model(sensor_id, model_type, incremental)
                     
                     if result['status'] == 'success':
                         self.stdout.write(
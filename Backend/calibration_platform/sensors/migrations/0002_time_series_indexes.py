@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sensor',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='anomaly',
+            index=models.Index(fields=['sensor', 'timestamp', 'resolved'], name='anomaly_sensor_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calibration',
+            index=models.Index(fields=['sensor', 'applied_at'], name='calibration_sensor_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reading',
+            index=models.Index(fields=['sensor', 'timestamp'], name='reading_sensor_ts_idx'),
+        ),
+    ]
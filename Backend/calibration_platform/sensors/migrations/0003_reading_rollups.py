@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0002_time_series_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('sum_value', models.FloatField(default=0.0)),
+                ('sum_squares', models.FloatField(default=0.0)),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='sensors.sensor')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sensor', 'resolution', 'bucket_start'), name='rollup_unique_bucket')],
+            },
+        ),
+    ]
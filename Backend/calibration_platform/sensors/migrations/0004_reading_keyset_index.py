@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0003_reading_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reading',
+            index=models.Index(fields=['timestamp', 'id'], name='reading_ts_id_idx'),
+        ),
+    ]
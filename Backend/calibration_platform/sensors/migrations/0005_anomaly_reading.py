@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0004_reading_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anomaly',
+            name='detector',
+            field=models.CharField(choices=[('rule', 'Rule'), ('ml', 'ML')], default='rule', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='anomaly',
+            name='reading',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to='sensors.reading'),
+        ),
+        migrations.AddConstraint(
+            model_name='anomaly',
+            constraint=models.UniqueConstraint(fields=('reading', 'detector'), name='anomaly_unique_reading_detector'),
+        ),
+    ]
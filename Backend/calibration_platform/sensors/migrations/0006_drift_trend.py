@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0005_anomaly_reading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriftTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.BigIntegerField(default=0)),
+                ('mean_value', models.FloatField(default=0.0)),
+                ('co_moment', models.FloatField(default=0.0)),
+                ('last_value', models.FloatField(null=True)),
+                ('last_timestamp', models.DateTimeField(null=True)),
+                ('last_reading_id', models.BigIntegerField(null=True)),
+                ('stale', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sensor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='drift_trend', to='sensors.sensor')),
+            ],
+        ),
+    ]
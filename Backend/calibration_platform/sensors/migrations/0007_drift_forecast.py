@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0006_drift_trend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriftForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('predictions', models.JSONField(default=list)),
+                ('model_used', models.CharField(max_length=50)),
+                ('confidence', models.FloatField(blank=True, null=True)),
+                ('generated_at', models.DateTimeField(db_index=True)),
+                ('sensor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='drift_forecast', to='sensors.sensor')),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0007_drift_forecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainedModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_type', models.CharField(choices=[('anomaly', 'Anomaly'), ('drift', 'Drift'), ('calibration', 'Calibration')], max_length=20)),
+                ('version', models.PositiveIntegerField()),
+                ('path', models.CharField(max_length=500)),
+                ('size_bytes', models.BigIntegerField()),
+                ('training_samples', models.IntegerField(blank=True, null=True)),
+                ('metrics', models.JSONField(default=dict)),
+                ('data_watermark', models.BigIntegerField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sensor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='trained_models', to='sensors.sensor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['is_active', 'created_at'], name='trainedmodel_active_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sensor', 'model_type', 'version'), name='trainedmodel_unique_version'), models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('sensor', 'model_type'), name='trainedmodel_one_active')],
+            },
+        ),
+    ]
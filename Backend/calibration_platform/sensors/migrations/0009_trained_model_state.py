@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0008_trained_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainedmodel',
+            name='training_state',
+            field=models.JSONField(default=dict),
+        ),
+    ]
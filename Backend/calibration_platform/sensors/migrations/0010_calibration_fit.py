@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0009_trained_model_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalibrationFit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.BigIntegerField(default=0)),
+                ('mean_x', models.FloatField(default=0.0)),
+                ('mean_y', models.FloatField(default=0.0)),
+                ('sxx', models.FloatField(default=0.0)),
+                ('sxy', models.FloatField(default=0.0)),
+                ('last_calibration_id', models.BigIntegerField(null=True)),
+                ('stale', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sensor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='calibration_fit', to='sensors.sensor')),
+            ],
+        ),
+    ]
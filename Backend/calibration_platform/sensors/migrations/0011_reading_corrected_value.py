@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0010_calibration_fit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reading',
+            name='corrected_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
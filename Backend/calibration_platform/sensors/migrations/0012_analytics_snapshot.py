@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:13
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensors', '0011_reading_corrected_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statistics', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('computed_at', models.DateTimeField(null=True)),
+                ('computation_seconds', models.FloatField(default=0.0)),
+                ('reading_watermark', models.BigIntegerField(null=True)),
+                ('refresh_started_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
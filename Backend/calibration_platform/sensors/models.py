@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 
@@ -18,7 +19,7 @@ class Sensor(models.Model):
         ('offline', 'Offline'),
     ]
 
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     type = models.CharField(max_length=20, choices=SENSOR_TYPES)
     value = models.FloatField(default=0.0)
     unit = models.CharField(max_length=20)
@@ -35,12 +36,150 @@ class Sensor(models.Model):
 class Reading(models.Model):
     sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='readings')
     raw_value = models.FloatField()
+    # Calibrated value, when stored with the reading instead of as a Calibration
+    corrected_value = models.FloatField(null=True, blank=True)
     timestamp = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sensor', 'timestamp'], name='reading_sensor_ts_idx'),
+            models.Index(fields=['timestamp', 'id'], name='reading_ts_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.sensor.name} - {self.raw_value} at {self.timestamp}"
 
 
+# ---------- READING ROLLUP MODEL ----------
+class ReadingRollup(models.Model):
+    """Per-sensor aggregates of readings over fixed time buckets"""
+    RESOLUTIONS = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='rollups')
+    resolution = models.CharField(max_length=10, choices=RESOLUTIONS)
+    bucket_start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    sum_value = models.FloatField(default=0.0)
+    sum_squares = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'resolution', 'bucket_start'], name='rollup_unique_bucket'),
+        ]
+
+    @property
+    def mean(self):
+        return self.sum_value / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.sensor.name} {self.resolution} rollup at {self.bucket_start}"
+
+
+# ---------- DRIFT TREND MODEL ----------
+class DriftTrend(models.Model):
+    """
+    Running least-squares state of a sensor's readings against their index
+    in timestamp order, so the linear trend never needs the full history.
+    """
+    sensor = models.OneToOneField(Sensor, on_delete=models.CASCADE, related_name='drift_trend')
+    count = models.BigIntegerField(default=0)
+    mean_value = models.FloatField(default=0.0)
+    # Sum of (index - mean index) * (value - mean value)
+    co_moment = models.FloatField(default=0.0)
+    last_value = models.FloatField(null=True)
+    # Newest reading folded in; anything after it is caught up on read
+    last_timestamp = models.DateTimeField(null=True)
+    last_reading_id = models.BigIntegerField(null=True)
+    # Set when a reading arrived out of order and shifted the indexes
+    stale = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.sensor.name} drift trend ({self.count} readings)"
+
+
+# ---------- DRIFT FORECAST MODEL ----------
+class DriftForecast(models.Model):
+    """Latest precomputed drift forecast of a sensor, written by the fleet forecasting job"""
+    sensor = models.OneToOneField(Sensor, on_delete=models.CASCADE, related_name='drift_forecast')
+    predictions = models.JSONField(default=list)  # drift in percent per future point
+    model_used = models.CharField(max_length=50)
+    confidence = models.FloatField(null=True, blank=True)
+    generated_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.sensor.name} drift forecast at {self.generated_at}"
+
+
+# ---------- TRAINED MODEL REGISTRY ----------
+class TrainedModel(models.Model):
+    """
+    One trained model artifact, written when training completes. The
+    newest version of a sensor's model type is the active one.
+    """
+    MODEL_TYPES = [
+        ('anomaly', 'Anomaly'),
+        ('drift', 'Drift'),
+        ('calibration', 'Calibration'),
+    ]
+
+    # Null for the fleet-wide anomaly model
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, null=True, blank=True, related_name='trained_models')
+    model_type = models.CharField(max_length=20, choices=MODEL_TYPES)
+    version = models.PositiveIntegerField()
+    path = models.CharField(max_length=500)  # Relative to trained_models/
+    size_bytes = models.BigIntegerField()
+    training_samples = models.IntegerField(null=True, blank=True)
+    metrics = models.JSONField(default=dict)
+    # Newest reading (or calibration, for calibration models) trained on
+    data_watermark = models.BigIntegerField(null=True, blank=True)
+    # What incremental training needs to extend the model with newer data
+    training_state = models.JSONField(default=dict)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'created_at'], name='trainedmodel_active_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'model_type', 'version'], name='trainedmodel_unique_version'),
+            models.UniqueConstraint(
+                fields=['sensor', 'model_type'],
+                condition=models.Q(is_active=True),
+                name='trainedmodel_one_active',
+            ),
+        ]
+
+    def __str__(self):
+        owner = self.sensor.name if self.sensor_id else 'all sensors'
+        return f"{owner} {self.model_type} model v{self.version}"
+
+
+# ---------- ANALYTICS SNAPSHOT MODEL ----------
+class AnalyticsSnapshot(models.Model):
+    """
+    Last computed ML analytics statistics (a single row). Requests are
+    served from it while a newer one is computed in the background.
+    """
+    statistics = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    computed_at = models.DateTimeField(null=True)
+    computation_seconds = models.FloatField(default=0.0)
+    # Newest reading when computed, to tell how much data arrived since
+    reading_watermark = models.BigIntegerField(null=True)
+    # Set while a process recomputes it, so concurrent refreshes coalesce
+    refresh_started_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"ML analytics snapshot at {self.computed_at}"
+
+
 # ---------- CALIBRATION MODEL ----------
 class Calibration(models.Model):
     CALIBRATION_METHODS = [
@@ -55,10 +194,38 @@ class Calibration(models.Model):
     corrected_value = models.FloatField()
     applied_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sensor', 'applied_at'], name='calibration_sensor_ts_idx'),
+        ]
+
     def __str__(self):
         return f"{self.sensor.name} calibration ({self.method})"
 
 
+# ---------- CALIBRATION FIT MODEL ----------
+class CalibrationFit(models.Model):
+    """
+    Running least-squares state of a sensor's adaptive calibration, updated
+    as calibrations are saved, so applying it never reads the calibrations.
+    """
+    sensor = models.OneToOneField(Sensor, on_delete=models.CASCADE, related_name='calibration_fit')
+    count = models.BigIntegerField(default=0)
+    mean_x = models.FloatField(default=0.0)
+    mean_y = models.FloatField(default=0.0)
+    # Sums of (x - mean x)^2 and (x - mean x) * (y - mean y)
+    sxx = models.FloatField(default=0.0)
+    sxy = models.FloatField(default=0.0)
+    # Newest calibration folded in
+    last_calibration_id = models.BigIntegerField(null=True)
+    # Set when a calibration was changed or deleted; rebuilt on next read
+    stale = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.sensor.name} calibration fit ({self.count} calibrations)"
+
+
 # ---------- ANOMALY MODEL ----------
 class Anomaly(models.Model):
     ANOMALY_TYPES = [
@@ -76,7 +243,15 @@ class Anomaly(models.Model):
         ('Critical', 'Critical'),
     ]
 
+    DETECTOR_CHOICES = [
+        ('rule', 'Rule'),
+        ('ml', 'ML'),
+    ]
+
     sensor = models.ForeignKey("Sensor", on_delete=models.CASCADE, related_name="anomalies")
+    # Reading that triggered the anomaly; null for manually reported ones
+    reading = models.ForeignKey("Reading", on_delete=models.CASCADE, null=True, blank=True, related_name="anomalies")
+    detector = models.CharField(max_length=10, choices=DETECTOR_CHOICES, default='rule')
     type = models.CharField(max_length=50, choices=ANOMALY_TYPES)
     value = models.FloatField()
     expected = models.FloatField()
@@ -85,6 +260,15 @@ class Anomaly(models.Model):
     resolved = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sensor', 'timestamp', 'resolved'], name='anomaly_sensor_ts_idx'),
+        ]
+        constraints = [
+            # One anomaly per reading and detector, so re-scoring upserts
+            models.UniqueConstraint(fields=['reading', 'detector'], name='anomaly_unique_reading_detector'),
+        ]
+
     def __str__(self):
         return f"{self.sensor.name} - {self.type} ({self.severity})"
 
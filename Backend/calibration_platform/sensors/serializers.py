@@ -66,6 +66,7 @@ class AnomalySerializer(serializers.ModelSerializer):
     class Meta:
         model = Anomaly
         fields = "__all__"
+        read_only_fields = ["reading", "detector"]
 
 
 # ---------- REPORT SERIALIZER ----------
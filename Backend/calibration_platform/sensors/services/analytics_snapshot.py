@@ -0,0 +1,154 @@
+"""
+Stale-while-revalidate serving of the ML analytics statistics. Requests
+read the persisted AnalyticsSnapshot; once it is older than MAX_AGE or
+MIN_NEW_READINGS readings arrived after it, one background thread
+recomputes it while requests keep getting the previous one. Concurrent
+refreshes, in any process, coalesce on the row's refresh_started_at claim.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Q
+from django.utils import timezone
+from sensors.models import AnalyticsSnapshot, Reading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_SETTINGS = {
+    'MAX_AGE': 300,             # seconds before a snapshot is refreshed
+    'MIN_NEW_READINGS': 1000,   # ... or new readings that trigger one sooner
+    'REFRESH_TIMEOUT': 600,     # seconds after which a refresh claim is presumed dead
+    'RETRY_AFTER': 5,           # seconds clients wait while the first snapshot is computed
+}
+
+SNAPSHOT_ID = 1
+
+class SnapshotPending(Exception):
+    """No snapshot yet, and another process is computing the first one"""
+
+    def __init__(self, retry_after):
+        super().__init__("ML analytics are being computed, retry shortly")
+        self.retry_after = retry_after
+
+
+# Serializes first-time computation and background refresh starts within a process
+_compute_lock = threading.Lock()
+_refresh_thread = None
+
+
+def snapshot_config():
+    return {**DEFAULT_SNAPSHOT_SETTINGS, **getattr(settings, 'ML_ANALYTICS_SNAPSHOT', {})}
+
+
+def _newest_reading_id():
+    return Reading.objects.aggregate(newest=Max('id'))['newest']
+
+
+def _claim_refresh(config):
+    """Mark the snapshot as being refreshed. False if another refresh holds it."""
+    now = timezone.now()
+    expired = now - timedelta(seconds=config['REFRESH_TIMEOUT'])
+    return AnalyticsSnapshot.objects.filter(
+        Q(refresh_started_at__isnull=True) | Q(refresh_started_at__lt=expired),
+        id=SNAPSHOT_ID,
+    ).update(refresh_started_at=now) == 1
+
+
+def _compute():
+    # Imported here: ml_analytics pulls in the training stack
+    from .ml_analytics import MLAnalyticsService
+
+    watermark = _newest_reading_id()
+    started = time.perf_counter()
+    statistics = MLAnalyticsService().compute_ml_statistics()
+    return {
+        'statistics': statistics,
+        'computed_at': timezone.now(),
+        'computation_seconds': time.perf_counter() - started,
+        'reading_watermark': watermark,
+        'refresh_started_at': None,
+    }
+
+
+def refresh_snapshot(config=None):
+    """
+    Recompute the snapshot now unless another refresh is already running.
+    Returns the new snapshot, or None when the refresh was coalesced.
+    """
+    config = config or snapshot_config()
+    AnalyticsSnapshot.objects.get_or_create(id=SNAPSHOT_ID)
+    if not _claim_refresh(config):
+        return None
+    try:
+        fields = _compute()
+    except Exception:
+        AnalyticsSnapshot.objects.filter(id=SNAPSHOT_ID).update(refresh_started_at=None)
+        raise
+    AnalyticsSnapshot.objects.filter(id=SNAPSHOT_ID).update(**fields)
+    return AnalyticsSnapshot.objects.get(id=SNAPSHOT_ID)
+
+
+def _refresh_in_background(config):
+    try:
+        refresh_snapshot(config)
+    except Exception:
+        logger.exception("ML analytics snapshot refresh failed")
+    finally:
+        # Thread-local connection, not closed by any request cycle
+        connection.close()
+
+
+def _refresh_running(snapshot, config):
+    started = snapshot.refresh_started_at
+    return started is not None and (timezone.now() - started).total_seconds() < config['REFRESH_TIMEOUT']
+
+
+def _start_background_refresh(config):
+    global _refresh_thread
+    with _compute_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_thread = threading.Thread(
+            target=_refresh_in_background, args=(config,), name='ml-analytics-refresh', daemon=True
+        )
+        _refresh_thread.start()
+
+
+def is_stale(snapshot, config):
+    age = (timezone.now() - snapshot.computed_at).total_seconds()
+    if age >= config['MAX_AGE']:
+        return True
+    newest = _newest_reading_id()
+    return newest is not None and newest - (snapshot.reading_watermark or 0) >= config['MIN_NEW_READINGS']
+
+
+def snapshot_statistics():
+    """
+    ML statistics from the last snapshot, with its computed_at, age in
+    seconds and whether a newer one is being computed. Only the very first
+    request waits for a computation; while another process runs it,
+    SnapshotPending is raised.
+    """
+    config = snapshot_config()
+    snapshot = AnalyticsSnapshot.objects.filter(id=SNAPSHOT_ID, computed_at__isnull=False).first()
+    refreshing = False
+    if snapshot is None:
+        with _compute_lock:
+            snapshot = AnalyticsSnapshot.objects.filter(id=SNAPSHOT_ID, computed_at__isnull=False).first()
+            if snapshot is None:
+                snapshot = refresh_snapshot(config)
+        if snapshot is None:
+            raise SnapshotPending(config['RETRY_AFTER'])
+    elif not _refresh_running(snapshot, config) and is_stale(snapshot, config):
+        _start_background_refresh(config)
+        refreshing = True
+
+    return {
+        **snapshot.statistics,
+        "computed_at": snapshot.computed_at,
+        "age_seconds": round((timezone.now() - snapshot.computed_at).total_seconds(), 3),
+        "refreshing": refreshing or _refresh_running(snapshot, config),
+    }
@@ -1,17 +1,27 @@
 from sensors.models import Reading, Anomaly, Sensor
 
-def detect_anomaly(reading):
-    sensor = reading.sensor
-    anomaly_type = None
+# Number of most recent readings the anomaly rules look at
+RECENT_WINDOW = 10
+
+
+def recent_values(sensor):
+    """Raw values of the sensor's newest readings, newest first"""
+    return list(
+        Reading.objects.filter(sensor=sensor)
+        .order_by('-timestamp', '-id')
+        .values_list('raw_value', flat=True)[:RECENT_WINDOW]
+    )
+
 
-    # Get baseline and recent readings for analysis
-    baseline = sensor.value or 0
+def classify_reading(value, baseline, recent_values):
+    """
+    Apply the anomaly rules to a reading value. recent_values are the
+    sensor's newest stored readings, newest first, including this one.
+    Returns (anomaly_type, deviation, severity) or None.
+    """
+    anomaly_type = None
     tolerance = abs(baseline * 0.2) if baseline != 0 else 10
-    
-    # Get recent readings for pattern analysis
-    recent_readings = Reading.objects.filter(sensor=sensor).order_by('-timestamp')[:10]
-    recent_values = [r.raw_value for r in recent_readings]
-    
+
     # 1. Drift detection - gradual change over time
     if len(recent_values) >= 5:
         # Check if there's a consistent trend
@@ -21,12 +31,12 @@ def detect_anomaly(reading):
     
     # 2. Spike detection - sudden large change
     if not anomaly_type:
-        prev_reading = recent_readings[1] if len(recent_readings) > 1 else None
-        if prev_reading and abs(reading.raw_value - prev_reading.raw_value) > baseline * 0.3:  # 30% change
+        prev_value = recent_values[1] if len(recent_values) > 1 else None
+        if prev_value is not None and abs(value - prev_value) > baseline * 0.3:  # 30% change
             anomaly_type = 'Spike'
     
     # 3. Dropout detection - value drops significantly
-    if not anomaly_type and reading.raw_value < baseline * 0.3:
+    if not anomaly_type and value < baseline * 0.3:
         anomaly_type = 'Dropout'
     
     # 4. Noise detection - high frequency variations
@@ -39,40 +49,58 @@ def detect_anomaly(reading):
     # 5. Calibration Error - systematic offset
     if not anomaly_type:
         # Check if reading is consistently offset from expected
-        offset = abs(reading.raw_value - baseline)
+        offset = abs(value - baseline)
         if offset > baseline * 0.15 and offset < baseline * 0.5:  # 15-50% offset
             anomaly_type = 'Calibration Error'
     
     # 6. Fallback to out of range
-    if not anomaly_type and (reading.raw_value < (baseline - tolerance) or reading.raw_value > (baseline + tolerance)):
+    if not anomaly_type and (value < (baseline - tolerance) or value > (baseline + tolerance)):
         anomaly_type = 'Drift'  # Default to Drift for out of range
 
-    if anomaly_type:
-        # Calculate deviation percentage
-        deviation = ((reading.raw_value - baseline) / baseline * 100) if baseline != 0 else 0
-        
-        # Determine severity based on deviation
-        if abs(deviation) > 50:
-            severity = "Critical"
-        elif abs(deviation) > 20:
-            severity = "High"
-        elif abs(deviation) > 10:
-            severity = "Medium"
-        else:
-            severity = "Low"
-        
-        Anomaly.objects.create(
-            sensor=sensor,
-            type=anomaly_type,
-            value=reading.raw_value,
-            expected=baseline,
-            deviation=deviation,
-            severity=severity,
-            resolved=False
-        )
-        return anomaly_type
+    if not anomaly_type:
+        return None
+
+    # Calculate deviation percentage
+    deviation = ((value - baseline) / baseline * 100) if baseline != 0 else 0
+
+    # Determine severity based on deviation
+    if abs(deviation) > 50:
+        severity = "Critical"
+    elif abs(deviation) > 20:
+        severity = "High"
+    elif abs(deviation) > 10:
+        severity = "Medium"
+    else:
+        severity = "Low"
+    return anomaly_type, deviation, severity
+
 
-    return None
+def record_anomaly(reading, result):
+    """Store the Anomaly for a classify_reading result"""
+    anomaly_type, deviation, severity = result
+    return Anomaly.objects.create(
+        sensor=reading.sensor,
+        type=anomaly_type,
+        value=reading.raw_value,
+        expected=reading.sensor.value or 0,
+        deviation=deviation,
+        severity=severity,
+        resolved=False
+    )
+
+
+def detect_anomaly(reading):
+    """
+    Classify a stored reading against the sensor's newest readings (one
+    query per call) and record an Anomaly if a rule fires.
+    See services/streaming_anomaly.py for the in-memory variant.
+    """
+    baseline = reading.sensor.value or 0
+    result = classify_reading(reading.raw_value, baseline, recent_values(reading.sensor))
+    if result is None:
+        return None
+    record_anomaly(reading, result)
+    return result[0]
 
 import random
 
@@ -1,46 +1,157 @@
+import threading
+import time
 import numpy as np
+from django.db import transaction
 from sklearn.ensemble import IsolationForest
 from sensors.models import Reading, Sensor, Anomaly
+from .live_updates import publish_anomalies
+from .reading_arrays import load_readings, reading_arrays
 
-def ml_anomaly_detection(sensor_id):
-    sensor = Sensor.objects.get(id=sensor_id)
-    readings = Reading.objects.filter(sensor=sensor).order_by('timestamp')
-    values = np.array([r.raw_value for r in readings]).reshape(-1, 1)
-    
-    if len(values) < 5:
-        return []  # Not enough data
+# Seconds a fitted model is reused before it is refit on recent history
+REFIT_INTERVAL = 3600
+
+# Newest readings a model is fit on. IsolationForest subsamples 256 points
+# per tree anyway, so older history adds cost without changing the model.
+TRAINING_WINDOW = 10000
+
+MIN_TRAINING_READINGS = 5
+
+
+class _SensorModel:
+    def __init__(self, model, fitted_at):
+        self.model = model
+        self.fitted_at = fitted_at
+        # Highest reading id already scored; ids only grow, so late readings
+        # with old timestamps are still picked up
+        self.watermark = 0
+
+
+_models = {}
+# Each sensor's model is fit and scored under its own lock, so a slow fit
+# only holds up callers for that sensor; _models_lock guards the lock table
+_sensor_locks = {}
+_models_lock = threading.Lock()
 
+
+def _sensor_lock(sensor_id):
+    with _models_lock:
+        return _sensor_locks.setdefault(sensor_id, threading.Lock())
+
+
+def _fit(sensor):
+    _, values = load_readings(sensor, limit=TRAINING_WINDOW, descending=True)
+    if len(values) < MIN_TRAINING_READINGS:
+        return None
     clf = IsolationForest(contamination=0.1, random_state=42)
-    clf.fit(values)
-    predictions = clf.predict(values)  # -1 = anomaly, 1 = normal
+    clf.fit(values.reshape(-1, 1))
+    return clf
+
+
+def _get_model(sensor):
+    """Fitted model for the sensor, refit when older than REFIT_INTERVAL"""
+    state = _models.get(sensor.id)
+    if state is None or time.monotonic() - state.fitted_at > REFIT_INTERVAL:
+        model = _fit(sensor)
+        if model is None:
+            return None
+        if state is None:
+            state = _SensorModel(model, time.monotonic())
+            _models[sensor.id] = state
+            # First run in this process: score the readings the model was
+            # fit on, as the full refit used to. The upsert keeps it idempotent.
+            first = (
+                Reading.objects.filter(sensor=sensor)
+                .order_by('-timestamp', '-id')
+                .values_list('id', flat=True)[TRAINING_WINDOW - 1:TRAINING_WINDOW]
+            )
+            state.watermark = first[0] - 1 if first else 0
+        else:
+            state.model = model
+            state.fitted_at = time.monotonic()
+    return state
+
 
+def _classify(value, expected):
+    deviation = ((value - expected) / expected * 100) if expected != 0 else 0
+    severity = "High" if abs(deviation) > 15 else "Medium"
+
+    # Determine anomaly type based on pattern
+    anomaly_type = "Drift"  # Default
+    if abs(deviation) > 50:
+        anomaly_type = "Spike"
+    elif value < expected * 0.3:
+        anomaly_type = "Dropout"
+    elif abs(deviation) > 20 and abs(deviation) < 50:
+        anomaly_type = "Noise"
+    elif abs(deviation) > 10 and abs(deviation) < 20:
+        anomaly_type = "Calibration Error"
+    return anomaly_type, deviation, severity
+
+
+def _score(sensor, model, values, ids):
+    """Unsaved ML anomalies for the readings the model flags as outliers"""
+    predictions = model.predict(values.reshape(-1, 1))  # -1 = anomaly, 1 = normal
+
+    expected = sensor.value or 0
     anomalies = []
-    for i, r in enumerate(readings):
-        if predictions[i] == -1:
-            # Calculate deviation from expected value
-            expected = sensor.value or 0
-            deviation = ((r.raw_value - expected) / expected * 100) if expected != 0 else 0
-            severity = "High" if abs(deviation) > 15 else "Medium"
-            
-            # Determine anomaly type based on pattern
-            anomaly_type = "Drift"  # Default
-            if abs(deviation) > 50:
-                anomaly_type = "Spike"
-            elif r.raw_value < expected * 0.3:
-                anomaly_type = "Dropout"
-            elif abs(deviation) > 20 and abs(deviation) < 50:
-                anomaly_type = "Noise"
-            elif abs(deviation) > 10 and abs(deviation) < 20:
-                anomaly_type = "Calibration Error"
-            
-            anomaly = Anomaly.objects.create(
-                sensor=sensor,
-                type=anomaly_type,
-                value=r.raw_value,
-                expected=expected,
-                deviation=deviation,
-                severity=severity,
-                resolved=False
+    for index in np.flatnonzero(predictions == -1):
+        value = float(values[index])
+        anomaly_type, deviation, severity = _classify(value, expected)
+        anomalies.append(Anomaly(
+            sensor=sensor,
+            reading_id=int(ids[index]),
+            detector='ml',
+            type=anomaly_type,
+            value=value,
+            expected=expected,
+            deviation=deviation,
+            severity=severity,
+            resolved=False
+        ))
+    return anomalies
+
+
+def _advance(state, watermark):
+    state.watermark = max(state.watermark, watermark)
+
+
+def ml_anomaly_detection(sensor_id):
+    """
+    Score the sensor's readings stored since the last call with its cached
+    IsolationForest and upsert one ML anomaly per outlier reading.
+    Returns the anomalies written by this call.
+    """
+    sensor = Sensor.objects.get(id=sensor_id)
+
+    with _sensor_lock(sensor.id):
+        state = _get_model(sensor)
+        if state is None:
+            return []  # Not enough data
+
+        _, values, ids = reading_arrays(
+            Reading.objects.filter(sensor=sensor, id__gt=state.watermark).order_by('id'),
+            with_ids=True,
+        )
+        if not len(ids):
+            return []
+
+        # The watermark only moves past these readings once their anomalies
+        # are committed, so a failed predict or write leaves them to be
+        # scored again by the next call. Holding the lock until then keeps
+        # concurrent callers from scoring them twice.
+        watermark = int(ids[-1])
+        anomalies = _score(sensor, state.model, values, ids)
+        if not anomalies:
+            _advance(state, watermark)
+            return []
+
+        with transaction.atomic():
+            Anomaly.objects.bulk_create(
+                anomalies,
+                update_conflicts=True,
+                unique_fields=['reading', 'detector'],
+                update_fields=['type', 'value', 'expected', 'deviation', 'severity'],
             )
-            anomalies.append(anomaly)
+            transaction.on_commit(lambda: _advance(state, watermark))
+            transaction.on_commit(lambda: publish_anomalies(anomalies))
     return anomalies
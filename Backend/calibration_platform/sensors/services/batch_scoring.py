@@ -0,0 +1,245 @@
+import numpy as np
+from datetime import timezone as dt_timezone
+from django.utils import timezone
+from rest_framework import serializers
+from sensors.models import Sensor, Reading
+from .enhanced_ml_services import EnhancedMLServices
+
+MAX_SCORING_BATCH_SIZE = 10000
+# Rows per UPDATE when storing corrected values on readings
+STORE_BATCH_SIZE = 500
+
+
+class AnomalyScoringItemSerializer(serializers.Serializer):
+    sensor_id = serializers.IntegerField(min_value=1)
+    reading_value = serializers.FloatField()
+    timestamp = serializers.DateTimeField(required=False)
+
+
+class CalibrationItemSerializer(serializers.Serializer):
+    sensor_id = serializers.IntegerField(min_value=1)
+    raw_value = serializers.FloatField()
+
+
+class CalibrationArraySerializer(serializers.Serializer):
+    sensor_id = serializers.IntegerField(min_value=1)
+    raw_values = serializers.ListField(
+        child=serializers.FloatField(), required=False, allow_empty=False
+    )
+    reading_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False
+    )
+    store = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if ('raw_values' in data) == ('reading_ids' in data):
+            raise serializers.ValidationError("Give either raw_values or reading_ids")
+        if data['store'] and 'reading_ids' not in data:
+            raise serializers.ValidationError("store needs reading_ids")
+        return data
+
+
+class DriftItemSerializer(serializers.Serializer):
+    sensor_id = serializers.IntegerField(min_value=1)
+    future_points = serializers.IntegerField(min_value=1, max_value=100, default=5)
+
+
+def _group_by_sensor(items, serializer_class):
+    """
+    Validate items and group the valid ones by sensor, resolving all sensors
+    with one query. Returns (results, sensors, groups) where results already
+    holds an error entry for every rejected item and groups maps a sensor id
+    to its [(index, data), ...] in input order.
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = serializer_class(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {"error": serializer.errors}
+
+    sensors = Sensor.objects.in_bulk({data["sensor_id"] for _, data in valid})
+    groups = {}
+    for index, data in valid:
+        if data["sensor_id"] not in sensors:
+            results[index] = {"error": "Sensor not found"}
+            continue
+        groups.setdefault(data["sensor_id"], []).append((index, data))
+    return results, sensors, groups
+
+
+def score_anomalies_batch(items):
+    """
+    Anomaly results for [{sensor_id, reading_value, timestamp?}, ...], in
+    input order. Each sensor's rows are scored with a single
+    decision_function call on its trained model.
+    """
+    ml_service = EnhancedMLServices()
+    results, sensors, groups = _group_by_sensor(items, AnomalyScoringItemSerializer)
+    now = timezone.now()
+
+    for sensor_id, group in groups.items():
+        sensor = sensors[sensor_id]
+        scores = None
+        try:
+            model = ml_service.load_anomaly_model(sensor)
+            if model is not None:
+                # Same [value, hour, day_of_week] features as training, in UTC
+                timestamps = [data.get("timestamp", now).astimezone(dt_timezone.utc) for _, data in group]
+                features = np.array([
+                    [data["reading_value"], ts.hour, ts.weekday()]
+                    for (_, data), ts in zip(group, timestamps)
+                ])
+                scores = model.decision_function(features)
+        except Exception:
+            # Fall back to basic detection for this sensor, as the single-reading path does
+            scores = None
+
+        if scores is None:
+            for index, data in group:
+                result = ml_service._basic_anomaly_detection(sensor, data["reading_value"])
+                result['is_anomaly'] = bool(result['is_anomaly'])
+                results[index] = result
+            continue
+
+        for (index, _), score in zip(group, scores):
+            results[index] = {
+                'is_anomaly': bool(score < 0),
+                'confidence': float(abs(score)),
+                'anomaly_score': float(score),
+                'model_used': 'trained_isolation_forest',
+            }
+    return results
+
+
+def calibrate_values(model, sensor, raw_values):
+    """
+    Calibrate an array of a sensor's raw values with one evaluation of its
+    trained model (or the basic correction without one). Returns
+    (corrected values, model_used).
+    """
+    if model is None:
+        # EnhancedMLServices._basic_sensor_calibration, elementwise
+        baseline = sensor.value or raw_values
+        return raw_values + (baseline - raw_values) * 0.1, 'basic_linear'
+    return model.predict(raw_values.reshape(-1, 1)), 'trained_linear_regression'
+
+
+def apply_calibrations_batch(items):
+    """
+    Calibrated values for [{sensor_id, raw_value}, ...], in input order, with
+    one predict call per sensor's trained model.
+    """
+    ml_service = EnhancedMLServices()
+    results, sensors, groups = _group_by_sensor(items, CalibrationItemSerializer)
+
+    for sensor_id, group in groups.items():
+        sensor = sensors[sensor_id]
+        raw_values = np.array([data["raw_value"] for _, data in group], dtype=np.float64)
+        corrected, model_used = calibrate_values(ml_service.load_model(sensor, 'calibration'), sensor, raw_values)
+        for (index, _), raw_value, value in zip(group, raw_values.tolist(), corrected.tolist()):
+            results[index] = {
+                'corrected_value': value,
+                'correction_factor': value - raw_value,
+                'model_used': model_used,
+            }
+    return results
+
+
+def corrected_series(sensor, raw_values, stored_values=None, ml_service=None):
+    """
+    Corrected values of an array of a sensor's raw values, from its current
+    calibration model in one evaluation. Values already stored on the
+    readings (stored_values, None where absent) are kept, since they are
+    the calibration that was in effect when each reading was taken.
+    """
+    if not len(raw_values):
+        return np.empty(0)
+    model = (ml_service or EnhancedMLServices()).load_model(sensor, 'calibration')
+    corrected, _ = calibrate_values(model, sensor, np.asarray(raw_values, dtype=np.float64))
+    if stored_values is not None:
+        stored = np.array(stored_values, dtype=np.float64)  # None -> NaN
+        corrected = np.where(np.isnan(stored), corrected, stored)
+    return corrected
+
+
+def corrected_values(sensors, sensor_ids, raw_values, stored_values=None):
+    """corrected_series over readings of any mix of sensors ({id: Sensor} in sensors), one evaluation per sensor"""
+    ml_service = EnhancedMLServices()
+    sensor_ids = np.asarray(sensor_ids, dtype=np.int64)
+    raw_values = np.asarray(raw_values, dtype=np.float64)
+    stored = np.array(stored_values, dtype=np.float64) if stored_values is not None else None
+    corrected = np.empty(len(raw_values))
+    for sensor_id in np.unique(sensor_ids):
+        rows = sensor_ids == sensor_id
+        corrected[rows] = corrected_series(
+            sensors[int(sensor_id)], raw_values[rows], stored[rows] if stored is not None else None, ml_service
+        )
+    return corrected
+
+
+def apply_calibration_arrays(items):
+    """
+    Corrected arrays for [{sensor_id, raw_values | reading_ids, store?}, ...],
+    in input order, each from a single model evaluation. With reading_ids the
+    raw values are those readings' (which must belong to the sensor), and
+    store writes the results to their corrected_value column.
+    """
+    ml_service = EnhancedMLServices()
+    results, sensors, groups = _group_by_sensor(items, CalibrationArraySerializer)
+
+    for sensor_id, group in groups.items():
+        sensor = sensors[sensor_id]
+        model = ml_service.load_model(sensor, 'calibration')
+        for index, data in group:
+            reading_ids = data.get("reading_ids")
+            if reading_ids is None:
+                raw_values = np.array(data["raw_values"], dtype=np.float64)
+            else:
+                stored = dict(
+                    Reading.objects.filter(sensor_id=sensor_id, id__in=reading_ids).values_list('id', 'raw_value')
+                )
+                missing = [reading_id for reading_id in reading_ids if reading_id not in stored]
+                if missing:
+                    results[index] = {"error": f"Readings not found for this sensor: {missing[:10]}"}
+                    continue
+                raw_values = np.array([stored[reading_id] for reading_id in reading_ids], dtype=np.float64)
+
+            corrected, model_used = calibrate_values(model, sensor, raw_values)
+            result = {
+                'sensor_id': sensor_id,
+                'corrected_values': corrected.tolist(),
+                'correction_factors': (corrected - raw_values).tolist(),
+                'model_used': model_used,
+            }
+            if data["store"]:
+                Reading.objects.bulk_update(
+                    [Reading(id=reading_id, corrected_value=value)
+                     for reading_id, value in zip(reading_ids, result['corrected_values'])],
+                    ['corrected_value'],
+                    batch_size=STORE_BATCH_SIZE,
+                )
+                result['stored'] = len(reading_ids)
+            results[index] = result
+    return results
+
+
+def predict_drifts_batch(items):
+    """
+    Drift forecasts for [{sensor_id, future_points?}, ...], in input order.
+    Forecast steps feed on each other, so they cannot be batched within a
+    sensor; repeated requests for the same sensor are computed once.
+    """
+    ml_service = EnhancedMLServices()
+    results, _, groups = _group_by_sensor(items, DriftItemSerializer)
+
+    for sensor_id, group in groups.items():
+        computed = {}
+        for index, data in group:
+            points = data["future_points"]
+            if points not in computed:
+                computed[points] = ml_service.predict_drift_with_trained_model(sensor_id, points)
+            results[index] = computed[points]
+    return results
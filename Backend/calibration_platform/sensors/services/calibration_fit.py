@@ -0,0 +1,108 @@
+"""
+Per-sensor adaptive calibration coefficients kept as running least-squares
+state (CalibrationFit). Saving a calibration folds it in; changing or
+deleting one flags the fit, which is rebuilt on its next read.
+"""
+import numpy as np
+from django.db import transaction
+from sensors.models import Calibration, CalibrationFit, Sensor
+
+REBUILD_CHUNK_SIZE = 50000
+
+
+def _pairs(values):
+    """
+    (x, y) of calibrations' corrected values: adaptive calibration has
+    always regressed the corrected values on themselves
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return values, values
+
+
+def fold(fit, x, y):
+    """Add (x, y) pairs to a fit's running state with the pairwise co-moment update"""
+    k = len(x)
+    if not k:
+        return
+    batch_mean_x, batch_mean_y = float(x.mean()), float(y.mean())
+    dx = x - batch_mean_x
+    batch_sxx = float(dx @ dx)
+    batch_sxy = float(dx @ (y - batch_mean_y))
+
+    n_a = fit.count
+    n = n_a + k
+    if n_a == 0:
+        fit.mean_x, fit.mean_y = batch_mean_x, batch_mean_y
+        fit.sxx, fit.sxy = batch_sxx, batch_sxy
+    else:
+        delta_x = batch_mean_x - fit.mean_x
+        delta_y = batch_mean_y - fit.mean_y
+        weight = n_a * k / n
+        fit.sxx += batch_sxx + delta_x * delta_x * weight
+        fit.sxy += batch_sxy + delta_x * delta_y * weight
+        fit.mean_x += delta_x * k / n
+        fit.mean_y += delta_y * k / n
+    fit.count = n
+
+
+def coefficients(fit):
+    """(slope, intercept); a flat fit through the mean when x never varied, as LinearRegression gives"""
+    slope = fit.sxy / fit.sxx if fit.sxx > 0 else 0.0
+    return slope, fit.mean_y - slope * fit.mean_x
+
+
+def _rebuild(fit):
+    fit.count = 0
+    fit.mean_x = fit.mean_y = fit.sxx = fit.sxy = 0.0
+    fit.last_calibration_id = None
+    fit.stale = False
+    rows = Calibration.objects.filter(sensor_id=fit.sensor_id).order_by('id').values_list('id', 'corrected_value')
+    chunk = []
+    for row in rows.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) >= REBUILD_CHUNK_SIZE:
+            _fold_rows(fit, chunk)
+            chunk = []
+    if chunk:
+        _fold_rows(fit, chunk)
+
+
+def _fold_rows(fit, rows):
+    fold(fit, *_pairs([value for _, value in rows]))
+    fit.last_calibration_id = rows[-1][0]
+
+
+def record_calibration(calibration):
+    """Fold a newly created calibration into its sensor's fit"""
+    with transaction.atomic():
+        fit, created = CalibrationFit.objects.select_for_update().get_or_create(sensor_id=calibration.sensor_id)
+        if created or fit.stale:
+            _rebuild(fit)
+        elif fit.last_calibration_id is None or calibration.id > fit.last_calibration_id:
+            _fold_rows(fit, [(calibration.id, calibration.corrected_value)])
+        else:
+            return  # Already folded in
+        fit.save()
+
+
+def invalidate(sensor_id):
+    """Flag a sensor's fit after one of its calibrations changed or was deleted"""
+    CalibrationFit.objects.filter(sensor_id=sensor_id).update(stale=True)
+
+
+def get_fit(sensor_id):
+    """Current fit of a sensor; built from its calibrations the first time or after invalidate"""
+    fit = CalibrationFit.objects.filter(sensor_id=sensor_id).first()
+    if fit is not None and not fit.stale:
+        return fit
+    with transaction.atomic():
+        if fit is None:
+            fit, created = CalibrationFit.objects.select_for_update().get_or_create(
+                sensor=Sensor.objects.get(id=sensor_id)
+            )
+        else:
+            fit, created = CalibrationFit.objects.select_for_update().get(id=fit.id), False
+        if created or fit.stale:
+            _rebuild(fit)
+            fit.save()
+    return fit
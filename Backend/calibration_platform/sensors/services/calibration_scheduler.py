@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
-from sensors.models import Sensor, Reading, Calibration
+from sensors.models import Sensor, Calibration
 import numpy as np
+from .reading_arrays import load_readings
 
 class CalibrationScheduler:
     def __init__(self):
@@ -120,12 +121,9 @@ class CalibrationScheduler:
             sensor = Sensor.objects.get(id=sensor_id)
             
             # Get recent readings
-            recent_readings = Reading.objects.filter(
-                sensor=sensor,
-                timestamp__gte=datetime.now() - timedelta(days=7)
-            ).order_by('-timestamp')
+            _, values = load_readings(sensor, start=datetime.now() - timedelta(days=7), descending=True)
             
-            if recent_readings.count() < 5:
+            if len(values) < 5:
                 return {
                     'status': 'insufficient_data',
                     'message': 'Not enough recent data for recommendations',
@@ -133,9 +131,8 @@ class CalibrationScheduler:
                 }
             
             # Calculate current drift
-            values = [r.raw_value for r in recent_readings]
             baseline = sensor.value or np.mean(values[:3])
-            current_drift = ((values[0] - baseline) / baseline * 100) if baseline != 0 else 0
+            current_drift = float((values[0] - baseline) / baseline * 100) if baseline != 0 else 0
             
             # Get drift trend
             if len(values) >= 3:
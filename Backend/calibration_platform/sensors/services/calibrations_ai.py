@@ -1,23 +1,19 @@
-import numpy as np
-from sklearn.linear_model import LinearRegression
-from sensors.models import Calibration, Reading, Sensor
+from .calibration_fit import coefficients, get_fit
 
 def adaptive_calibration(sensor_id, new_reading_value):
     """
     Applies adaptive calibration using past readings and corrections.
-    Returns corrected value.
+    Returns corrected value. The regression over past calibrations is kept
+    up to date as they are saved (see calibration_fit), so this is a
+    single row lookup and a multiply-add.
     """
-    sensor = Sensor.objects.get(id=sensor_id)
-    # Get past calibration data
-    past_calibrations = Calibration.objects.filter(sensor=sensor)
+    fit = get_fit(sensor_id)
     
-    if past_calibrations.count() < 2:
+    if fit.count < 2:
         # Not enough data, apply default correction
         corrected_value = new_reading_value  # or some basic linear offset
     else:
-        X = np.array([c.corrected_value for c in past_calibrations]).reshape(-1, 1)
-        y = np.array([c.corrected_value for c in past_calibrations])
-        model = LinearRegression().fit(X, y)
-        corrected_value = model.predict(np.array([[new_reading_value]]))[0]
+        slope, intercept = coefficients(fit)
+        corrected_value = slope * new_reading_value + intercept
     
     return corrected_value
@@ -0,0 +1,136 @@
+import os
+import numpy as np
+
+TREE_LEAF = -1
+
+
+def compiled_path(model_path):
+    """Location of the compiled copy of a joblib model artifact"""
+    root, _ = os.path.splitext(model_path)
+    return f'{root}.npz'
+
+
+class CompiledIsolationForest:
+    """
+    A fitted IsolationForest flattened into NumPy arrays. Scores samples by
+    walking all trees at once with array indexing, without sklearn's
+    validation and joblib dispatch, and reproduces decision_function bit for
+    bit: inputs are cast to float32 like sklearn's trees, each leaf holds the
+    same (decision path length + average path length) - 1.0 term, and the
+    per-tree terms are summed sequentially in tree order.
+    """
+
+    ARRAYS = (
+        'feature', 'threshold', 'left', 'right', 'missing_left',
+        'leaf_value', 'roots', 'max_depth', 'denominator', 'offset', 'n_features',
+    )
+
+    def __init__(self, feature, threshold, left, right, missing_left, leaf_value,
+                 roots, max_depth, denominator, offset, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.denominator = np.asarray(denominator, dtype=np.float64)
+        self.offset = float(offset)
+        self.n_features = int(n_features)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        from sklearn.ensemble._iforest import _average_path_length
+
+        features, thresholds, lefts, rights, missing = [], [], [], [], []
+        leaf_values, roots = [], []
+        max_depth = 0
+        start = 0
+        subsample_features = model._max_features != model.n_features_in_
+
+        for tree_idx, (estimator, tree_features) in enumerate(
+            zip(model.estimators_, model.estimators_features_)
+        ):
+            tree = estimator.tree_
+            is_leaf = tree.children_left == TREE_LEAF
+
+            feature = tree.feature.astype(np.int64)
+            if subsample_features:
+                # Trees were fit on a column subset; map back to input columns
+                feature = np.where(is_leaf, feature, np.asarray(tree_features)[np.maximum(feature, 0)])
+            features.append(np.where(is_leaf, 0, feature))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, TREE_LEAF, tree.children_left + start))
+            rights.append(np.where(is_leaf, TREE_LEAF, tree.children_right + start))
+            missing.append(tree.missing_go_to_left.astype(np.bool_))
+            leaf_values.append(
+                model._decision_path_lengths[tree_idx]
+                + model._average_path_length_per_tree[tree_idx]
+                - 1.0
+            )
+            roots.append(start)
+            max_depth = max(max_depth, tree.max_depth)
+            start += tree.node_count
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            missing_left=np.concatenate(missing),
+            leaf_value=np.concatenate(leaf_values),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            denominator=len(model.estimators_) * _average_path_length([model._max_samples]),
+            offset=model.offset_,
+            n_features=model.n_features_in_,
+        )
+
+    def save(self, path):
+        """Write the arrays to path (.npz), atomically"""
+        tmp_path = f'{path}.tmp{os.getpid()}.npz'
+        np.savez(tmp_path, **{name: np.asarray(getattr(self, name)) for name in self.ARRAYS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in cls.ARRAYS})
+
+    def _depths(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            internal = left != TREE_LEAF
+            if not internal.any():
+                break
+            values = X[rows, self.feature[nodes]]
+            go_left = np.where(np.isnan(values), self.missing_left[nodes], values <= self.threshold[nodes])
+            nodes = np.where(internal, np.where(go_left, left, self.right[nodes]), nodes)
+
+        # Sequential sum over trees, in tree order, like sklearn's accumulation
+        return np.cumsum(self.leaf_value[nodes], axis=1)[:, -1]
+
+    def score_samples(self, X):
+        depths = self._depths(X)
+        denominator = self.denominator
+        scores = 2 ** (
+            -np.divide(depths, denominator, out=np.ones_like(depths), where=denominator != 0)
+        )
+        return -scores
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X):
+        is_inlier = np.ones(len(np.atleast_2d(X)), dtype=int)
+        is_inlier[self.decision_function(X) < 0] = -1
+        return is_inlier
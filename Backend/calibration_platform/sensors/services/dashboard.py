@@ -0,0 +1,121 @@
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from sensors.models import Sensor, Reading
+from sensors.serializers import ReadingSerializer
+
+# The snapshot is stored as one cache entry per sensor plus an index of
+# the sensor ids it covers, so ingest only rewrites the sensors it touched
+SNAPSHOT_CACHE_KEY = 'dashboard:latest_readings'
+SENSOR_CACHE_KEY = 'dashboard:latest_readings:%s'
+DEFAULT_SNAPSHOT_TTL = 10  # seconds
+
+_snapshot_lock = threading.Lock()
+
+
+def _snapshot_ttl():
+    return getattr(settings, 'DASHBOARD_SNAPSHOT_TTL', DEFAULT_SNAPSHOT_TTL)
+
+
+def load_latest_readings():
+    """
+    Latest reading of every sensor in a single query. Each sensor row carries
+    its newest reading via correlated subqueries, which the (sensor, timestamp)
+    index answers with one seek per sensor.
+    Returns {sensor_id: serialized reading}.
+    """
+    latest = Reading.objects.filter(sensor=OuterRef('pk')).order_by('-timestamp', '-id')
+    sensors = Sensor.objects.annotate(
+        latest_id=Subquery(latest.values('id')[:1]),
+        latest_value=Subquery(latest.values('raw_value')[:1]),
+        latest_timestamp=Subquery(latest.values('timestamp')[:1]),
+    ).filter(latest_id__isnull=False)
+
+    snapshot = {}
+    for sensor in sensors:
+        reading = Reading(
+            id=sensor.latest_id,
+            sensor=sensor,
+            raw_value=sensor.latest_value,
+            timestamp=sensor.latest_timestamp,
+        )
+        snapshot[sensor.id] = _snapshot_entry(reading)
+    return snapshot
+
+
+def _aware(ts):
+    return timezone.make_aware(ts) if timezone.is_naive(ts) else ts
+
+
+def _snapshot_entry(reading):
+    return {
+        'timestamp': _aware(reading.timestamp),
+        'data': ReadingSerializer(reading).data,
+    }
+
+
+def _sensor_key(sensor_id):
+    return SENSOR_CACHE_KEY % sensor_id
+
+
+def get_latest_snapshot():
+    """
+    Latest-reading snapshot from the cache, rebuilt with one query when the
+    index or any sensor's entry is missing
+    """
+    sensor_ids = cache.get(SNAPSHOT_CACHE_KEY)
+    if sensor_ids is not None:
+        entries = cache.get_many([_sensor_key(sensor_id) for sensor_id in sensor_ids])
+        if len(entries) == len(sensor_ids):
+            return {sensor_id: entries[_sensor_key(sensor_id)] for sensor_id in sensor_ids}
+
+    snapshot = load_latest_readings()
+    ttl = _snapshot_ttl()
+    cache.set_many({_sensor_key(sensor_id): entry for sensor_id, entry in snapshot.items()}, ttl)
+    cache.set(SNAPSHOT_CACHE_KEY, list(snapshot), ttl)
+    return snapshot
+
+
+def dashboard_readings():
+    """Serialized latest reading per sensor, ordered by sensor id"""
+    snapshot = get_latest_snapshot()
+    return [snapshot[sensor_id]['data'] for sensor_id in sorted(snapshot)]
+
+
+def update_latest_snapshot(readings):
+    """
+    Fold newly stored readings (with sensors attached) into the cached
+    snapshot, touching only the entries of their sensors. A missing
+    snapshot is left for the next dashboard request to rebuild, as is one
+    that does not cover a sensor yet.
+    """
+    if not readings:
+        return
+
+    newest = {}
+    for reading in readings:
+        current = newest.get(reading.sensor_id)
+        if current is None or _aware(reading.timestamp) >= _aware(current.timestamp):
+            newest[reading.sensor_id] = reading
+
+    with _snapshot_lock:
+        sensor_ids = cache.get(SNAPSHOT_CACHE_KEY)
+        if sensor_ids is None:
+            return
+        if not newest.keys() <= set(sensor_ids):
+            invalidate_latest_snapshot()
+            return
+        entries = cache.get_many([_sensor_key(sensor_id) for sensor_id in newest])
+        updates = {}
+        for sensor_id, reading in newest.items():
+            entry = entries.get(_sensor_key(sensor_id))
+            if entry is None or _aware(reading.timestamp) >= entry['timestamp']:
+                updates[_sensor_key(sensor_id)] = _snapshot_entry(reading)
+        cache.set_many(updates, _snapshot_ttl())
+
+
+def invalidate_latest_snapshot():
+    """Drop the snapshot, e.g. after a sensor's name or baseline changed"""
+    cache.delete(SNAPSHOT_CACHE_KEY)
@@ -0,0 +1,169 @@
+import numpy as np
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from sensors.models import Reading
+from .reading_arrays import load_readings
+from .rollups import rollup_series, select_resolution
+
+# When reading from rollups, fetch this many times more buckets than the
+# requested number of points so the downsampler has shape to choose from
+ROLLUP_OVERSAMPLING = 4
+
+METHODS = ('lttb', 'minmax')
+
+# Most raw readings a downsample may load when no rollup resolution fits
+MAX_RAW_READINGS = 500000
+
+
+class WindowTooLarge(Exception):
+    pass
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets. Returns the indices of the n_out points
+    that best preserve the visual shape of (x, y). x must be sorted.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])[:max(n_out, 0)]
+
+    # Bucket boundaries for the n_out - 2 inner buckets; first and last
+    # points are always kept
+    every = (n - 2) / (n_out - 2)
+    bounds = (np.arange(n_out - 1) * every).astype(np.int64) + 1
+    bounds[-1] = n - 1
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        next_hi = bounds[i + 2] if i + 2 < len(bounds) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+
+        # Twice the area of the triangle (a, candidate, next bucket average)
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_buckets(x, y, n_out):
+    """
+    Split the x range into n_out // 2 equal-width buckets and keep the
+    minimum and maximum point of each, in time order. Preserves spikes that
+    averaging would flatten. x must be sorted.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+
+    bucket_count = max(1, n_out // 2)
+    span = x[-1] - x[0]
+    if span <= 0:
+        bucket_ids = np.zeros(n, dtype=np.int64)
+    else:
+        bucket_ids = np.minimum(((x - x[0]) / span * bucket_count).astype(np.int64), bucket_count - 1)
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket_ids)) + 1))
+    lengths = np.diff(np.append(starts, n))
+    positions = np.arange(n)
+
+    # Index of the first minimum / maximum within each bucket
+    bucket_min = np.repeat(np.minimum.reduceat(y, starts), lengths)
+    bucket_max = np.repeat(np.maximum.reduceat(y, starts), lengths)
+    argmin = np.minimum.reduceat(np.where(y == bucket_min, positions, n), starts)
+    argmax = np.minimum.reduceat(np.where(y == bucket_max, positions, n), starts)
+
+    return np.unique(np.concatenate((argmin, argmax)))
+
+
+def _to_epoch(timestamps):
+    return np.array([ts.timestamp() for ts in timestamps], dtype=np.float64)
+
+
+def _datetime64_to_epoch(timestamps):
+    return timestamps.astype('datetime64[us]').astype(np.int64) / 1e6
+
+
+def _to_datetime(timestamp):
+    value = timestamp.astype('datetime64[us]').item()
+    return value.replace(tzinfo=dt_timezone.utc) if settings.USE_TZ else value
+
+
+def downsample_history(sensor, start, end, max_points, method='lttb'):
+    """
+    Shape-preserving downsample of a sensor's readings in [start, end] to at
+    most max_points points. Reads from the rollups when a resolution with
+    enough buckets exists, otherwise from raw readings, of which at most
+    MAX_RAW_READINGS are loaded (WindowTooLarge beyond that).
+    Returns (points, source) where source is 'raw' or a rollup resolution.
+    """
+    points = []
+    resolution = None
+    if start and end:
+        resolution = select_resolution(start, end, max_points * ROLLUP_OVERSAMPLING)
+
+    if resolution:
+        buckets = list(
+            rollup_series(sensor.id, resolution, start, end)
+            .values_list('bucket_start', 'count', 'min_value', 'max_value', 'sum_value')
+        )
+        if buckets:
+            if method == 'minmax':
+                # Each bucket already carries its extremes
+                for (bucket, _, low, high, _) in _merge_buckets(buckets, max_points // 2):
+                    points.append({"timestamp": bucket, "value": low})
+                    if high != low:
+                        points.append({"timestamp": bucket, "value": high})
+            else:
+                x = _to_epoch([b[0] for b in buckets])
+                y = np.array([b[4] / b[1] for b in buckets], dtype=np.float64)
+                for i in lttb(x, y, max_points):
+                    points.append({"timestamp": buckets[i][0], "value": float(y[i])})
+            return points, resolution
+
+    readings = Reading.objects.filter(sensor=sensor)
+    if start:
+        readings = readings.filter(timestamp__gte=start)
+    if end:
+        readings = readings.filter(timestamp__lte=end)
+    if readings.count() > MAX_RAW_READINGS:
+        raise WindowTooLarge(
+            f"More than {MAX_RAW_READINGS} readings in the requested window; narrow from/to"
+        )
+
+    timestamps, y = load_readings(sensor, start=start, end=end)
+    if not len(y):
+        return points, 'raw'
+
+    x = _datetime64_to_epoch(timestamps)
+    indices = minmax_buckets(x, y, max_points) if method == 'minmax' else lttb(x, y, max_points)
+    for i in indices:
+        points.append({"timestamp": _to_datetime(timestamps[i]), "value": float(y[i])})
+    return points, 'raw'
+
+
+def _merge_buckets(buckets, n):
+    """Merge consecutive rollup buckets down to at most n groups"""
+    if n < 1 or len(buckets) <= n:
+        return buckets
+    merged = []
+    for group in np.array_split(np.arange(len(buckets)), n):
+        rows = [buckets[i] for i in group]
+        merged.append((
+            rows[0][0],
+            sum(r[1] for r in rows),
+            min(r[2] for r in rows),
+            max(r[3] for r in rows),
+            sum(r[4] for r in rows),
+        ))
+    return merged
@@ -1,19 +1,12 @@
-import numpy as np
-from sensors.models import Reading, Sensor
+from sensors.models import Sensor
+from .trend import forecast
 
 def simple_drift_prediction(sensor_id, future_points=5):
     sensor = Sensor.objects.get(id=sensor_id)
-    readings = Reading.objects.filter(sensor=sensor).order_by('timestamp')
-    values = np.array([r.raw_value for r in readings])
-    
-    if len(values) < 3:
+
+    # Linear trend over the sensor's readings, kept up to date on ingest
+    predictions = forecast(sensor, future_points)
+    if predictions is None:
         # Not enough data, return zeros
         return [0]*future_points
-
-    # Linear trend
-    x = np.arange(len(values))
-    coef = np.polyfit(x, values, 1)  # slope, intercept
-    slope = coef[0]
-    last_value = values[-1]
-    predictions = [last_value + slope*(i+1) for i in range(future_points)]
     return predictions
@@ -1,15 +1,38 @@
 import numpy as np
 import pandas as pd
-import joblib
 import os
 from django.conf import settings
-from sensors.models import Sensor, Reading, Anomaly, Calibration
+from sensors.models import Sensor, Anomaly, Calibration
 from .model_training import ModelTrainer
+from .model_cache import model_cache
+from .compiled_forest import CompiledIsolationForest, compiled_path
+from .trend import get_trend, slope as trend_slope
+from .retraining import RetrainingScheduler
+from .reading_arrays import hours_between, load_readings
 
 class EnhancedMLServices:
     def __init__(self):
         self.models_dir = os.path.join(settings.BASE_DIR, 'trained_models')
         self.trainer = ModelTrainer()
+
+    def model_path(self, sensor, model_type):
+        return os.path.join(self.models_dir, f'{model_type}_model_{sensor.name}_{sensor.id}.joblib')
+
+    def load_model(self, sensor, model_type):
+        """
+        Trained model of a sensor, or None. Cached across requests and
+        reloaded only when the artifact changes.
+        """
+        return model_cache.get((sensor.id, model_type), self.model_path(sensor, model_type))
+
+    def load_anomaly_model(self, sensor):
+        """Compiled anomaly model (same scores, no sklearn overhead), else the joblib one"""
+        model = model_cache.get(
+            (sensor.id, 'anomaly', 'compiled'),
+            compiled_path(self.model_path(sensor, 'anomaly')),
+            loader=CompiledIsolationForest.load,
+        )
+        return model if model is not None else self.load_model(sensor, 'anomaly')
     
     def predict_anomaly_with_trained_model(self, sensor_id, reading_value, timestamp=None):
         """
@@ -17,15 +40,11 @@ class EnhancedMLServices:
         """
         try:
             sensor = Sensor.objects.get(id=sensor_id)
-            model_path = os.path.join(self.models_dir, f'anomaly_model_{sensor.name}_{sensor_id}.joblib')
-            
-            if not os.path.exists(model_path):
+            model = self.load_anomaly_model(sensor)
+            if model is None:
                 # Fallback to basic detection if no trained model
                 return self._basic_anomaly_detection(sensor, reading_value)
             
-            # Load trained model
-            model = joblib.load(model_path)
-            
             # Prepare features
             if timestamp is None:
                 from django.utils import timezone
@@ -38,11 +57,10 @@ class EnhancedMLServices:
                 timestamp.weekday()
             ]])
             
-            # Predict
-            prediction = model.predict(features)[0]
+            # Predict (predict() is decision_function() < 0)
             anomaly_score = model.decision_function(features)[0]
             
-            is_anomaly = prediction == -1
+            is_anomaly = anomaly_score < 0
             confidence = abs(anomaly_score)
             
             return {
@@ -79,30 +97,22 @@ class EnhancedMLServices:
         """
         try:
             sensor = Sensor.objects.get(id=sensor_id)
-            model_path = os.path.join(self.models_dir, f'drift_model_{sensor.name}_{sensor_id}.joblib')
-            
-            if not os.path.exists(model_path):
+            model = self.load_model(sensor, 'drift')
+            if model is None:
                 # Fallback to simple prediction
                 return self._simple_drift_prediction(sensor_id, future_points)
             
-            # Load trained model
-            model = joblib.load(model_path)
-            
             # Get recent readings
-            recent_readings = Reading.objects.filter(sensor=sensor).order_by('-timestamp')[:10]
+            timestamps, values = load_readings(sensor, limit=10, descending=True)
             
-            if len(recent_readings) < 3:
+            if len(values) < 3:
                 return self._simple_drift_prediction(sensor_id, future_points)
             
-            # Prepare features for prediction
-            values = [r.raw_value for r in recent_readings]
-            timestamps = [r.timestamp for r in recent_readings]
-            
             # Calculate features
             baseline = sensor.value or np.mean(values[:3])
             rolling_mean = np.mean(values[:5])
             rolling_std = np.std(values[:5])
-            time_since_start = (timestamps[0] - timestamps[-1]).total_seconds() / 3600
+            time_since_start = hours_between(timestamps[:1], timestamps[-1])[0]
             
             # Predict future drift
             predictions = []
@@ -135,17 +145,14 @@ class EnhancedMLServices:
         Simple drift prediction as fallback
         """
         sensor = Sensor.objects.get(id=sensor_id)
-        readings = Reading.objects.filter(sensor=sensor).order_by('timestamp')
-        values = np.array([r.raw_value for r in readings])
+        trend = get_trend(sensor)
         
-        if len(values) < 3:
+        if trend.count < 3:
             return {'predictions': [0] * future_points, 'model_used': 'no_data'}
         
-        # Linear trend
-        x = np.arange(len(values))
-        coef = np.polyfit(x, values, 1)
-        slope = coef[0]
-        last_value = values[-1]
+        # Linear trend, from running sums kept up to date on ingest
+        slope = trend_slope(trend)
+        last_value = trend.last_value
         
         baseline = sensor.value or last_value
         predictions = []
@@ -166,15 +173,11 @@ class EnhancedMLServices:
         """
         try:
             sensor = Sensor.objects.get(id=sensor_id)
-            model_path = os.path.join(self.models_dir, f'calibration_model_{sensor.name}_{sensor_id}.joblib')
-            
-            if not os.path.exists(model_path):
+            model = self.load_model(sensor, 'calibration')
+            if model is None:
                 # Fallback to basic calibration
                 return self._basic_calibration(sensor_id, raw_value)
             
-            # Load trained model
-            model = joblib.load(model_path)
-            
             # Predict corrected value
             corrected_value = model.predict(np.array([[raw_value]]))[0]
             
@@ -191,7 +194,9 @@ class EnhancedMLServices:
         """
         Basic calibration as fallback
         """
-        sensor = Sensor.objects.get(id=sensor_id)
+        return self._basic_sensor_calibration(Sensor.objects.get(id=sensor_id), raw_value)
+
+    def _basic_sensor_calibration(self, sensor, raw_value):
         baseline = sensor.value or raw_value
         
         # Simple linear correction
@@ -206,38 +211,9 @@ class EnhancedMLServices:
     
     def auto_train_models_if_needed(self, sensor_id):
         """
-        Automatically retrain models if they're outdated or don't exist
+        Retrain the sensor's models that have enough new data since they
+        were trained, or do not exist yet
         """
         sensor = Sensor.objects.get(id=sensor_id)
-        
-        # Check if models exist and are recent
-        model_files = [
-            f'anomaly_model_{sensor.name}_{sensor_id}.joblib',
-            f'drift_model_{sensor.name}_{sensor_id}.joblib',
-            f'calibration_model_{sensor.name}_{sensor_id}.joblib'
-        ]
-        
-        needs_training = []
-        
-        for model_file in model_files:
-            model_path = os.path.join(self.models_dir, model_file)
-            
-            if not os.path.exists(model_path):
-                needs_training.append(model_file.split('_')[0])
-            else:
-                # Check if model is older than 7 days
-                from datetime import datetime, timedelta
-                model_age = datetime.now() - datetime.fromtimestamp(os.path.getctime(model_path))
-                if model_age > timedelta(days=7):
-                    needs_training.append(model_file.split('_')[0])
-        
-        # Train needed models
-        results = {}
-        if 'anomaly' in needs_training:
-            results['anomaly'] = self.trainer.train_anomaly_detection_model(sensor_id)
-        if 'drift' in needs_training:
-            results['drift'] = self.trainer.train_drift_prediction_model(sensor_id)
-        if 'calibration' in needs_training:
-            results['calibration'] = self.trainer.train_calibration_model(sensor_id)
-        
-        return results
+        jobs = RetrainingScheduler().run([sensor.id])
+        return {job['model_type']: job['result'] for job in jobs}
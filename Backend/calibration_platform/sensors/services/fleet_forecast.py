@@ -0,0 +1,195 @@
+import numpy as np
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from sklearn.linear_model import LinearRegression
+from sensors.models import Sensor, Reading, DriftTrend, DriftForecast
+from .enhanced_ml_services import EnhancedMLServices
+from .trend import get_trend
+
+FORECAST_POINTS = 5
+
+# Newest readings per sensor the drift models build their features from
+RECENT_READINGS = 10
+
+DEFAULT_FORECAST_MAX_AGE = 3600  # seconds
+
+
+def _recent_readings(sensor_ids):
+    """
+    Newest RECENT_READINGS readings of every sensor in one query, as
+    {sensor_id: (timestamps, values)} newest first.
+    """
+    rows = (
+        Reading.objects.filter(sensor_id__in=sensor_ids)
+        .annotate(rank=Window(
+            RowNumber(),
+            partition_by=F('sensor_id'),
+            order_by=[F('timestamp').desc(), F('id').desc()],
+        ))
+        .filter(rank__lte=RECENT_READINGS)
+        .order_by('sensor_id', 'rank')
+        .values_list('sensor_id', 'timestamp', 'raw_value')
+    )
+    recent = {}
+    for sensor_id, timestamp, value in rows:
+        timestamps, values = recent.setdefault(sensor_id, ([], []))
+        timestamps.append(timestamp)
+        values.append(value)
+    return recent
+
+
+def _model_forecasts(sensors, models, recent, future_points):
+    """
+    Run every sensor's drift model in one vectorized pass. Each step is the
+    model's linear predict for all sensors at once, fed back into the
+    features the same way predict_drift_with_trained_model does.
+    """
+    features = []
+    baselines = []
+    for sensor in sensors:
+        timestamps, values = recent[sensor.id]
+        baselines.append(sensor.value or np.mean(values[:3]))
+        features.append([
+            values[0],  # Current value
+            np.mean(values[:5]),
+            np.std(values[:5]),
+            (timestamps[0] - timestamps[-1]).total_seconds() / 3600,
+        ])
+    features = np.array(features, dtype=np.float64)
+    baselines = np.array(baselines, dtype=np.float64)
+    coefs = np.array([models[sensor.id].coef_ for sensor in sensors], dtype=np.float64)
+    intercepts = np.array([models[sensor.id].intercept_ for sensor in sensors], dtype=np.float64)
+
+    steps = []
+    for _ in range(future_points):
+        drift = np.einsum('ij,ij->i', features, coefs) + intercepts
+        steps.append(drift)
+        features[:, 0] += drift * baselines / 100  # Update value
+        features[:, 3] += 1  # Update time
+    predictions = np.column_stack(steps)
+
+    return {
+        sensor.id: {
+            'predictions': [float(p) for p in predictions[i]],
+            'model_used': 'trained_linear_regression',
+            'confidence': 0.8,
+        }
+        for i, sensor in enumerate(sensors)
+    }
+
+
+def _trend_forecasts(sensors, future_points):
+    """
+    Linear-trend forecasts for all sensors from their DriftTrend rows,
+    computed as arrays. Missing or stale trends are rebuilt first.
+    """
+    trends = DriftTrend.objects.in_bulk([s.id for s in sensors], field_name='sensor_id')
+    for sensor in sensors:
+        trend = trends.get(sensor.id)
+        if trend is None or trend.stale:
+            trends[sensor.id] = get_trend(sensor)
+
+    forecasts = {}
+    usable = [s for s in sensors if trends[s.id].count >= 3]
+    for sensor in sensors:
+        if trends[sensor.id].count < 3:
+            forecasts[sensor.id] = {'predictions': [0] * future_points, 'model_used': 'no_data'}
+    if not usable:
+        return forecasts
+
+    counts = np.array([trends[s.id].count for s in usable], dtype=np.float64)
+    co_moments = np.array([trends[s.id].co_moment for s in usable], dtype=np.float64)
+    last_values = np.array([trends[s.id].last_value for s in usable], dtype=np.float64)
+    baselines = np.array([s.value or trends[s.id].last_value for s in usable], dtype=np.float64)
+
+    slopes = co_moments / (counts * (counts * counts - 1) / 12)
+    steps = np.arange(1, future_points + 1, dtype=np.float64)
+    values = last_values[:, None] + slopes[:, None] * steps[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drift = np.where(baselines[:, None] != 0, (values - baselines[:, None]) / baselines[:, None] * 100, 0.0)
+
+    for i, sensor in enumerate(usable):
+        forecasts[sensor.id] = {
+            'predictions': [float(p) for p in drift[i]],
+            'model_used': 'simple_linear_trend',
+        }
+    return forecasts
+
+
+def forecast_fleet(sensor_ids=None, future_points=FORECAST_POINTS):
+    """
+    Compute drift forecasts for every sensor (or the given ones) and store
+    them in DriftForecast. Sensors with a trained drift model use it; the
+    rest fall back to their linear trend, as predict_drift_with_trained_model
+    does. Returns {'sensors', 'model_based', 'trend_based', 'generated_at'}.
+    """
+    sensors = Sensor.objects.all()
+    if sensor_ids:
+        sensors = sensors.filter(id__in=sensor_ids)
+    sensors = list(sensors)
+
+    ml_service = EnhancedMLServices()
+    recent = _recent_readings([s.id for s in sensors])
+    models = {}
+    for sensor in sensors:
+        model = ml_service.load_model(sensor, 'drift')
+        if isinstance(model, LinearRegression) and len(recent.get(sensor.id, ([], []))[1]) >= 3:
+            models[sensor.id] = model
+
+    model_sensors = [s for s in sensors if s.id in models]
+    trend_sensors = [s for s in sensors if s.id not in models]
+    forecasts = {}
+    if model_sensors:
+        forecasts.update(_model_forecasts(model_sensors, models, recent, future_points))
+    if trend_sensors:
+        forecasts.update(_trend_forecasts(trend_sensors, future_points))
+
+    generated_at = timezone.now()
+    DriftForecast.objects.bulk_create(
+        [
+            DriftForecast(
+                sensor_id=sensor_id,
+                predictions=forecast['predictions'],
+                model_used=forecast['model_used'],
+                confidence=forecast.get('confidence'),
+                generated_at=generated_at,
+            )
+            for sensor_id, forecast in forecasts.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['sensor'],
+        update_fields=['predictions', 'model_used', 'confidence', 'generated_at'],
+    )
+    return {
+        'sensors': len(forecasts),
+        'model_based': len(model_sensors),
+        'trend_based': len(trend_sensors),
+        'generated_at': generated_at,
+    }
+
+
+def stored_forecast(sensor_id, future_points=FORECAST_POINTS):
+    """
+    Precomputed forecast of a sensor in the shape of
+    predict_drift_with_trained_model's result, or None when there is none
+    recent enough or it has fewer points than asked for.
+    """
+    max_age = getattr(settings, 'DRIFT_FORECAST_MAX_AGE', DEFAULT_FORECAST_MAX_AGE)
+    forecast = DriftForecast.objects.filter(
+        sensor_id=sensor_id,
+        generated_at__gte=timezone.now() - timedelta(seconds=max_age),
+    ).first()
+    if forecast is None or len(forecast.predictions) < future_points:
+        return None
+
+    result = {
+        'predictions': forecast.predictions[:future_points],
+        'model_used': forecast.model_used,
+        'generated_at': forecast.generated_at,
+    }
+    if forecast.confidence is not None:
+        result['confidence'] = forecast.confidence
+    return result
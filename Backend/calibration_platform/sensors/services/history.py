@@ -0,0 +1,152 @@
+import base64
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from sensors.models import Sensor
+from .batch_scoring import corrected_values
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Fields a client can pick with ?fields=, mapped to the columns they are read from
+HISTORY_FIELDS = {
+    'id': 'id',
+    'sensor': 'sensor_id',
+    'sensor_name': 'sensor__name',
+    'type': 'sensor__type',
+    'unit': 'sensor__unit',
+    'raw_value': 'raw_value',
+    'timestamp': 'timestamp',
+    'lastUpdated': 'timestamp',
+}
+
+# Extra columns a client can ask for with ?include=
+HISTORY_INCLUDES = ('corrected',)
+
+
+class InvalidHistoryQuery(Exception):
+    pass
+
+
+def encode_cursor(timestamp, reading_id):
+    payload = json.dumps({'ts': timestamp.isoformat(), 'id': reading_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        timestamp = parse_datetime(payload['ts'])
+        reading_id = int(payload['id'])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidHistoryQuery("Invalid cursor")
+    if timestamp is None:
+        raise InvalidHistoryQuery("Invalid cursor")
+    return timestamp, reading_id
+
+
+def parse_fields(fields):
+    """Validate a comma separated ?fields= value. Returns None for all fields."""
+    if not fields:
+        return None
+    selected = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in selected if f not in HISTORY_FIELDS]
+    if unknown:
+        raise InvalidHistoryQuery(
+            f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(HISTORY_FIELDS)}"
+        )
+    return selected
+
+
+def parse_include(include):
+    """Validate a comma separated ?include= value. Returns the set of includes."""
+    selected = {i.strip() for i in (include or '').split(',') if i.strip()}
+    unknown = selected - set(HISTORY_INCLUDES)
+    if unknown:
+        raise InvalidHistoryQuery(
+            f"Unknown include(s): {', '.join(sorted(unknown))}. Allowed: {', '.join(HISTORY_INCLUDES)}"
+        )
+    return selected
+
+
+def parse_limit(limit):
+    if limit in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise InvalidHistoryQuery("limit must be an integer")
+    if limit < 1:
+        raise InvalidHistoryQuery("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def history_page(readings, limit, cursor=None, descending=False):
+    """
+    One keyset page of readings ordered by (timestamp, id).
+    Each page is an index range scan starting at the cursor, so its cost does
+    not depend on how deep into the history it is. Works on model and
+    values() querysets alike. Returns (page, next_cursor).
+    """
+    if descending:
+        readings = readings.order_by('-timestamp', '-id')
+    else:
+        readings = readings.order_by('timestamp', 'id')
+
+    if cursor:
+        timestamp, reading_id = decode_cursor(cursor)
+        # Written as a range on timestamp so the database can seek straight
+        # to the cursor position in the (timestamp, id) index
+        if descending:
+            after = Q(timestamp__lte=timestamp) & (Q(timestamp__lt=timestamp) | Q(id__lt=reading_id))
+        else:
+            after = Q(timestamp__gte=timestamp) & (Q(timestamp__gt=timestamp) | Q(id__gt=reading_id))
+        readings = readings.filter(after)
+
+    # Fetch one extra row to learn whether there is a next page
+    page = list(readings[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last['timestamp'], last['id'])
+        else:
+            next_cursor = encode_cursor(last.timestamp, last.id)
+    return page, next_cursor
+
+
+def history_page_values(readings, fields, limit, cursor=None, descending=False, include_corrected=False):
+    """
+    Like history_page, but only reads the selected columns and returns plain
+    dicts keyed by the requested field names. include_corrected adds the
+    raw_value and corrected_value columns.
+    """
+    columns = {HISTORY_FIELDS[f] for f in fields} | {'id', 'timestamp'}
+    if include_corrected:
+        columns |= {'sensor_id', 'raw_value', 'corrected_value'}
+    page, next_cursor = history_page(readings.values(*columns), limit, cursor, descending)
+    rows = [{f: row[HISTORY_FIELDS[f]] for f in fields} for row in page]
+    if include_corrected:
+        for row, values, corrected in zip(rows, page, page_corrected_values(page)):
+            row['raw_value'] = values['raw_value']
+            row['corrected_value'] = corrected
+    return rows, next_cursor
+
+
+def page_corrected_values(page):
+    """
+    Corrected values of a page of readings (instances, or dicts with
+    sensor_id, raw_value and corrected_value), computed per sensor in one
+    vectorized step
+    """
+    if not page:
+        return []
+    if isinstance(page[0], dict):
+        sensors = Sensor.objects.in_bulk({row['sensor_id'] for row in page})
+        columns = [(row['sensor_id'], row['raw_value'], row['corrected_value']) for row in page]
+    else:
+        sensors = {reading.sensor_id: reading.sensor for reading in page}
+        columns = [(reading.sensor_id, reading.raw_value, reading.corrected_value) for reading in page]
+    sensor_ids, raw_values, stored_values = zip(*columns)
+    return corrected_values(sensors, sensor_ids, raw_values, stored_values).tolist()
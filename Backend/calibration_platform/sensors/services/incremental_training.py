@@ -0,0 +1,125 @@
+"""
+Building blocks for updating trained models with new data only.
+
+Linear models keep centered sufficient statistics (count, means and
+co-moment matrices), which merge exactly across batches and refit without
+the old rows. Isolation forests are refreshed by fitting a few trees on
+recent data and dropping as many of the oldest ones.
+"""
+import numpy as np
+from sklearn.linear_model import LinearRegression
+
+# Fewest rows new trees are fit on. IsolationForest draws 256 samples per
+# tree, so fitting on fewer would change the forest's score normalization.
+MIN_FOREST_REFIT_SAMPLES = 256
+
+# Rows of the previously trained history, spread evenly over it, that a
+# refreshed forest's contamination threshold is recomputed on
+FOREST_OFFSET_SAMPLES = 4096
+
+
+def linear_stats(X, y):
+    """Sufficient statistics of a least-squares fit of y on X, as JSON-able lists"""
+    X = np.asarray(X, dtype=np.float64).reshape(len(y), -1)
+    y = np.asarray(y, dtype=np.float64)
+    mean_x = X.mean(axis=0)
+    mean_y = y.mean()
+    dx = X - mean_x
+    dy = y - mean_y
+    return {
+        'n': len(y),
+        'mean_x': mean_x.tolist(),
+        'mean_y': float(mean_y),
+        'sxx': (dx.T @ dx).tolist(),
+        'sxy': (dx.T @ dy).tolist(),
+        'syy': float(dy @ dy),
+    }
+
+
+def merge_linear_stats(a, b):
+    """Statistics of the union of two batches (pairwise co-moment update)"""
+    if not a['n']:
+        return b
+    if not b['n']:
+        return a
+    n_a, n_b = a['n'], b['n']
+    n = n_a + n_b
+    weight = n_a * n_b / n
+    delta_x = np.array(b['mean_x']) - np.array(a['mean_x'])
+    delta_y = b['mean_y'] - a['mean_y']
+    return {
+        'n': n,
+        'mean_x': (np.array(a['mean_x']) + delta_x * n_b / n).tolist(),
+        'mean_y': a['mean_y'] + delta_y * n_b / n,
+        'sxx': (np.array(a['sxx']) + np.array(b['sxx']) + np.outer(delta_x, delta_x) * weight).tolist(),
+        'sxy': (np.array(a['sxy']) + np.array(b['sxy']) + delta_x * delta_y * weight).tolist(),
+        'syy': a['syy'] + b['syy'] + delta_y * delta_y * weight,
+    }
+
+
+def fit_linear_stats(stats):
+    """
+    LinearRegression (with intercept) solved from statistics, and the
+    mean squared error of its fit on the rows they summarize
+    """
+    sxx = np.array(stats['sxx'])
+    sxy = np.array(stats['sxy'])
+    coef = np.linalg.lstsq(sxx, sxy, rcond=None)[0]
+
+    model = LinearRegression()
+    model.coef_ = coef
+    model.intercept_ = float(stats['mean_y'] - np.dot(stats['mean_x'], coef))
+    model.n_features_in_ = len(coef)
+    mse = max(stats['syy'] - float(coef @ sxy), 0.0) / stats['n']
+    return model, mse
+
+
+def merge_moments(count, mean, std, values):
+    """(count, mean, population std) after adding values to a summarized batch"""
+    values = np.asarray(values, dtype=np.float64)
+    k = len(values)
+    if not k:
+        return count, mean, std
+    n = count + k
+    delta = values.mean() - mean
+    m2 = std * std * count + values.var() * k + delta * delta * count * k / n
+    return n, mean + delta * k / n, float(np.sqrt(m2 / n))
+
+
+def weighted_quantile(values, weights, q):
+    """Smallest value whose cumulative weight reaches the q share of the total"""
+    order = np.argsort(values)
+    cumulative = np.cumsum(np.asarray(weights, dtype=np.float64)[order])
+    index = np.searchsorted(cumulative, q * cumulative[-1])
+    return float(np.asarray(values)[order][min(index, len(order) - 1)])
+
+
+def refresh_isolation_forest(model, X, replace, retained=None):
+    """
+    Fit replace new trees on X with warm_start, drop the replace oldest
+    trees and recompute the contamination threshold. retained, a sample of
+    the data the kept trees were fit on, is scored along with X, each side
+    weighted by its share of the trees, so the threshold still describes
+    the whole history instead of being re-based on the new rows alone.
+    """
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + replace)
+    model.fit(X)
+    model.estimators_ = model.estimators_[replace:]
+    model.estimators_features_ = model.estimators_features_[replace:]
+    model._average_path_length_per_tree = model._average_path_length_per_tree[replace:]
+    model._decision_path_lengths = model._decision_path_lengths[replace:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+    if model.contamination == 'auto':
+        return model
+
+    kept = model.n_estimators - replace
+    if retained is None or not len(retained) or kept <= 0:
+        model.offset_ = np.percentile(model.score_samples(X), 100.0 * model.contamination)
+        return model
+    scores = np.concatenate([model.score_samples(retained), model.score_samples(X)])
+    weights = np.concatenate([
+        np.full(len(retained), kept / len(retained)),
+        np.full(len(X), replace / len(X)),
+    ])
+    model.offset_ = weighted_quantile(scores, weights, model.contamination)
+    return model
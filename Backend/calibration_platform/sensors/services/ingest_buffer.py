@@ -0,0 +1,239 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from .ingestion import persist_readings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SETTINGS = {
+    'ENABLED': False,
+    'MAX_QUEUE_SIZE': 10000,    # readings held in memory before producers block
+    'BATCH_SIZE': 500,          # commit once this many readings are queued
+    'FLUSH_INTERVAL': 0.05,     # ... or once the oldest queued reading is this old (seconds)
+    'DURABILITY': 'commit',     # 'enqueue' acks once queued, 'commit' once written
+    'ENQUEUE_TIMEOUT': 5.0,     # seconds a producer waits for room in a full queue
+}
+
+
+class BufferFull(Exception):
+    pass
+
+
+class _PendingReading:
+    __slots__ = ('reading', 'detect_drift', 'done', 'error')
+
+    def __init__(self, reading, detect_drift):
+        self.reading = reading
+        self.detect_drift = detect_drift
+        self.done = threading.Event()
+        self.error = None
+
+
+class ReadingBuffer:
+    """
+    Write-behind buffer for readings. Producers enqueue unsaved Reading
+    objects; a single writer thread commits them in batches so SQLite takes
+    the write lock once per batch instead of once per reading.
+    """
+
+    def __init__(self, max_queue_size=10000, batch_size=500, flush_interval=0.05,
+                 durability='commit', enqueue_timeout=5.0):
+        if durability not in ('enqueue', 'commit'):
+            raise ValueError("durability must be 'enqueue' or 'commit'")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self.committed = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name='reading-buffer-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, reading, detect_drift=True, wait_for_commit=False):
+        """
+        Queue a reading for writing. In 'commit' mode, or with
+        wait_for_commit, this blocks until the batch containing it is
+        committed (and the reading has its id); in 'enqueue' mode it returns
+        as soon as the reading is queued.
+        """
+        if self._stopping:
+            raise BufferFull("Reading buffer is shutting down")
+        self.start()
+
+        pending = _PendingReading(reading, detect_drift)
+        try:
+            self._queue.put(pending, timeout=self.enqueue_timeout)
+        except queue.Full:
+            raise BufferFull("Reading buffer is full")
+
+        if self.durability == 'commit' or wait_for_commit:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+        return reading
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        marker = _PendingReading(None, False)
+        self._queue.put(marker)
+        marker.done.wait(timeout)
+
+    def stop(self, timeout=10.0):
+        """Flush outstanding readings and stop the writer thread"""
+        self._stopping = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'committed': self.committed,
+            'failed': self.failed,
+            'durability': self.durability,
+        }
+
+    def _run(self):
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    self._drain_remaining()
+                    return
+
+                batch = [first]
+                deadline = time.monotonic() + self.flush_interval
+                stop = False
+                while len(batch) < self.batch_size:
+                    # Producers in 'commit' mode are blocked until we write, so
+                    # waiting on an empty queue only adds latency. Readings that
+                    # arrive during this commit form the next batch.
+                    if self.durability == 'commit' and self._queue.empty():
+                        break
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+
+                self._write(batch)
+                if stop:
+                    self._drain_remaining()
+                    return
+        finally:
+            connection.close()
+
+    def _drain_remaining(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+        for start in range(0, len(batch), self.batch_size):
+            self._write(batch[start:start + self.batch_size])
+
+    def _write(self, batch):
+        pending = [p for p in batch if p.reading is not None]
+        try:
+            self._persist(pending)
+            self.committed += len(pending)
+        except Exception as e:
+            if len(pending) == 1:
+                self._fail(pending, e)
+                return
+            # Retry one by one, so that only the offending readings fail
+            logger.warning("Failed to write %d buffered readings, retrying one by one: %s", len(pending), e)
+            for p in pending:
+                if p.reading.pk is not None:
+                    self.committed += 1  # Its part of the batch was written
+                    continue
+                try:
+                    self._persist([p])
+                    self.committed += 1
+                except Exception as e:
+                    self._fail([p], e)
+        finally:
+            for p in batch:
+                p.done.set()
+
+    def _persist(self, pending):
+        with_drift = [p.reading for p in pending if p.detect_drift]
+        without_drift = [p.reading for p in pending if not p.detect_drift]
+        for readings, detect_drift in ((with_drift, True), (without_drift, False)):
+            if not readings:
+                continue
+            try:
+                persist_readings(readings, detect_drift=detect_drift)
+            except Exception:
+                # The insert was rolled back; forget any ids it handed out
+                for reading in readings:
+                    reading.pk = None
+                    reading._state.adding = True
+                raise
+
+    def _fail(self, pending, error):
+        logger.error("Failed to write %d buffered readings", len(pending), exc_info=error)
+        self.failed += len(pending)
+        for p in pending:
+            p.error = error
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_reading_buffer():
+    """Return the process-wide buffer, or None when buffering is disabled"""
+    global _buffer
+    config = {**DEFAULT_BUFFER_SETTINGS, **getattr(settings, 'READING_BUFFER', {})}
+    if not config['ENABLED']:
+        return None
+
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = ReadingBuffer(
+                max_queue_size=config['MAX_QUEUE_SIZE'],
+                batch_size=config['BATCH_SIZE'],
+                flush_interval=config['FLUSH_INTERVAL'],
+                durability=config['DURABILITY'],
+                enqueue_timeout=config['ENQUEUE_TIMEOUT'],
+            )
+            # Flush whatever is still queued when the process exits
+            atexit.register(_buffer.stop)
+    return _buffer
+
+
+def store_reading(reading, detect_drift=True, wait_for_commit=False):
+    """
+    Save a reading through the write-behind buffer when it is enabled,
+    otherwise write it immediately. 'enqueue' durability only suits callers
+    that just acknowledge the reading; callers that go on to use the stored
+    row (its id, queries that should see it) pass wait_for_commit.
+    """
+    buffer = get_reading_buffer()
+    if buffer is None:
+        persist_readings([reading], detect_drift=detect_drift)
+        return reading
+    return buffer.submit(reading, detect_drift=detect_drift, wait_for_commit=wait_for_commit)
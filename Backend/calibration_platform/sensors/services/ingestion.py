@@ -0,0 +1,133 @@
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from sensors.models import Sensor, Reading, Anomaly
+from .rollups import update_rollups
+from .trend import update_trends
+from .dashboard import update_latest_snapshot
+from .live_updates import publish_readings, publish_anomalies
+from .streaming_anomaly import detector as streaming_detector
+
+# Drift threshold (in percent of the sensor baseline) per sensor type
+DRIFT_THRESHOLDS = {
+    "Temperature": 3,
+    "Pressure": 2,    # example: smaller threshold
+    "Humidity": 2,    # example: smaller threshold
+    "Vibration": 5,
+    "Flow": 5,
+}
+DEFAULT_DRIFT_THRESHOLD = 3
+
+MAX_BATCH_SIZE = 10000
+
+
+class BatchReadingItemSerializer(serializers.Serializer):
+    """
+    Validates one element of a batch upload. The sensor is kept as a plain id
+    so that every sensor in the batch can be resolved with a single query.
+    """
+    sensor = serializers.IntegerField(min_value=1)
+    raw_value = serializers.FloatField()
+    timestamp = serializers.DateTimeField(required=False)
+
+
+def create_drift_anomalies(readings):
+    """
+    Vectorized drift-threshold check over a list of saved readings.
+    Each reading must have its sensor loaded. Returns unsaved Anomaly objects.
+    """
+    if not readings:
+        return []
+
+    actual = np.array([r.raw_value for r in readings], dtype=float)
+    ideal = np.array([r.sensor.value or 1 for r in readings], dtype=float)
+    threshold = np.array(
+        [DRIFT_THRESHOLDS.get(r.sensor.type, DEFAULT_DRIFT_THRESHOLD) for r in readings],
+        dtype=float
+    )
+
+    # Calculate drift as percentage
+    drift_percent = (actual - ideal) / ideal * 100
+    flagged = np.flatnonzero(np.abs(drift_percent) > threshold)
+
+    anomalies = []
+    for i in flagged:
+        reading = readings[i]
+        deviation = float(drift_percent[i])
+        anomalies.append(Anomaly(
+            sensor=reading.sensor,
+            reading=reading,
+            type="Drift",
+            value=reading.raw_value,
+            expected=float(ideal[i]),
+            deviation=deviation,
+            severity="High" if abs(deviation) <= 5 else "Critical",
+            resolved=False
+        ))
+    return anomalies
+
+
+def persist_readings(readings, detect_drift=True):
+    """
+    Bulk-insert readings (with their sensors already attached) and the drift
+    anomalies they trigger, and fold them into the rollups, drift trends and
+    the dashboard's latest-reading snapshot. Once committed, both are
+    published to live stream subscribers.
+    Returns (readings, anomalies).
+    """
+    anomalies = create_drift_anomalies(readings) if detect_drift else []
+    with transaction.atomic():
+        Reading.objects.bulk_create(readings)
+        if anomalies:
+            Anomaly.objects.bulk_create(anomalies)
+        update_rollups(readings)
+        update_trends(readings)
+        transaction.on_commit(lambda: _after_commit(readings, anomalies))
+    return readings, anomalies
+
+
+def _after_commit(readings, anomalies):
+    update_latest_snapshot(readings)
+    streaming_detector.observe(readings)
+    publish_readings(readings)
+    publish_anomalies(anomalies)
+
+
+def ingest_readings_batch(items):
+    """
+    Validate and store a batch of readings for any number of sensors.
+    Invalid items are reported individually and do not fail the batch.
+    Returns (readings, anomalies, errors).
+    """
+    errors = []
+    valid = []
+    for index, item in enumerate(items):
+        serializer = BatchReadingItemSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({"index": index, "errors": serializer.errors})
+
+    # Resolve every referenced sensor in one query
+    sensors = Sensor.objects.in_bulk({data["sensor"] for _, data in valid})
+
+    readings = []
+    now = timezone.now()
+    for index, data in valid:
+        sensor = sensors.get(data["sensor"])
+        if sensor is None:
+            errors.append({
+                "index": index,
+                "errors": {"sensor": [f'Invalid pk "{data["sensor"]}" - object does not exist.']}
+            })
+            continue
+        readings.append(Reading(
+            sensor=sensor,
+            raw_value=data["raw_value"],
+            timestamp=data.get("timestamp", now)
+        ))
+
+    errors.sort(key=lambda e: e["index"])
+    readings, anomalies = persist_readings(readings)
+    return readings, anomalies, errors
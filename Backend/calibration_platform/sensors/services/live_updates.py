@@ -0,0 +1,116 @@
+import asyncio
+import queue
+import threading
+
+# Events buffered per subscriber before it is considered too slow. A slow
+# subscriber gets a single 'resync' event instead of an unbounded backlog.
+MAX_PENDING_EVENTS = 1000
+
+RESYNC_EVENT = {'event': 'resync', 'data': {}}
+
+
+class Subscription:
+    """
+    One connected client. Events are delivered through a thread-safe queue,
+    or an asyncio queue bound to the client's event loop when subscribed
+    from async code.
+    """
+
+    def __init__(self, sensor_ids=None, loop=None, max_pending=MAX_PENDING_EVENTS):
+        self.sensor_ids = set(sensor_ids) if sensor_ids else None
+        self.loop = loop
+        self.max_pending = max_pending
+        if loop is None:
+            self._queue = queue.Queue()
+        else:
+            self._queue = asyncio.Queue()
+
+    def wants(self, sensor_id):
+        return self.sensor_ids is None or sensor_id in self.sensor_ids
+
+    def deliver(self, event):
+        if self.loop is None:
+            self._put(event)
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self._put, event)
+            except RuntimeError:
+                pass  # Loop already closed; the subscriber is going away
+
+    def _put(self, event):
+        if self._queue.qsize() >= self.max_pending:
+            # Drop the backlog; the client reloads the dashboard on 'resync'
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            event = RESYNC_EVENT
+        self._queue.put_nowait(event)
+
+    def get(self, timeout=None):
+        """Next event, or None after timeout (sync subscribers)"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout=None):
+        """Next event, or None after timeout (async subscribers)"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LiveUpdateHub:
+    """
+    In-process publish/subscribe hub. Ingestion publishes each change once;
+    the hub fans it out to the subscribers interested in that sensor, so the
+    cost follows the rate of change rather than viewers times poll rate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self, sensor_ids=None, loop=None):
+        subscription = Subscription(sensor_ids, loop)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def subscriber_count(self):
+        return len(self._subscriptions)
+
+    def publish(self, event_type, sensor_id, data):
+        with self._lock:
+            targets = [s for s in self._subscriptions if s.wants(sensor_id)]
+        event = {'event': event_type, 'data': data}
+        for subscription in targets:
+            subscription.deliver(event)
+
+
+hub = LiveUpdateHub()
+
+
+def publish_readings(readings):
+    """Publish newly stored readings (with sensors attached)"""
+    if not hub.has_subscribers():
+        return
+    from sensors.serializers import ReadingSerializer
+    for reading in readings:
+        hub.publish('reading', reading.sensor_id, ReadingSerializer(reading).data)
+
+
+def publish_anomalies(anomalies):
+    """Publish newly stored anomalies (with sensors attached)"""
+    if not hub.has_subscribers():
+        return
+    from sensors.serializers import AnomalySerializer
+    for anomaly in anomalies:
+        hub.publish('anomaly', anomaly.sensor_id, AnomalySerializer(anomaly).data)
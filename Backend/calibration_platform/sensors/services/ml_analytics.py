@@ -2,9 +2,14 @@ import os
 import json
 from datetime import datetime, timedelta
 from django.conf import settings
+from django.db.models import Avg, Case, Count, F, FloatField, Max, Q, Value, When
+from django.db.models.functions import Abs
+from django.utils import timezone
 from sensors.models import Sensor, Reading, Anomaly, Calibration
 from .model_training import ModelTrainer
 from .enhanced_ml_services import EnhancedMLServices
+from .model_registry import count_recent_models
+from .retraining import RetrainingScheduler
 
 class MLAnalyticsService:
     def __init__(self):
@@ -12,46 +17,65 @@ class MLAnalyticsService:
         self.trainer = ModelTrainer()
         self.ml_service = EnhancedMLServices()
     
+    def compute_ml_statistics(self):
+        """
+        Comprehensive ML statistics for the analytics dashboard, computed
+        from scratch. Errors propagate, so a failed computation never
+        replaces the AnalyticsSnapshot requests are served from (see
+        analytics_snapshot).
+        """
+        # Get model information
+        model_info = self.trainer.get_model_info()
+        
+        # Calculate statistics
+        total_models = len(model_info)
+        active_models = count_recent_models()
+        
+        # Get sensor and reading counts, one conditional aggregate per table
+        now = timezone.now()
+        total_sensors = Sensor.objects.count()
+        total_readings = Reading.objects.count()
+        anomaly_counts = Anomaly.objects.aggregate(
+            total=Count('id'),
+            recent=Count('id', filter=Q(timestamp__gte=now - timedelta(days=7))),
+            critical=Count('id', filter=Q(timestamp__gte=now - timedelta(days=7), severity='Critical')),
+            high=Count('id', filter=Q(timestamp__gte=now - timedelta(days=7), severity='High')),
+        )
+        calibration_counts = Calibration.objects.aggregate(
+            total=Count('id'),
+            recent=Count('id', filter=Q(applied_at__gte=now - timedelta(days=30))),
+            adaptive=Count('id', filter=Q(applied_at__gte=now - timedelta(days=30), method='adaptive')),
+        )
+        
+        # Calculate performance metrics
+        anomaly_detection_rate = self._calculate_anomaly_detection_rate(anomaly_counts)
+        drift_prediction_accuracy = self._calculate_drift_accuracy()
+        calibration_improvement = self._calculate_calibration_improvement(calibration_counts)
+        
+        # Get recent predictions
+        recent_predictions = self._get_recent_predictions()
+        
+        return {
+            "total_models": total_models,
+            "active_models": active_models,
+            "total_sensors": total_sensors,
+            "total_readings": total_readings,
+            "total_anomalies": anomaly_counts['total'],
+            "total_calibrations": calibration_counts['total'],
+            "anomaly_detection_rate": anomaly_detection_rate,
+            "drift_prediction_accuracy": drift_prediction_accuracy,
+            "calibration_improvement": calibration_improvement,
+            "recent_predictions": recent_predictions,
+            "model_info": model_info
+        }
+    
     def get_ml_statistics(self):
         """
-        Get comprehensive ML statistics for the analytics dashboard
+        Get comprehensive ML statistics for the analytics dashboard, or
+        zeros with the error when they cannot be computed
         """
         try:
-            # Get model information
-            model_info = self.trainer.get_model_info()
-            
-            # Calculate statistics
-            total_models = len(model_info)
-            active_models = self._count_active_models(model_info)
-            
-            # Get sensor and reading counts
-            total_sensors = Sensor.objects.count()
-            total_readings = Reading.objects.count()
-            total_anomalies = Anomaly.objects.count()
-            total_calibrations = Calibration.objects.count()
-            
-            # Calculate performance metrics
-            anomaly_detection_rate = self._calculate_anomaly_detection_rate()
-            drift_prediction_accuracy = self._calculate_drift_accuracy()
-            calibration_improvement = self._calculate_calibration_improvement()
-            
-            # Get recent predictions
-            recent_predictions = self._get_recent_predictions()
-            
-            return {
-                "total_models": total_models,
-                "active_models": active_models,
-                "total_sensors": total_sensors,
-                "total_readings": total_readings,
-                "total_anomalies": total_anomalies,
-                "total_calibrations": total_calibrations,
-                "anomaly_detection_rate": anomaly_detection_rate,
-                "drift_prediction_accuracy": drift_prediction_accuracy,
-                "calibration_improvement": calibration_improvement,
-                "recent_predictions": recent_predictions,
-                "model_info": model_info
-            }
-            
+            return self.compute_ml_statistics()
         except Exception as e:
             return {
                 "error": str(e),
@@ -68,116 +92,72 @@ class MLAnalyticsService:
                 "model_info": []
             }
     
-    def _count_active_models(self, model_info):
+    def _calculate_anomaly_detection_rate(self, counts):
         """
-        Count models that are less than 7 days old
+        Calculate anomaly detection success rate from the last 7 days'
+        anomaly counts (recent, critical, high)
         """
-        active_count = 0
-        cutoff_date = datetime.now() - timedelta(days=7)
-        
-        for model in model_info:
-            if isinstance(model['created_at'], str):
-                model_date = datetime.fromisoformat(model['created_at'].replace('Z', '+00:00'))
-            else:
-                model_date = model['created_at']
-            
-            if model_date > cutoff_date:
-                active_count += 1
+        if counts['recent'] == 0:
+            return 95.0  # Default high rate if no recent anomalies
         
-        return active_count
-    
-    def _calculate_anomaly_detection_rate(self):
-        """
-        Calculate anomaly detection success rate
-        """
-        try:
-            # Get recent anomalies
-            recent_anomalies = Anomaly.objects.filter(
-                timestamp__gte=datetime.now() - timedelta(days=7)
-            )
-            
-            if recent_anomalies.count() == 0:
-                return 95.0  # Default high rate if no recent anomalies
-            
-            # Calculate based on severity distribution
-            total_anomalies = recent_anomalies.count()
-            critical_anomalies = recent_anomalies.filter(severity='Critical').count()
-            high_anomalies = recent_anomalies.filter(severity='High').count()
-            
-            # Higher rate if we're detecting critical issues
-            detection_rate = 85.0 + (critical_anomalies * 2) + (high_anomalies * 1)
-            return min(detection_rate, 100.0)
-            
-        except Exception:
-            return 90.0  # Default rate
+        # Higher rate if we're detecting critical issues
+        detection_rate = 85.0 + (counts['critical'] * 2) + (counts['high'] * 1)
+        return min(detection_rate, 100.0)
     
     def _calculate_drift_accuracy(self):
         """
-        Calculate drift prediction accuracy
+        Calculate drift prediction accuracy: the mean absolute drift of each
+        sensor's readings over the last 7 days from its baseline, averaged
+        over sensors. Both passes are single aggregates grouped by sensor.
         """
         try:
-            # Get sensors with recent readings
-            sensors_with_readings = Sensor.objects.filter(
-                readings__timestamp__gte=datetime.now() - timedelta(days=7)
-            ).distinct()
-            
-            if sensors_with_readings.count() == 0:
+            recent = Reading.objects.filter(timestamp__gte=timezone.now() - timedelta(days=7))
+            stats = list(recent.values('sensor_id').annotate(
+                readings=Count('id'), mean=Avg('raw_value'), sensor_value=Max('sensor__value')
+            ).order_by())
+
+            if not stats:
                 return 92.0  # Default accuracy
-            
-            # Calculate based on reading consistency
-            total_drift = 0
-            sensor_count = 0
-            
-            for sensor in sensors_with_readings:
-                recent_readings = sensor.readings.filter(
-                    timestamp__gte=datetime.now() - timedelta(days=7)
-                ).order_by('timestamp')
-                
-                if recent_readings.count() > 5:
-                    values = [r.raw_value for r in recent_readings]
-                    baseline = sensor.value or sum(values) / len(values)
-                    
-                    # Calculate average drift
-                    drift_values = [abs((v - baseline) / baseline * 100) for v in values if baseline != 0]
-                    if drift_values:
-                        avg_drift = sum(drift_values) / len(drift_values)
-                        total_drift += avg_drift
-                        sensor_count += 1
-            
-            if sensor_count == 0:
+
+            # Sensor value as baseline, else the mean of its readings
+            baselines = {}
+            for row in stats:
+                baseline = row['sensor_value'] or row['mean']
+                if row['readings'] > 5 and baseline != 0:
+                    baselines[row['sensor_id']] = baseline
+
+            if not baselines:
                 return 92.0
-            
-            avg_drift = total_drift / sensor_count
+
+            # Calculate based on reading consistency: per-reading absolute drift
+            baseline = Case(
+                *[When(sensor_id=sensor_id, then=Value(value)) for sensor_id, value in baselines.items()],
+                output_field=FloatField(),
+            )
+            deviations = recent.filter(sensor_id__in=baselines).values('sensor_id').annotate(
+                deviation=Avg(Abs(F('raw_value') - baseline))
+            ).order_by()
+            drifts = [row['deviation'] / abs(baselines[row['sensor_id']]) * 100 for row in deviations]
+
+            avg_drift = sum(drifts) / len(drifts)
             # Higher accuracy for lower drift
             accuracy = max(85.0, 100.0 - avg_drift)
             return min(accuracy, 98.0)
-            
+
         except Exception:
             return 92.0  # Default accuracy
-    
-    def _calculate_calibration_improvement(self):
+
+    def _calculate_calibration_improvement(self, counts):
         """
-        Calculate calibration improvement rate
+        Calculate calibration improvement rate from the last 30 days'
+        calibration counts (recent, adaptive)
         """
-        try:
-            # Get recent calibrations
-            recent_calibrations = Calibration.objects.filter(
-                applied_at__gte=datetime.now() - timedelta(days=30)
-            )
-            
-            if recent_calibrations.count() == 0:
-                return 88.0  # Default improvement
-            
-            # Calculate improvement based on calibration frequency and methods
-            total_calibrations = recent_calibrations.count()
-            adaptive_calibrations = recent_calibrations.filter(method='adaptive').count()
-            
-            # Higher improvement if using adaptive methods
-            improvement = 80.0 + (adaptive_calibrations * 3) + (total_calibrations * 0.5)
-            return min(improvement, 95.0)
-            
-        except Exception:
+        if counts['recent'] == 0:
             return 88.0  # Default improvement
+        
+        # Higher improvement if using adaptive methods
+        improvement = 80.0 + (counts['adaptive'] * 3) + (counts['recent'] * 0.5)
+        return min(improvement, 95.0)
     
     def _get_recent_predictions(self):
         """
@@ -209,63 +189,10 @@ class MLAnalyticsService:
     
     def auto_train_models_if_needed(self):
         """
-        Automatically train models for sensors that need it
+        Retrain the models of all sensors that have enough new data since
+        they were trained (see RetrainingScheduler)
         """
         try:
-            results = []
-            sensors = Sensor.objects.all()
-            
-            for sensor in sensors:
-                # Check if sensor has enough data for training
-                readings_count = sensor.readings.count()
-                calibrations_count = sensor.calibrations.count()
-                
-                if readings_count >= 20:  # Minimum readings for training
-                    # Check if models need training
-                    model_files = [
-                        f'anomaly_model_{sensor.name}_{sensor.id}.joblib',
-                        f'drift_model_{sensor.name}_{sensor.id}.joblib',
-                        f'calibration_model_{sensor.name}_{sensor.id}.joblib'
-                    ]
-                    
-                    needs_training = []
-                    for model_file in model_files:
-                        model_path = os.path.join(self.models_dir, model_file)
-                        
-                        if not os.path.exists(model_path):
-                            needs_training.append(model_file.split('_')[0])
-                        else:
-                            # Check if model is older than 7 days
-                            model_age = datetime.now() - datetime.fromtimestamp(os.path.getctime(model_path))
-                            if model_age > timedelta(days=7):
-                                needs_training.append(model_file.split('_')[0])
-                    
-                    # Train needed models
-                    if needs_training:
-                        for model_type in needs_training:
-                            try:
-                                if model_type == 'anomaly':
-                                    result = self.trainer.train_anomaly_detection_model(sensor.id)
-                                elif model_type == 'drift':
-                                    result = self.trainer.train_drift_prediction_model(sensor.id)
-                                elif model_type == 'calibration' and calibrations_count >= 5:
-                                    result = self.trainer.train_calibration_model(sensor.id)
-                                else:
-                                    continue
-                                
-                                results.append({
-                                    'sensor_name': sensor.name,
-                                    'model_type': model_type,
-                                    'result': result
-                                })
-                            except Exception as e:
-                                results.append({
-                                    'sensor_name': sensor.name,
-                                    'model_type': model_type,
-                                    'result': {'status': 'error', 'message': str(e)}
-                                })
-            
-            return results
-            
+            return RetrainingScheduler().run()
         except Exception as e:
             return [{'error': str(e)}]
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import joblib
+from django.conf import settings
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class _CachedModel:
+    __slots__ = ('model', 'path', 'stamp', 'size')
+
+    def __init__(self, model, path, stamp, size):
+        self.model = model
+        self.path = path
+        self.stamp = stamp
+        self.size = size
+
+
+def _file_stamp(path):
+    """(mtime, size, inode) of a model file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class ModelCache:
+    """
+    LRU cache of unpickled models keyed by (sensor_id, model_type).
+
+    Each lookup stats the artifact and compares (mtime, size, inode) with the
+    cached copy, so a model retrained by any process is picked up on the next
+    request. Entries are weighed by their artifact size, which tracks the
+    size of the arrays they hold, and the least recently used ones are
+    evicted once the total exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'loads': 0,
+            'evictions': 0,
+            'load_seconds': 0.0,
+        }
+
+    def get(self, key, path, loader=joblib.load):
+        """Model stored at path, loaded from disk only when not cached or changed. None if missing."""
+        stamp = _file_stamp(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if stamp is not None and entry.path == path and entry.stamp == stamp:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry.model
+                self._stats['stale'] += 1
+                self._remove(key)
+            self._stats['misses'] += 1
+
+        if stamp is None:
+            return None
+
+        started = time.perf_counter()
+        model = loader(path)
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._stats['loads'] += 1
+            self._stats['load_seconds'] += elapsed
+            if stamp[1] <= self.max_bytes:
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = _CachedModel(model, path, stamp, stamp[1])
+                self._bytes += stamp[1]
+                while self._bytes > self.max_bytes:
+                    oldest = next(iter(self._entries))
+                    self._remove(oldest)
+                    self._stats['evictions'] += 1
+        return model
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def invalidate(self, sensor_id=None, model_type=None):
+        """Drop cached models of a sensor and/or model type (all when no arguments)"""
+        with self._lock:
+            for key in list(self._entries):
+                if sensor_id is not None and key[0] != sensor_id:
+                    continue
+                if model_type is not None and key[1] != model_type:
+                    continue
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            loads = self._stats['loads']
+            return {
+                **self._stats,
+                'hit_rate': self._stats['hits'] / lookups if lookups else 0.0,
+                'avg_load_ms': self._stats['load_seconds'] * 1000 / loads if loads else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+model_cache = ModelCache(getattr(settings, 'MODEL_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
@@ -0,0 +1,47 @@
+import os
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from sensors.models import TrainedModel
+
+MODEL_TYPES = [model_type for model_type, _ in TrainedModel.MODEL_TYPES]
+
+# Models newer than this count as active in the ML statistics
+MODEL_MAX_AGE = timedelta(days=7)
+
+
+def register_model(sensor_id, model_type, model_path, training_samples=None, metrics=None,
+                   data_watermark=None, training_state=None, created_at=None):
+    """
+    Record a newly written model artifact as the active version of its
+    sensor and type, retiring the previous one.
+    """
+    with transaction.atomic():
+        versions = TrainedModel.objects.select_for_update().filter(sensor_id=sensor_id, model_type=model_type)
+        version = (versions.aggregate(latest=Max('version'))['latest'] or 0) + 1
+        versions.filter(is_active=True).update(is_active=False)
+        return TrainedModel.objects.create(
+            sensor_id=sensor_id,
+            model_type=model_type,
+            version=version,
+            path=os.path.basename(model_path),
+            size_bytes=os.path.getsize(model_path),
+            training_samples=training_samples,
+            metrics=metrics or {},
+            data_watermark=data_watermark,
+            training_state=training_state or {},
+            created_at=created_at or timezone.now(),
+        )
+
+
+def active_model(sensor_id, model_type):
+    return TrainedModel.objects.filter(sensor_id=sensor_id, model_type=model_type, is_active=True).first()
+
+
+def active_models():
+    return TrainedModel.objects.filter(is_active=True).select_related('sensor').order_by('model_type', 'sensor_id')
+
+
+def count_recent_models(max_age=MODEL_MAX_AGE):
+    return TrainedModel.objects.filter(is_active=True, created_at__gt=timezone.now() - max_age).count()
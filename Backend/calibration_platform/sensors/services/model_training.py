@@ -7,47 +7,88 @@ from sklearn.metrics import mean_squared_error, classification_report
 import joblib
 import os
 from django.conf import settings
-from sensors.models import Sensor, Reading, Anomaly, Calibration
-from datetime import datetime, timedelta
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from sensors.models import Sensor, Reading, Anomaly, Calibration, DriftForecast
+from datetime import timedelta
+from .model_cache import model_cache
+from .compiled_forest import CompiledIsolationForest, compiled_path
+from .training_pool import MODEL_TYPE_TASKS, TRAINING_TASKS, train_tasks
+from .model_registry import register_model, active_model, active_models
+from .incremental_training import (
+    FOREST_OFFSET_SAMPLES, MIN_FOREST_REFIT_SAMPLES, fit_linear_stats, linear_stats, merge_linear_stats,
+    merge_moments, refresh_isolation_forest,
+)
+from .reading_arrays import (
+    datetime64_array, day_of_week, hour_of_day, hours_between, load_readings, reading_arrays, trailing_means,
+)
+
+
+def save_model(model, model_path, sensor_id, model_type, **registry_fields):
+    """
+    Write a model artifact atomically, drop the cached copy and record it in
+    the TrainedModel registry (registry_fields go to register_model). Other
+    processes see the new file's stamp on their next cache lookup. A new
+    drift model also drops the sensor's stored forecast, which was made
+    with the previous one.
+    """
+    tmp_path = f'{model_path}.tmp{os.getpid()}'
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, model_path)
+    model_cache.invalidate(sensor_id, model_type)
+    if model_type == 'drift':
+        DriftForecast.objects.filter(sensor_id=sensor_id).delete()
+    return register_model(sensor_id, model_type, model_path, **registry_fields)
+
 
 class ModelTrainer:
     def __init__(self):
         self.models_dir = os.path.join(settings.BASE_DIR, 'trained_models')
         os.makedirs(self.models_dir, exist_ok=True)
     
-    def train_anomaly_detection_model(self, sensor_id=None):
+    def _model_path(self, model_type, sensor_name, sensor_id):
+        return os.path.join(self.models_dir, f'{model_type}_model_{sensor_name}_{sensor_id}.joblib')
+    
+    def _up_to_date(self, previous, message):
+        return {
+            "status": "success",
+            "message": message,
+            "model_path": os.path.join(self.models_dir, previous.path),
+            "training_samples": previous.training_samples,
+            "incremental": True,
+            "new_samples": 0,
+            "sensor_id": previous.sensor_id,
+            "sensor_name": previous.sensor.name
+        }
+    
+    def train_anomaly_detection_model(self, sensor_id=None, incremental=True):
         """
-        Train Isolation Forest model for anomaly detection
+        Train Isolation Forest model for anomaly detection. With incremental,
+        a sensor's existing model is refreshed with the readings stored
+        since it was trained instead of refit on the full history.
         """
         try:
+            if sensor_id and incremental:
+                previous = active_model(int(sensor_id), 'anomaly')
+                if (previous is not None and previous.data_watermark is not None
+                        and 'value_mean' in previous.metrics
+                        and os.path.exists(os.path.join(self.models_dir, previous.path))):
+                    return self._update_anomaly_detection_model(previous)
+            
             # Get training data
             if sensor_id:
-                readings = Reading.objects.filter(sensor_id=sensor_id).order_by('timestamp')
+                timestamps, values, ids = load_readings(sensor_id, with_ids=True)
                 sensor_name = Sensor.objects.get(id=sensor_id).name
             else:
                 # Train on all sensors
-                readings = Reading.objects.all().order_by('timestamp')
+                timestamps, values, ids = reading_arrays(Reading.objects.order_by('timestamp', 'id'), with_ids=True)
                 sensor_name = "all_sensors"
             
-            if len(readings) < 10:
+            if len(values) < 10:
                 return {"status": "error", "message": "Not enough data for training (need at least 10 readings)"}
             
-            # Prepare features
-            values = np.array([r.raw_value for r in readings]).reshape(-1, 1)
-            
-            # Add time-based features
-            timestamps = [r.timestamp for r in readings]
-            time_features = []
-            for i, ts in enumerate(timestamps):
-                # Hour of day, day of week, etc.
-                hour = ts.hour
-                day_of_week = ts.weekday()
-                time_features.append([hour, day_of_week])
-            
-            time_features = np.array(time_features)
-            
-            # Combine value and time features
-            X = np.hstack([values, time_features])
+            # Value plus time-based features: hour of day, day of week
+            X = np.column_stack([values, hour_of_day(timestamps), day_of_week(timestamps)])
             
             # Train model
             model = IsolationForest(
@@ -59,18 +100,31 @@ class ModelTrainer:
             model.fit(X)
             
             # Save model
-            model_path = os.path.join(self.models_dir, f'anomaly_model_{sensor_name}_{sensor_id or "all"}.joblib')
-            joblib.dump(model, model_path)
+            model_path = self._model_path('anomaly', sensor_name, sensor_id or "all")
+            # Compiled copy for low-latency scoring, written before the joblib
+            # so a reader never pairs a new model with an old compiled one
+            CompiledIsolationForest.from_sklearn(model).save(compiled_path(model_path))
             
             # Test model on existing data
             predictions = model.predict(X)
             anomaly_count = np.sum(predictions == -1)
             
+            save_model(
+                model, model_path, int(sensor_id) if sensor_id else None, 'anomaly',
+                training_samples=len(values),
+                metrics={
+                    'detected_anomalies': int(anomaly_count),
+                    'value_mean': float(values.mean()),
+                    'value_std': float(values.std()),
+                },
+                data_watermark=int(ids.max()),
+            )
+            
             return {
                 "status": "success",
                 "message": f"Anomaly detection model trained successfully",
                 "model_path": model_path,
-                "training_samples": len(readings),
+                "training_samples": len(values),
                 "detected_anomalies": int(anomaly_count),
                 "sensor_id": sensor_id,
                 "sensor_name": sensor_name
@@ -79,20 +133,90 @@ class ModelTrainer:
         except Exception as e:
             return {"status": "error", "message": f"Training failed: {str(e)}"}
     
-    def train_drift_prediction_model(self, sensor_id):
+    def _update_anomaly_detection_model(self, previous):
+        """
+        Replace a share of the forest's trees, proportional to the share of
+        new readings, with trees fit on the newest readings
+        """
+        sensor = previous.sensor
+        new_count = Reading.objects.filter(sensor=sensor, id__gt=previous.data_watermark).count()
+        if not new_count:
+            return self._up_to_date(previous, "Anomaly detection model is up to date")
+        
+        timestamps, values, ids = load_readings(
+            sensor, limit=max(new_count, MIN_FOREST_REFIT_SAMPLES), descending=True, with_ids=True
+        )
+        X = np.column_stack([values, hour_of_day(timestamps), day_of_week(timestamps)])
+        
+        model_path = os.path.join(self.models_dir, previous.path)
+        model = joblib.load(model_path)
+        training_samples = previous.training_samples + new_count
+        replace = min(model.n_estimators, max(1, round(model.n_estimators * new_count / training_samples)))
+        refresh_isolation_forest(model, X, replace, retained=self._retained_sample(previous))
+        CompiledIsolationForest.from_sklearn(model).save(compiled_path(model_path))
+        
+        anomaly_count = np.sum(model.predict(X[:new_count]) == -1)
+        _, value_mean, value_std = merge_moments(
+            previous.training_samples, previous.metrics['value_mean'], previous.metrics['value_std'], values[:new_count]
+        )
+        save_model(
+            model, model_path, sensor.id, 'anomaly',
+            training_samples=training_samples,
+            metrics={
+                'detected_anomalies': int(anomaly_count),
+                'value_mean': value_mean,
+                'value_std': value_std,
+            },
+            data_watermark=max(previous.data_watermark, int(ids.max())),
+        )
+        
+        return {
+            "status": "success",
+            "message": f"Anomaly detection model updated with {new_count} new readings",
+            "model_path": model_path,
+            "training_samples": training_samples,
+            "detected_anomalies": int(anomaly_count),
+            "incremental": True,
+            "new_samples": new_count,
+            "replaced_trees": replace,
+            "sensor_id": sensor.id,
+            "sensor_name": sensor.name
+        }
+    
+    def _retained_sample(self, previous):
+        """
+        Features of up to FOREST_OFFSET_SAMPLES readings a forest was trained
+        on, every n-th by (timestamp, id) so they span its whole history
+        """
+        readings = Reading.objects.filter(sensor_id=previous.sensor_id, id__lte=previous.data_watermark)
+        step = -(-previous.training_samples // FOREST_OFFSET_SAMPLES)
+        if step > 1:
+            readings = readings.annotate(
+                row=Window(RowNumber(), order_by=[F('timestamp').asc(), F('id').asc()])
+            ).annotate(slot=F('row') % step).filter(slot=0)
+        timestamps, values = reading_arrays(readings.order_by('timestamp', 'id'))
+        return np.column_stack([values, hour_of_day(timestamps), day_of_week(timestamps)])
+    
+    def train_drift_prediction_model(self, sensor_id, incremental=True):
         """
-        Train drift prediction model using time series data
+        Train drift prediction model using time series data. With
+        incremental, the stored regression statistics are extended with the
+        readings stored since the last training, unless a reading arrived out
+        of order or the sensor's baseline changed.
         """
         try:
             sensor = Sensor.objects.get(id=sensor_id)
-            readings = Reading.objects.filter(sensor=sensor).order_by('timestamp')
+            if incremental:
+                previous = active_model(sensor.id, 'drift')
+                if previous is not None and previous.training_state and previous.data_watermark is not None:
+                    result = self._update_drift_prediction_model(sensor, previous)
+                    if result is not None:
+                        return result
             
-            if len(readings) < 20:
-                return {"status": "error", "message": "Not enough data for drift prediction (need at least 20 readings)"}
+            timestamps, values, ids = load_readings(sensor, with_ids=True)
             
-            # Prepare time series data
-            values = np.array([r.raw_value for r in readings])
-            timestamps = np.array([r.timestamp for r in readings])
+            if len(values) < 20:
+                return {"status": "error", "message": "Not enough data for drift prediction (need at least 20 readings)"}
             
             # Calculate drift over time
             baseline = sensor.value or np.mean(values[:5])  # Use first 5 readings as baseline
@@ -104,7 +228,7 @@ class ModelTrainer:
             rolling_std = pd.Series(values).rolling(window=window_size).std().fillna(0)
             
             # Time features
-            time_since_start = [(ts - timestamps[0]).total_seconds() / 3600 for ts in timestamps]  # hours
+            time_since_start = hours_between(timestamps, timestamps[0])
             
             # Prepare training data
             X = np.column_stack([
@@ -128,8 +252,23 @@ class ModelTrainer:
             mse = mean_squared_error(y, y_pred)
             
             # Save model
-            model_path = os.path.join(self.models_dir, f'drift_model_{sensor.name}_{sensor_id}.joblib')
-            joblib.dump(model, model_path)
+            model_path = self._model_path('drift', sensor.name, sensor_id)
+            save_model(
+                model, model_path, sensor.id, 'drift',
+                training_samples=len(X),
+                metrics={'mse': float(mse), 'value_mean': float(values.mean()), 'value_std': float(values.std())},
+                data_watermark=int(ids.max()),
+                training_state={
+                    'stats': linear_stats(X, y),
+                    'baseline': float(baseline),
+                    'window': window_size,
+                    'origin': str(timestamps[0]),
+                    'last_timestamp': str(timestamps[-1]),
+                    'last_hours': float(time_since_start[-1]),
+                    # Newest readings, for the rolling features of the next rows
+                    'tail': values[-window_size:].tolist(),
+                },
+            )
             
             return {
                 "status": "success",
@@ -144,43 +283,108 @@ class ModelTrainer:
         except Exception as e:
             return {"status": "error", "message": f"Training failed: {str(e)}"}
     
-    def train_calibration_model(self, sensor_id):
+    def _update_drift_prediction_model(self, sensor, previous):
         """
-        Train adaptive calibration model
+        Fold the rows of readings newer than the watermark into the stored
+        statistics and refit from them. None when a full refit is needed.
+        """
+        state = previous.training_state
+        baseline = sensor.value or state['baseline']
+        if baseline != state['baseline']:
+            return None
+        
+        timestamps, values, ids = reading_arrays(
+            Reading.objects.filter(sensor=sensor, id__gt=previous.data_watermark).order_by('timestamp', 'id'),
+            with_ids=True,
+        )
+        if not len(values):
+            return self._up_to_date(previous, "Drift prediction model is up to date")
+        if timestamps[0] < np.datetime64(state['last_timestamp']):
+            return None  # Out of order: the series' features shift
+        
+        # The last trained reading starts the new rows, with its window
+        window = state['window']
+        series = np.concatenate([state['tail'], values])
+        rolling_mean = pd.Series(series).rolling(window=window).mean().to_numpy()
+        rolling_std = pd.Series(series).rolling(window=window).std().to_numpy()
+        hours = np.concatenate([[state['last_hours']], hours_between(timestamps, np.datetime64(state['origin']))])
+        first = len(state['tail']) - 1
+        X = np.column_stack([series[first:-1], rolling_mean[first:-1], rolling_std[first:-1], hours[:-1]])
+        next_values = series[first + 1:]
+        y = ((next_values - baseline) / baseline * 100) if baseline != 0 else next_values
+        
+        stats = merge_linear_stats(state['stats'], linear_stats(X, y))
+        model, mse = fit_linear_stats(stats)
+        _, value_mean, value_std = merge_moments(
+            stats['n'] - len(X) + 1, previous.metrics['value_mean'], previous.metrics['value_std'], values
+        )
+        
+        model_path = os.path.join(self.models_dir, previous.path)
+        save_model(
+            model, model_path, sensor.id, 'drift',
+            training_samples=stats['n'],
+            metrics={'mse': mse, 'value_mean': value_mean, 'value_std': value_std},
+            data_watermark=int(ids.max()),
+            training_state={
+                **state,
+                'stats': stats,
+                'last_timestamp': str(timestamps[-1]),
+                'last_hours': float(hours[-1]),
+                'tail': series[-window:].tolist(),
+            },
+        )
+        
+        return {
+            "status": "success",
+            "message": f"Drift prediction model updated with {len(values)} new readings",
+            "model_path": model_path,
+            "training_samples": stats['n'],
+            "mse": mse,
+            "incremental": True,
+            "new_samples": len(values),
+            "sensor_id": sensor.id,
+            "sensor_name": sensor.name
+        }
+    
+    def _calibration_pairs(self, sensor, calibrations):
+        """
+        (raw, corrected) training pairs: each calibration's corrected value
+        against the mean of the 3 readings before it. The readings are
+        loaded once and joined to the calibration times as of each one.
+        """
+        if not calibrations:
+            return np.empty((0, 1)), np.empty(0)
+        applied_at = [cal.applied_at for cal in calibrations]
+        timestamps, values = load_readings(sensor, end=max(applied_at))
+        raw_values = trailing_means(timestamps, values, datetime64_array(applied_at), 3)
+        corrected_values = np.array([cal.corrected_value for cal in calibrations])
+        # Calibrations without earlier readings give no pair
+        found = ~np.isnan(raw_values)
+        return raw_values[found].reshape(-1, 1), corrected_values[found]
+    
+    def train_calibration_model(self, sensor_id, incremental=True):
+        """
+        Train adaptive calibration model. With incremental, only
+        calibrations newer than the last training are read and merged into
+        the stored regression statistics.
         """
         try:
             sensor = Sensor.objects.get(id=sensor_id)
-            calibrations = Calibration.objects.filter(sensor=sensor).order_by('applied_at')
+            if incremental:
+                previous = active_model(sensor.id, 'calibration')
+                if previous is not None and previous.training_state and previous.data_watermark is not None:
+                    return self._update_calibration_model(sensor, previous)
+            
+            calibrations = list(Calibration.objects.filter(sensor=sensor).order_by('applied_at'))
             
             if len(calibrations) < 5:
                 return {"status": "error", "message": "Not enough calibration data (need at least 5 calibrations)"}
             
             # Get readings around calibration times
-            calibration_data = []
-            for cal in calibrations:
-                # Get readings before and after calibration
-                readings_before = Reading.objects.filter(
-                    sensor=sensor,
-                    timestamp__lt=cal.applied_at
-                ).order_by('-timestamp')[:3]
-                
-                if readings_before:
-                    raw_values = [r.raw_value for r in readings_before]
-                    avg_raw = np.mean(raw_values)
-                    
-                    calibration_data.append({
-                        'raw_value': avg_raw,
-                        'corrected_value': cal.corrected_value,
-                        'method': cal.method,
-                        'timestamp': cal.applied_at
-                    })
-            
-            if len(calibration_data) < 3:
-                return {"status": "error", "message": "Not enough calibration data with readings"}
+            X, y = self._calibration_pairs(sensor, calibrations)
             
-            # Prepare training data
-            X = np.array([[cd['raw_value']] for cd in calibration_data])
-            y = np.array([cd['corrected_value'] for cd in calibration_data])
+            if len(y) < 3:
+                return {"status": "error", "message": "Not enough calibration data with readings"}
             
             # Train model
             model = LinearRegression()
@@ -191,14 +395,20 @@ class ModelTrainer:
             mse = mean_squared_error(y, y_pred)
             
             # Save model
-            model_path = os.path.join(self.models_dir, f'calibration_model_{sensor.name}_{sensor_id}.joblib')
-            joblib.dump(model, model_path)
+            model_path = self._model_path('calibration', sensor.name, sensor_id)
+            save_model(
+                model, model_path, sensor.id, 'calibration',
+                training_samples=len(y),
+                metrics={'mse': float(mse)},
+                data_watermark=max(cal.id for cal in calibrations),
+                training_state={'stats': linear_stats(X, y)},
+            )
             
             return {
                 "status": "success",
                 "message": f"Calibration model trained successfully",
                 "model_path": model_path,
-                "training_samples": len(calibration_data),
+                "training_samples": len(y),
                 "mse": float(mse),
                 "sensor_id": sensor_id,
                 "sensor_name": sensor.name
@@ -207,55 +417,95 @@ class ModelTrainer:
         except Exception as e:
             return {"status": "error", "message": f"Training failed: {str(e)}"}
     
-    def train_all_models(self, sensor_id=None):
+    def _update_calibration_model(self, sensor, previous):
+        calibrations = list(
+            Calibration.objects.filter(sensor=sensor, id__gt=previous.data_watermark).order_by('applied_at')
+        )
+        X, y = self._calibration_pairs(sensor, calibrations)
+        if not len(y):
+            return self._up_to_date(previous, "Calibration model is up to date")
+        
+        stats = merge_linear_stats(previous.training_state['stats'], linear_stats(X, y))
+        model, mse = fit_linear_stats(stats)
+        model_path = os.path.join(self.models_dir, previous.path)
+        save_model(
+            model, model_path, sensor.id, 'calibration',
+            training_samples=stats['n'],
+            metrics={'mse': mse},
+            data_watermark=max(cal.id for cal in calibrations),
+            training_state={'stats': stats},
+        )
+        
+        return {
+            "status": "success",
+            "message": f"Calibration model updated with {len(y)} new calibrations",
+            "model_path": model_path,
+            "training_samples": stats['n'],
+            "mse": mse,
+            "incremental": True,
+            "new_samples": len(y),
+            "sensor_id": sensor.id,
+            "sensor_name": sensor.name
+        }
+    
+    def train_model(self, sensor_id, model_type, incremental=True):
+        """
+        Train one model type ('anomaly', 'drift' or 'calibration') of a
+        sensor in-process, under the same training lock as train_all_models.
+        The result is 'skipped' when another process is training it, and
+        gets its wall time as training_seconds.
+        """
+        task = (sensor_id, MODEL_TYPE_TASKS[model_type])
+        result, seconds = train_tasks([task], workers=1, incremental=incremental)[task]
+        result['training_seconds'] = round(seconds, 3)
+        return result
+    
+    def train_all_models(self, sensor_id=None, workers=None, progress=None, incremental=True):
         """
-        Train all models for a sensor or all sensors
+        Train all models for a sensor or all sensors. For all sensors with
+        more than one worker (settings.MODEL_TRAINING_WORKERS by default) the
+        models are trained in parallel processes, largest sensors first; a
+        single sensor is trained in-process. Every result
+        gets its wall time as training_seconds; progress and incremental are
+        passed on to train_tasks.
         """
         results = {}
         
         if sensor_id:
             sensors = [Sensor.objects.get(id=sensor_id)]
         else:
-            sensors = Sensor.objects.all()
+            sensors = list(
+                Sensor.objects.annotate(reading_count=Count('readings')).order_by('-reading_count', 'id')
+            )
+        tasks = [(sensor.id, model_type) for sensor in sensors for model_type in TRAINING_TASKS]
+        
+        outcomes = train_tasks(tasks, workers, progress, incremental)
         
         for sensor in sensors:
             sensor_results = {}
-            
-            # Train anomaly detection
-            anomaly_result = self.train_anomaly_detection_model(sensor.id)
-            sensor_results['anomaly_detection'] = anomaly_result
-            
-            # Train drift prediction
-            drift_result = self.train_drift_prediction_model(sensor.id)
-            sensor_results['drift_prediction'] = drift_result
-            
-            # Train calibration model
-            calibration_result = self.train_calibration_model(sensor.id)
-            sensor_results['calibration'] = calibration_result
-            
+            for model_type in TRAINING_TASKS:
+                result, seconds = outcomes[(sensor.id, model_type)]
+                result['training_seconds'] = round(seconds, 3)
+                sensor_results[model_type] = result
             results[sensor.name] = sensor_results
         
         return results
     
     def get_model_info(self):
         """
-        Get information about trained models
+        Get information about trained models, from the model registry
         """
-        models_info = []
-        
-        for filename in os.listdir(self.models_dir):
-            if filename.endswith('.joblib'):
-                model_path = os.path.join(self.models_dir, filename)
-                model = joblib.load(model_path)
-                
-                model_info = {
-                    'filename': filename,
-                    'model_type': filename.split('_')[0],
-                    'sensor_name': filename.split('_')[2] if len(filename.split('_')) > 2 else 'unknown',
-                    'created_at': datetime.fromtimestamp(os.path.getctime(model_path)),
-                    'size_kb': round(os.path.getsize(model_path) / 1024, 2)
-                }
-                
-                models_info.append(model_info)
-        
-        return models_info
+        return [
+            {
+                'filename': trained.path,
+                'model_type': trained.model_type,
+                'sensor_id': trained.sensor_id,
+                'sensor_name': trained.sensor.name if trained.sensor_id else 'all_sensors',
+                'version': trained.version,
+                'training_samples': trained.training_samples,
+                'metrics': trained.metrics,
+                'created_at': trained.created_at,
+                'size_kb': round(trained.size_bytes / 1024, 2)
+            }
+            for trained in active_models()
+        ]
@@ -0,0 +1,157 @@
+"""
+Columnar access to readings. Rows are streamed with values_list in chunks
+into preallocated NumPy arrays, so no Reading instances are built:
+timestamps come back as datetime64[us] (UTC when USE_TZ is on), values as
+float64 and ids as int64.
+"""
+import numpy as np
+from itertools import islice
+from datetime import timezone as dt_timezone
+from django.db import connections, transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.utils.dateparse import parse_datetime
+from sensors.models import Reading
+
+CHUNK_SIZE = 50000
+
+
+def datetime64_array(chunk):
+    """datetime64[us] array (UTC for aware values) of datetimes or ISO strings"""
+    if chunk and isinstance(chunk[0], str):
+        try:
+            return np.array(chunk, dtype='datetime64[us]')
+        except ValueError:  # Not in the format Django writes
+            chunk = [parse_datetime(t) for t in chunk]
+    # Aware datetimes are normalized to UTC; NumPy has no time zones, so drop
+    # the tzinfo instead of letting it warn and convert per item
+    return np.array([
+        t.astimezone(dt_timezone.utc).replace(tzinfo=None) if t.tzinfo else t
+        for t in chunk
+    ], dtype='datetime64[us]')
+
+
+def reading_arrays(readings, with_ids=False, with_sensor_ids=False):
+    """
+    Load a (filtered, ordered, possibly sliced) Reading queryset as arrays,
+    in the queryset's order. Returns (timestamps, values), followed by ids
+    and then sensor ids when asked for.
+    """
+    fields = ['timestamp', 'raw_value']
+    if connections[readings.db].vendor == 'sqlite':
+        # SQLite stores timestamps as ISO text in UTC, which NumPy parses far
+        # faster than Django builds aware datetimes from it
+        readings = readings.annotate(timestamp_text=Cast('timestamp', TextField()))
+        fields[0] = 'timestamp_text'
+    if with_ids:
+        fields.append('id')
+    if with_sensor_ids:
+        fields.append('sensor_id')
+
+    with transaction.atomic(using=readings.db):
+        # Counted in the same transaction as the read, so the arrays can be
+        # allocated once at their final size
+        size = readings.count()
+        timestamps = np.empty(size, dtype='datetime64[us]')
+        columns = [np.empty(size, dtype=np.float64)]
+        columns += [np.empty(size, dtype=np.int64) for _ in fields[2:]]
+
+        filled = 0
+        rows = readings.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+        while True:
+            chunk = list(islice(rows, CHUNK_SIZE))
+            if not chunk:
+                break
+            end = filled + len(chunk)
+            if end > size:  # Only if the backend gives no snapshot isolation
+                size = end
+                timestamps = np.resize(timestamps, size)
+                columns = [np.resize(column, size) for column in columns]
+            fields_of_chunk = list(zip(*chunk))
+            timestamps[filled:end] = datetime64_array(fields_of_chunk[0])
+            for column, data in zip(columns, fields_of_chunk[1:]):
+                column[filled:end] = data
+            filled = end
+
+    return (timestamps[:filled], *(column[:filled] for column in columns))
+
+
+def load_readings(sensor, start=None, end=None, limit=None, descending=False, with_ids=False):
+    """
+    Readings of one sensor (instance or id) as (timestamps, values[, ids]),
+    oldest first, or newest first with descending. start and end bound the
+    timestamps inclusively; limit keeps the first rows in that order, so
+    limit with descending gives the newest ones.
+    """
+    readings = Reading.objects.filter(sensor=sensor)
+    if start is not None:
+        readings = readings.filter(timestamp__gte=start)
+    if end is not None:
+        readings = readings.filter(timestamp__lte=end)
+    if descending:
+        readings = readings.order_by('-timestamp', '-id')
+    else:
+        readings = readings.order_by('timestamp', 'id')
+    if limit is not None:
+        readings = readings[:limit]
+    return reading_arrays(readings, with_ids=with_ids)
+
+
+def load_readings_by_sensor(sensor_ids, start=None, end=None, with_ids=False):
+    """
+    Readings of several sensors from one query, as
+    {sensor_id: (timestamps, values[, ids])} oldest first. Sensors without
+    readings are left out.
+    """
+    readings = Reading.objects.filter(sensor_id__in=sensor_ids)
+    if start is not None:
+        readings = readings.filter(timestamp__gte=start)
+    if end is not None:
+        readings = readings.filter(timestamp__lte=end)
+    columns = reading_arrays(
+        readings.order_by('sensor_id', 'timestamp', 'id'),
+        with_ids=with_ids,
+        with_sensor_ids=True,
+    )
+    owners = columns[-1]
+    if not len(owners):
+        return {}
+
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(owners)) + 1, [len(owners)]))
+    return {
+        int(owners[first]): tuple(column[first:last] for column in columns[:-1])
+        for first, last in zip(bounds[:-1], bounds[1:])
+    }
+
+
+def trailing_means(timestamps, values, at, window):
+    """
+    Mean of the last window readings strictly before each time in at
+    (NaN where there are none), from readings sorted oldest first. The
+    readings are matched by binary search, and summed newest first like
+    np.mean over a '-timestamp' query.
+    """
+    before = np.searchsorted(timestamps, at, side='left')
+    taken = np.minimum(before, window)
+    sums = np.zeros(len(before))
+    for back in range(1, window + 1):
+        has = taken >= back
+        sums[has] += values[before[has] - back]
+    means = np.full(len(before), np.nan)
+    np.divide(sums, taken, out=means, where=taken > 0)
+    return means
+
+
+def hours_between(timestamps, origin):
+    """Float hours from origin to each timestamp, like timedelta.total_seconds() / 3600"""
+    return (timestamps - origin).astype('timedelta64[us]').astype(np.float64) / 1e6 / 3600
+
+
+def hour_of_day(timestamps):
+    return (timestamps.astype('datetime64[h]') - timestamps.astype('datetime64[D]')).astype(np.int64)
+
+
+def day_of_week(timestamps):
+    """Monday = 0, as datetime.weekday()"""
+    # 1970-01-01 was a Thursday
+    return (timestamps.astype('datetime64[D]').astype(np.int64) + 3) % 7
@@ -5,9 +5,19 @@ from django.http import HttpResponse
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from sensors.models import Sensor, Reading, Calibration, Anomaly
+from .batch_scoring import corrected_series
+
+
+def _reading_rows(sensor, readings, include_corrected):
+    """(timestamp, raw_value[, corrected_value]) rows, corrected in one vectorized step"""
+    if not include_corrected:
+        return list(readings.values_list('timestamp', 'raw_value'))
+    rows = list(readings.values_list('timestamp', 'raw_value', 'corrected_value'))
+    corrected = corrected_series(sensor, [r[1] for r in rows], [r[2] for r in rows])
+    return [(timestamp, raw_value, value) for (timestamp, raw_value, _), value in zip(rows, corrected.tolist())]
 
 # ---------- CSV ----------
-def generate_csv_report(sensor_id):
+def generate_csv_report(sensor_id, include_corrected=False):
     sensor = Sensor.objects.get(id=sensor_id)
     readings = Reading.objects.filter(sensor=sensor).order_by('timestamp')
     calibrations = Calibration.objects.filter(sensor=sensor).order_by('applied_at')
@@ -19,9 +29,9 @@ def generate_csv_report(sensor_id):
     
     writer.writerow([f"Sensor Report: {sensor.name}"])
     writer.writerow([])
-    writer.writerow(["Timestamp", "Raw Value"])
-    for r in readings:
-        writer.writerow([r.timestamp, r.raw_value])
+    writer.writerow(["Timestamp", "Raw Value"] + (["Corrected Value"] if include_corrected else []))
+    for row in _reading_rows(sensor, readings, include_corrected):
+        writer.writerow(row)
     
     writer.writerow([])
     writer.writerow(["Calibrations"])
@@ -39,7 +49,7 @@ def generate_csv_report(sensor_id):
     return output, filename
 
 # ---------- EXCEL ----------
-def generate_excel_report(sensor_id):
+def generate_excel_report(sensor_id, include_corrected=False):
     sensor = Sensor.objects.get(id=sensor_id)
     readings = Reading.objects.filter(sensor=sensor).order_by('timestamp')
     calibrations = Calibration.objects.filter(sensor=sensor).order_by('applied_at')
@@ -48,7 +58,10 @@ def generate_excel_report(sensor_id):
     filename = f"{sensor.name}_report.xlsx"
     output = BytesIO()
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_readings = pd.DataFrame(list(readings.values('timestamp', 'raw_value')))
+        df_readings = pd.DataFrame(
+            _reading_rows(sensor, readings, include_corrected),
+            columns=['timestamp', 'raw_value'] + (['corrected_value'] if include_corrected else []),
+        )
         df_calibrations = pd.DataFrame(list(calibrations.values('applied_at', 'method', 'corrected_value')))
         df_anomalies = pd.DataFrame(list(anomalies.values('timestamp', 'type', 'severity')))
 
@@ -62,7 +75,7 @@ def generate_excel_report(sensor_id):
     return output, filename
 
 # ---------- PDF ----------
-def generate_pdf_report(sensor_id):
+def generate_pdf_report(sensor_id, include_corrected=False):
     sensor = Sensor.objects.get(id=sensor_id)
     readings = Reading.objects.filter(sensor=sensor).order_by('timestamp')
     calibrations = Calibration.objects.filter(sensor=sensor).order_by('applied_at')
@@ -82,8 +95,11 @@ def generate_pdf_report(sensor_id):
     c.drawString(50, y, "Readings:")
     y -= 20
     c.setFont("Helvetica", 10)
-    for r in readings[:30]:  # limit to first 30 for demo
-        c.drawString(50, y, f"{r.timestamp}: {r.raw_value}")
+    for row in _reading_rows(sensor, readings[:30], include_corrected):  # limit to first 30 for demo
+        line = f"{row[0]}: {row[1]}"
+        if include_corrected:
+            line += f" (corrected {row[2]:.3f})"
+        c.drawString(50, y, line)
         y -= 15
         if y < 50:
             c.showPage()
@@ -0,0 +1,205 @@
+"""
+Change-driven retraining. Each sensor's models are compared with the data
+that arrived after their training watermark (TrainedModel.data_watermark).
+A model is queued when it is missing, when enough new readings or
+calibrations have accumulated, or when the new readings' mean has moved
+away from the training data. Queued jobs run most urgent first on the
+training pool.
+"""
+import heapq
+import itertools
+from django.conf import settings
+from django.db.models import Avg, Count, Q
+from sensors.models import Sensor, Reading, Calibration, TrainedModel
+from .model_registry import MODEL_TYPES
+from .training_pool import train_tasks
+
+DEFAULT_RETRAINING_SETTINGS = {
+    'MIN_NEW_READINGS': 1000,
+    'MIN_NEW_CALIBRATIONS': 5,
+    # Shift of the new readings' mean, in training standard deviations
+    'DRIFT_THRESHOLD': 0.5,
+    'MIN_DRIFT_READINGS': 50,  # new readings before the shift is trusted
+    'MAX_CONCURRENT': 2,
+}
+
+# Data the trainers need before they can fit a model
+MIN_READINGS = {'anomaly': 10, 'drift': 20}
+MIN_CALIBRATIONS = 5
+
+# Registry model type -> training task (see training_pool.TRAINING_TASKS)
+TRAINING_TASK_OF = {
+    'anomaly': 'anomaly_detection',
+    'drift': 'drift_prediction',
+    'calibration': 'calibration',
+}
+
+# (sensor, watermark) pairs per grouped new-data query, which keeps the OR
+# of their conditions well inside SQLite's expression depth limit
+STATS_CHUNK_SIZE = 200
+
+# Priority bands; within a band more new data is more urgent
+PRIORITY_MISSING = 3
+PRIORITY_DRIFT = 2
+PRIORITY_NEW_DATA = 1
+
+
+def retraining_config():
+    return {**DEFAULT_RETRAINING_SETTINGS, **getattr(settings, 'MODEL_RETRAINING', {})}
+
+
+def _stats_after(queryset, pairs, **aggregates):
+    """
+    Aggregates of each sensor's rows newer than a watermark (all rows for
+    None), for [(sensor_id, watermark), ...] naming each sensor at most
+    once, grouped by sensor in one query per chunk. Returns
+    {(sensor_id, watermark): {name: value}}; sensors without such rows are
+    left out.
+    """
+    stats = {}
+    for start in range(0, len(pairs), STATS_CHUNK_SIZE):
+        chunk = pairs[start:start + STATS_CHUNK_SIZE]
+        condition = Q()
+        for sensor_id, watermark in chunk:
+            condition |= Q(sensor_id=sensor_id) if watermark is None else Q(sensor_id=sensor_id, id__gt=watermark)
+        watermark_of = dict(chunk)
+        for row in queryset.filter(condition).values('sensor_id').annotate(**aggregates).order_by():
+            sensor_id = row.pop('sensor_id')
+            stats[(sensor_id, watermark_of[sensor_id])] = row
+    return stats
+
+
+class RetrainingScheduler:
+    """
+    Plans and runs retraining jobs. Keep one instance for a long-running
+    loop: a job that failed is not retried until more data arrives.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or retraining_config()
+        # (sensor_id, model_type) -> amount of new data when training failed
+        self._failed = {}
+
+    def _reading_jobs(self, model_type, trained, new):
+        watermark = trained.data_watermark if trained else None
+        count = new['count']
+
+        if trained is None or watermark is None:
+            if count >= MIN_READINGS[model_type]:
+                return PRIORITY_MISSING, count, 'no trained model' if trained is None else 'no training watermark'
+            return None
+
+        mean, std = trained.metrics.get('value_mean'), trained.metrics.get('value_std')
+        if count >= self.config['MIN_DRIFT_READINGS'] and mean is not None and std:
+            shift = abs(new['mean'] - mean) / std
+            if shift >= self.config['DRIFT_THRESHOLD']:
+                return PRIORITY_DRIFT, shift, f'mean shifted by {shift:.2f} std over {count} new readings'
+        if count >= self.config['MIN_NEW_READINGS']:
+            return PRIORITY_NEW_DATA, count / self.config['MIN_NEW_READINGS'], f'{count} new readings'
+        return None
+
+    def _calibration_job(self, trained, count):
+        if trained is None or trained.data_watermark is None:
+            if count >= MIN_CALIBRATIONS:
+                return PRIORITY_MISSING, count, 'no trained model' if trained is None else 'no training watermark'
+            return None
+        if count >= self.config['MIN_NEW_CALIBRATIONS']:
+            return PRIORITY_NEW_DATA, count / self.config['MIN_NEW_CALIBRATIONS'], f'{count} new calibrations'
+        return None
+
+    def _new_data(self, sensors, active):
+        """
+        New readings (count, mean) and calibration counts after every active
+        model's watermark, as {(sensor_id, watermark): {...}}. The reading
+        aggregates are shared by model types trained up to the same reading.
+        """
+        def watermark(sensor, model_type):
+            trained = active.get((sensor.id, model_type))
+            return trained.data_watermark if trained else None
+
+        # A sensor appears once per query, so a second distinct reading
+        # watermark goes into a second round
+        rounds = [[], []]
+        for sensor in sensors:
+            watermarks = dict.fromkeys(watermark(sensor, model_type) for model_type in MIN_READINGS)
+            for pairs, mark in zip(rounds, watermarks):
+                pairs.append((sensor.id, mark))
+
+        readings = {}
+        for pairs in rounds:
+            readings.update(_stats_after(Reading.objects.all(), pairs, count=Count('id'), mean=Avg('raw_value')))
+        calibrations = _stats_after(
+            Calibration.objects.all(),
+            [(sensor.id, watermark(sensor, 'calibration')) for sensor in sensors],
+            count=Count('id'),
+        )
+        return readings, calibrations
+
+    def plan(self, sensor_ids=None):
+        """
+        Jobs that are due, most urgent first, as
+        [{'sensor_id', 'sensor_name', 'model_type', 'reason'}, ...]
+        """
+        sensors = Sensor.objects.order_by('id')
+        if sensor_ids is not None:
+            sensors = sensors.filter(id__in=sensor_ids)
+        sensors = list(sensors)
+        active = {
+            (trained.sensor_id, trained.model_type): trained
+            for trained in TrainedModel.objects.filter(is_active=True, sensor_id__in=[s.id for s in sensors])
+        }
+
+        new_readings, new_calibrations = self._new_data(sensors, active)
+
+        queue = []
+        order = itertools.count()
+        for sensor in sensors:
+            for model_type in MODEL_TYPES:
+                trained = active.get((sensor.id, model_type))
+                key = (sensor.id, trained.data_watermark if trained else None)
+                if model_type == 'calibration':
+                    due = self._calibration_job(trained, new_calibrations.get(key, {'count': 0})['count'])
+                else:
+                    due = self._reading_jobs(model_type, trained, new_readings.get(key, {'count': 0, 'mean': None}))
+                if due is None:
+                    continue
+                band, urgency, reason = due
+                if self._failed.get((sensor.id, model_type)) == urgency:
+                    continue  # Failed on this same data before
+                heapq.heappush(queue, ((-band, -urgency, next(order)), {
+                    'sensor_id': sensor.id,
+                    'sensor_name': sensor.name,
+                    'model_type': model_type,
+                    'reason': reason,
+                    'urgency': urgency,
+                }))
+        return [heapq.heappop(queue)[1] for _ in range(len(queue))]
+
+    def run(self, sensor_ids=None, workers=None, progress=None):
+        """
+        Train the due models with at most workers (MAX_CONCURRENT) at once
+        and return [{'sensor_name', 'model_type', 'reason', 'result'}, ...]
+        in priority order
+        """
+        jobs = self.plan(sensor_ids)
+        if not jobs:
+            return []
+        tasks = [(job['sensor_id'], TRAINING_TASK_OF[job['model_type']]) for job in jobs]
+        outcomes = train_tasks(tasks, workers or self.config['MAX_CONCURRENT'], progress)
+
+        results = []
+        for job, task in zip(jobs, tasks):
+            result, seconds = outcomes[task]
+            result['training_seconds'] = round(seconds, 3)
+            key = (job['sensor_id'], job['model_type'])
+            if result['status'] == 'error':
+                self._failed[key] = job['urgency']
+            else:
+                self._failed.pop(key, None)
+            results.append({
+                'sensor_name': job['sensor_name'],
+                'model_type': job['model_type'],
+                'reason': job['reason'],
+                'result': result,
+            })
+        return results
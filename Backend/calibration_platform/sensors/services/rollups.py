@@ -0,0 +1,185 @@
+from datetime import timedelta, timezone as dt_timezone
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+from django.utils import timezone
+from sensors.models import Reading, ReadingRollup
+
+# Bucket width of every rollup resolution, coarsest first
+RESOLUTIONS = {
+    'day': timedelta(days=1),
+    'hour': timedelta(hours=1),
+    'minute': timedelta(minutes=1),
+}
+
+TRUNC_FUNCTIONS = {
+    'day': TruncDay,
+    'hour': TruncHour,
+    'minute': TruncMinute,
+}
+
+# Default number of buckets a chart query should get back when the
+# resolution is chosen automatically
+AUTO_RESOLUTION_POINTS = 200
+
+
+def bucket_start(ts, resolution):
+    """Start of the UTC bucket containing ts"""
+    if timezone.is_naive(ts):
+        ts = timezone.make_aware(ts)
+    ts = ts.astimezone(dt_timezone.utc)
+    if resolution == 'minute':
+        return ts.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _bucket_end(ts, resolution):
+    """Smallest bucket boundary >= ts"""
+    start = bucket_start(ts, resolution)
+    return start if start == ts else start + RESOLUTIONS[resolution]
+
+
+def update_rollups(readings):
+    """
+    Fold newly stored readings into the minute/hour/day rollups.
+    Called on ingest, inside the transaction that inserted the readings.
+    """
+    if not readings:
+        return
+
+    # Aggregate the batch in memory first: one row per touched bucket
+    buckets = {}
+    for reading in readings:
+        value = reading.raw_value
+        for resolution in RESOLUTIONS:
+            key = (reading.sensor_id, resolution, bucket_start(reading.timestamp, resolution))
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [1, value, value, value, value * value]
+            else:
+                agg[0] += 1
+                agg[1] = min(agg[1], value)
+                agg[2] = max(agg[2], value)
+                agg[3] += value
+                agg[4] += value * value
+
+    # Merge into existing rows with a single upsert. The ORM's
+    # bulk_create(update_conflicts=True) can only overwrite columns, while
+    # rollups need count/sum to be added and min/max to be combined.
+    table = ReadingRollup._meta.db_table
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+    sql = (
+        f'INSERT INTO {table} (sensor_id, resolution, bucket_start, count, min_value, max_value, sum_value, sum_squares) '
+        f'VALUES (%s, %s, %s, %s, %s, %s, %s, %s) '
+        f'ON CONFLICT (sensor_id, resolution, bucket_start) DO UPDATE SET '
+        f'count = {table}.count + excluded.count, '
+        f'min_value = {least}({table}.min_value, excluded.min_value), '
+        f'max_value = {greatest}({table}.max_value, excluded.max_value), '
+        f'sum_value = {table}.sum_value + excluded.sum_value, '
+        f'sum_squares = {table}.sum_squares + excluded.sum_squares'
+    )
+    adapt = connection.ops.adapt_datetimefield_value
+    params = [
+        (sensor_id, resolution, adapt(start), *agg)
+        for (sensor_id, resolution, start), agg in buckets.items()
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def rebuild_rollups(sensor_ids=None, start=None, end=None, batch_size=5000):
+    """
+    Recompute rollups from raw readings. The range is widened to whole days
+    so that every bucket it touches is rebuilt completely.
+    Returns the number of rollup rows written per resolution.
+    """
+    readings = Reading.objects.all()
+    rollups = ReadingRollup.objects.all()
+    if sensor_ids:
+        readings = readings.filter(sensor_id__in=sensor_ids)
+        rollups = rollups.filter(sensor_id__in=sensor_ids)
+    if start:
+        start = bucket_start(start, 'day')
+        readings = readings.filter(timestamp__gte=start)
+        rollups = rollups.filter(bucket_start__gte=start)
+    if end:
+        end = _bucket_end(end, 'day')
+        readings = readings.filter(timestamp__lt=end)
+        rollups = rollups.filter(bucket_start__lt=end)
+
+    written = {}
+    with transaction.atomic():
+        rollups.delete()
+        for resolution, trunc in TRUNC_FUNCTIONS.items():
+            rows = (
+                readings
+                .annotate(bucket=trunc('timestamp', tzinfo=dt_timezone.utc))
+                .values('sensor_id', 'bucket')
+                .annotate(
+                    count=Count('id'),
+                    min_value=Min('raw_value'),
+                    max_value=Max('raw_value'),
+                    sum_value=Sum('raw_value'),
+                    sum_squares=Sum(F('raw_value') * F('raw_value')),
+                )
+                .order_by()
+            )
+
+            batch = []
+            written[resolution] = 0
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(ReadingRollup(
+                    sensor_id=row['sensor_id'],
+                    resolution=resolution,
+                    bucket_start=row['bucket'],
+                    count=row['count'],
+                    min_value=row['min_value'],
+                    max_value=row['max_value'],
+                    sum_value=row['sum_value'],
+                    sum_squares=row['sum_squares'],
+                ))
+                if len(batch) >= batch_size:
+                    ReadingRollup.objects.bulk_create(batch)
+                    written[resolution] += len(batch)
+                    batch = []
+            if batch:
+                ReadingRollup.objects.bulk_create(batch)
+                written[resolution] += len(batch)
+
+    return written
+
+
+def select_resolution(start, end, min_points=AUTO_RESOLUTION_POINTS):
+    """
+    Coarsest rollup resolution that still yields at least min_points buckets
+    over [start, end). Returns None when even minute buckets are too coarse
+    and the query has to be answered from raw readings.
+    """
+    span = end - start
+    for resolution, width in RESOLUTIONS.items():
+        if span / width >= min_points:
+            return resolution
+    return None
+
+
+def rollup_bounds(sensor_id):
+    """(start, end) of the days a sensor has rollups for, or (None, None)"""
+    bounds = ReadingRollup.objects.filter(sensor_id=sensor_id, resolution='day').aggregate(
+        first=Min('bucket_start'), last=Max('bucket_start')
+    )
+    if bounds['first'] is None:
+        return None, None
+    return bounds['first'], bounds['last'] + RESOLUTIONS['day']
+
+
+def rollup_series(sensor_id, resolution, start=None, end=None):
+    """Rollup rows of one sensor at one resolution, oldest bucket first"""
+    queryset = ReadingRollup.objects.filter(sensor_id=sensor_id, resolution=resolution)
+    if start:
+        queryset = queryset.filter(bucket_start__gte=bucket_start(start, resolution))
+    if end:
+        queryset = queryset.filter(bucket_start__lt=end)
+    return queryset.order_by('bucket_start')
+
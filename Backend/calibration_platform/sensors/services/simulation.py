@@ -1,10 +1,12 @@
 import random
 from datetime import datetime
 from sensors.models import Sensor, Reading
+from .ingest_buffer import store_reading
 
-def generate_sensor_reading(sensor_id):
+def generate_sensor_reading(sensor_id, correct=None):
     """
-    Generates a simulated reading for a given sensor.
+    Generates a simulated reading for a given sensor. correct, if given,
+    maps the raw value to the corrected value stored with the reading.
     """
     try:
         sensor = Sensor.objects.get(id=sensor_id)
@@ -16,5 +18,9 @@ def generate_sensor_reading(sensor_id):
     noise = random.uniform(-5, 5)
     simulated_value = base_value + noise
 
-    reading = Reading.objects.create(sensor=sensor, raw_value=simulated_value, timestamp=datetime.now())
+    reading = Reading(sensor=sensor, raw_value=simulated_value, timestamp=datetime.now())
+    if correct is not None:
+        reading.corrected_value = correct(simulated_value)
+    # The simulate endpoint calibrates and scores the stored reading right away
+    store_reading(reading, detect_drift=False, wait_for_commit=True)
     return reading
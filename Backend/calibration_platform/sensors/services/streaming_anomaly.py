@@ -0,0 +1,90 @@
+import threading
+from collections import deque
+from django.utils import timezone
+from sensors.models import Reading
+from .anomaly import RECENT_WINDOW, classify_reading, record_anomaly
+
+
+def _key(timestamp, reading_id):
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp, reading_id
+
+
+class StreamingAnomalyDetector:
+    """
+    Anomaly rules of services/anomaly.py evaluated against an in-memory
+    window of each sensor's newest readings instead of a query per reading.
+
+    The rules only look at the last RECENT_WINDOW readings, so the window is
+    a bounded deque: every update and classification is constant work, and
+    the result is identical to detect_anomaly. A sensor's window is loaded
+    from the database the first time it is needed (e.g. after a restart) and
+    afterwards kept current by ingestion. A reading that arrives out of
+    timestamp order drops the window so it is reloaded in the right order.
+    """
+
+    def __init__(self, window=RECENT_WINDOW):
+        self.window = window
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def _load(self, sensor_id):
+        rows = (
+            Reading.objects.filter(sensor_id=sensor_id)
+            .order_by('-timestamp', '-id')
+            .values_list('timestamp', 'id', 'raw_value')[:self.window]
+        )
+        # Newest entry on the left, like the query result
+        return deque(((_key(ts, pk), value) for ts, pk, value in rows), maxlen=self.window)
+
+    def observe(self, readings):
+        """
+        Fold newly stored readings into the windows that are already loaded.
+        Sensors without a window are skipped; they load lazily when needed.
+        """
+        with self._lock:
+            for reading in sorted(readings, key=lambda r: _key(r.timestamp, r.id)):
+                window = self._windows.get(reading.sensor_id)
+                if window is None:
+                    continue
+                key = _key(reading.timestamp, reading.id)
+                if window and key <= window[0][0]:
+                    if len(window) == self.window and key < window[-1][0]:
+                        continue  # Too old to enter a full window
+                    # Lands inside the window: rebuild on next use
+                    if key != window[0][0]:
+                        del self._windows[reading.sensor_id]
+                    continue
+                window.appendleft((key, reading.raw_value))
+
+    def recent_values(self, sensor_id):
+        """Newest stored values of a sensor, newest first"""
+        with self._lock:
+            window = self._windows.get(sensor_id)
+            if window is None:
+                window = self._windows[sensor_id] = self._load(sensor_id)
+            return [value for _, value in window]
+
+    def classify(self, reading):
+        """Rule result for a stored reading: (anomaly_type, deviation, severity) or None"""
+        baseline = reading.sensor.value or 0
+        return classify_reading(reading.raw_value, baseline, self.recent_values(reading.sensor_id))
+
+    def detect(self, reading):
+        """Drop-in replacement for anomaly.detect_anomaly"""
+        result = self.classify(reading)
+        if result is None:
+            return None
+        record_anomaly(reading, result)
+        return result[0]
+
+    def reset(self, sensor_id=None):
+        with self._lock:
+            if sensor_id is None:
+                self._windows.clear()
+            else:
+                self._windows.pop(sensor_id, None)
+
+
+detector = StreamingAnomalyDetector()
@@ -0,0 +1,183 @@
+"""
+Parallel model training. Each (sensor, model type) pair is one task for a
+pool of worker processes. Workers are spawned, not forked, so they start
+without the parent's open DB connections, and this module does not import
+any models at import time because the workers unpickle its functions
+before Django is set up.
+"""
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# Result key -> ModelTrainer method, in the order results are reported
+TRAINING_TASKS = {
+    'anomaly_detection': 'train_anomaly_detection_model',
+    'drift_prediction': 'train_drift_prediction_model',
+    'calibration': 'train_calibration_model',
+}
+
+# Model type (as in the registry and the training API) -> TRAINING_TASKS key
+MODEL_TYPE_TASKS = {
+    'anomaly': 'anomaly_detection',
+    'drift': 'drift_prediction',
+    'calibration': 'calibration',
+}
+
+# A worker is replaced after this many tasks, so memory held on to by
+# numpy/sklearn after a large sensor is returned to the OS
+DEFAULT_MAX_TASKS_PER_CHILD = 20
+
+_trainer = None
+
+
+def _init_worker(memory_limit):
+    # One BLAS/OpenMP thread per worker; the pool already uses every core
+    for name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ.setdefault(name, '1')
+
+    import django
+    from django.db import connections
+
+    django.setup()
+    connections.close_all()
+
+    if memory_limit:
+        try:
+            import resource
+        except ImportError:  # Not available on Windows
+            return
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+@contextmanager
+def training_lock(sensor_id, model_type):
+    """
+    Exclusive lock on training one (sensor, model type), held on a lock file
+    so it also excludes other processes. Yields False when it is already
+    held. The OS releases it if the holder dies.
+    """
+    from django.conf import settings
+
+    lock_dir = os.path.join(settings.BASE_DIR, 'trained_models', '.locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, f'{sensor_id or "all"}_{model_type}.lock'), 'a') as lock_file:
+        try:
+            _lock_file(lock_file)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            _unlock_file(lock_file)
+
+
+try:
+    import fcntl
+
+    def _lock_file(lock_file):
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock_file(lock_file):
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(lock_file):
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock_file(lock_file):
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _run_task(sensor_id, model_type, incremental=True):
+    """Train one model, in a worker or in-process. Returns (result, seconds)"""
+    global _trainer
+    if _trainer is None:
+        from .model_training import ModelTrainer
+        _trainer = ModelTrainer()
+
+    started = time.perf_counter()
+    with training_lock(sensor_id, model_type) as locked:
+        if not locked:
+            result = {"status": "skipped", "message": "Already being trained by another process"}
+        else:
+            try:
+                result = getattr(_trainer, TRAINING_TASKS[model_type])(sensor_id, incremental=incremental)
+            except MemoryError:
+                result = {"status": "error", "message": "Training failed: worker memory limit exceeded"}
+    return result, time.perf_counter() - started
+
+
+def train_tasks(tasks, workers=None, progress=None, incremental=True):
+    """
+    Train [(sensor_id, model_type), ...], in order, with up to workers
+    processes (settings.MODEL_TRAINING_WORKERS by default; 1 trains
+    in-process). Tasks of a single sensor always train in-process, where
+    spawning workers would cost more than it saves. Returns
+    {(sensor_id, model_type): (result, seconds)} like train_in_pool.
+    incremental=False refits every model on its full history.
+    """
+    from django.conf import settings
+
+    if workers is None:
+        workers = getattr(settings, 'MODEL_TRAINING_WORKERS', None) or os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    if workers > 1 and len({sensor_id for sensor_id, _ in tasks}) > 1:
+        return train_in_pool(
+            tasks,
+            workers,
+            memory_limit=getattr(settings, 'MODEL_TRAINING_WORKER_MEMORY', None),
+            progress=progress,
+            incremental=incremental,
+        )
+
+    outcomes = {}
+    for task in tasks:
+        outcomes[task] = _run_task(*task, incremental=incremental)
+        if progress:
+            progress(len(outcomes), len(tasks), *task, *outcomes[task])
+    return outcomes
+
+
+def train_in_pool(tasks, workers, memory_limit=None, max_tasks_per_child=DEFAULT_MAX_TASKS_PER_CHILD, progress=None,
+                  incremental=True):
+    """
+    Run [(sensor_id, model_type), ...] on a pool of worker processes and
+    return {(sensor_id, model_type): (result, seconds)}. Tasks are submitted
+    in the given order, so put the slowest first. progress, if given, is
+    called as progress(done, total, sensor_id, model_type, result, seconds)
+    as tasks finish.
+    """
+    from django.db import connections
+
+    # Spawned workers open their own connections; close ours so nothing is
+    # held across the (long) pool run
+    connections.close_all()
+
+    outcomes = {}
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(memory_limit,),
+        max_tasks_per_child=max_tasks_per_child,
+    ) as pool:
+        futures = {pool.submit(_run_task, *task, incremental): task for task in tasks}
+        for future in as_completed(futures):
+            sensor_id, model_type = futures[future]
+            try:
+                result, seconds = future.result()
+            except BrokenProcessPool:
+                result, seconds = {"status": "error", "message": "Training failed: worker process died"}, 0.0
+            except Exception as e:
+                result, seconds = {"status": "error", "message": f"Training failed: {str(e)}"}, 0.0
+            outcomes[(sensor_id, model_type)] = (result, seconds)
+            if progress:
+                progress(len(outcomes), len(tasks), sensor_id, model_type, result, seconds)
+    return outcomes
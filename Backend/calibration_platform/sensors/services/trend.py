@@ -0,0 +1,155 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from sensors.models import Reading, DriftTrend
+
+REBUILD_CHUNK_SIZE = 50000
+
+
+def _key(timestamp, reading_id):
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp, reading_id
+
+
+def _index_spread(n):
+    """Sum of squared deviations of the indexes 0..n-1 from their mean"""
+    return n * (n * n - 1) / 12
+
+
+def fold(trend, values):
+    """
+    Append values, in index order, to a trend's running state. Batches are
+    merged with the pairwise update for co-moments, which stays accurate for
+    long histories where the raw sums (n, Σx, Σy, Σxy, Σx²) would cancel.
+    """
+    k = len(values)
+    if not k:
+        return
+    values = np.asarray(values, dtype=np.float64)
+    batch_mean = float(values.mean())
+    batch_co_moment = float(np.dot(np.arange(k) - (k - 1) / 2, values - batch_mean))
+
+    n_a = trend.count
+    n = n_a + k
+    if n_a == 0:
+        trend.mean_value = batch_mean
+        trend.co_moment = batch_co_moment
+    else:
+        # The batch's indexes start right after the existing ones, so the
+        # difference of the index means is n / 2
+        delta_value = batch_mean - trend.mean_value
+        trend.co_moment += batch_co_moment + (n / 2) * delta_value * n_a * k / n
+        trend.mean_value += delta_value * k / n
+    trend.count = n
+    trend.last_value = float(values[-1])
+
+
+def slope(trend):
+    """Least-squares slope of value per reading"""
+    if trend.count < 2:
+        return 0.0
+    return trend.co_moment / _index_spread(trend.count)
+
+
+def intercept(trend):
+    """Least-squares value at index 0"""
+    return trend.mean_value - slope(trend) * (trend.count - 1) / 2
+
+
+def _fold_rows(trend, rows):
+    """Fold (timestamp, id, value) rows, already in order, in chunks"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= REBUILD_CHUNK_SIZE:
+            _fold_chunk(trend, chunk)
+            chunk = []
+    if chunk:
+        _fold_chunk(trend, chunk)
+
+
+def _fold_chunk(trend, rows):
+    fold(trend, [value for _, _, value in rows])
+    trend.last_timestamp, trend.last_reading_id = rows[-1][0], rows[-1][1]
+
+
+def _reset(trend):
+    trend.count = 0
+    trend.mean_value = 0.0
+    trend.co_moment = 0.0
+    trend.last_value = None
+    trend.last_timestamp = None
+    trend.last_reading_id = None
+    trend.stale = False
+
+
+def update_trends(readings):
+    """
+    Fold newly stored readings into the trends of their sensors. Called on
+    ingest inside the transaction that inserted them. A reading older than a
+    trend's newest one shifts every later index, so that trend is only
+    flagged and rebuilt on its next read.
+    """
+    by_sensor = {}
+    for reading in readings:
+        by_sensor.setdefault(reading.sensor_id, []).append(reading)
+
+    changed = []
+    trends = DriftTrend.objects.select_for_update().filter(sensor_id__in=by_sensor, stale=False)
+    for trend in trends:
+        batch = sorted(by_sensor[trend.sensor_id], key=lambda r: _key(r.timestamp, r.id))
+        if trend.last_reading_id is not None and (
+            _key(batch[0].timestamp, batch[0].id) <= _key(trend.last_timestamp, trend.last_reading_id)
+        ):
+            trend.stale = True
+        else:
+            _fold_chunk(trend, [(r.timestamp, r.id, r.raw_value) for r in batch])
+        changed.append(trend)
+
+    if changed:
+        DriftTrend.objects.bulk_update(changed, [
+            'count', 'mean_value', 'co_moment', 'last_value',
+            'last_timestamp', 'last_reading_id', 'stale', 'updated_at',
+        ])
+
+
+def get_trend(sensor):
+    """
+    Current trend of a sensor. Built from the full history the first time
+    or after an out-of-order reading; otherwise only readings newer than the
+    trend's watermark (normally none) are read.
+    """
+    with transaction.atomic():
+        trend, created = DriftTrend.objects.select_for_update().get_or_create(sensor=sensor)
+        readings = Reading.objects.filter(sensor=sensor)
+        rebuild = created or trend.stale
+        if rebuild:
+            _reset(trend)
+        elif trend.last_reading_id is not None:
+            ts, reading_id = trend.last_timestamp, trend.last_reading_id
+            readings = readings.filter(Q(timestamp__gte=ts) & (Q(timestamp__gt=ts) | Q(id__gt=reading_id)))
+
+        count = trend.count
+        _fold_rows(
+            trend,
+            readings.order_by('timestamp', 'id')
+            .values_list('timestamp', 'id', 'raw_value')
+            .iterator(chunk_size=REBUILD_CHUNK_SIZE),
+        )
+        if rebuild or trend.count != count:
+            trend.save()
+    return trend
+
+
+def forecast(sensor, future_points):
+    """
+    Next future_points values on the sensor's linear trend, continuing from
+    its last reading. None when there are fewer than 3 readings.
+    """
+    trend = get_trend(sensor)
+    if trend.count < 3:
+        return None
+    step = slope(trend)
+    return [trend.last_value + step * (i + 1) for i in range(future_points)]
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Calibration
+from .services.calibration_fit import invalidate, record_calibration
+
+
+@receiver(post_save, sender=Calibration)
+def calibration_saved(sender, instance, created, raw=False, **kwargs):
+    # Fixture rows may arrive out of id order, so they are rebuilt from
+    # rather than folded in
+    if created and not raw:
+        record_calibration(instance)
+    else:
+        invalidate(instance.sensor_id)
+
+
+@receiver(post_delete, sender=Calibration)
+def calibration_deleted(sender, instance, **kwargs):
+    invalidate(instance.sensor_id)
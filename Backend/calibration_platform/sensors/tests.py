@@ -1,3 +1,1729 @@
-from django.test import TestCase
+import asyncio
+import base64
+import copy
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import joblib
+from sklearn.ensemble import IsolationForest
+from sklearn.linear_model import LinearRegression
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import (
+    Anomaly, AnalyticsSnapshot, DriftForecast, Sensor, Reading, Calibration, CalibrationFit, DriftTrend, TrainedModel,
+)
+from .services import (
+    analytics_snapshot, anomaly_ml, batch_scoring, calibration_fit, dashboard, downsampling, fleet_forecast, history,
+    ingest_buffer, live_updates, streaming_anomaly, training_pool,
+)
+from .services.anomaly import classify_reading, detect_anomaly, recent_values
+from .services.compiled_forest import CompiledIsolationForest, compiled_path
+from .services.enhanced_ml_services import EnhancedMLServices
+from .services.incremental_training import refresh_isolation_forest, weighted_quantile
+from .services.ingestion import MAX_BATCH_SIZE, persist_readings
+from .services.ml_analytics import MLAnalyticsService
+from .services.model_cache import ModelCache
+from .services.model_registry import count_recent_models
+from .services.model_training import ModelTrainer, save_model
+from .services.reading_arrays import datetime64_array, load_readings, load_readings_by_sensor
+from .services.retraining import RetrainingScheduler, retraining_config
+from .services.trend import fold, get_trend, intercept, slope
+
+
+class DriftTrendParityTests(TestCase):
+    """The running trend accumulators must agree with np.polyfit over the same readings"""
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name="Trend Sensor", type="Temperature", value=25.0, unit="C")
+        self.start = timezone.now() - timedelta(days=1)
+        self.rng = np.random.default_rng(7)
+
+    def _ingest(self, offsets):
+        values = 25 + 0.01 * np.asarray(offsets) + self.rng.normal(0, 0.5, len(offsets))
+        persist_readings([
+            Reading(sensor=self.sensor, raw_value=float(v), timestamp=self.start + timedelta(seconds=int(s)))
+            for s, v in zip(offsets, values)
+        ], detect_drift=False)
+
+    def _polyfit(self):
+        values = list(
+            Reading.objects.filter(sensor=self.sensor)
+            .order_by('timestamp', 'id')
+            .values_list('raw_value', flat=True)
+        )
+        return np.polyfit(np.arange(len(values)), values, 1)
+
+    def assertMatchesPolyfit(self, trend):
+        expected_slope, expected_intercept = self._polyfit()
+        self.assertAlmostEqual(slope(trend), expected_slope, delta=abs(expected_slope) * 1e-9)
+        self.assertAlmostEqual(intercept(trend), expected_intercept, delta=abs(expected_intercept) * 1e-9)
+
+    def test_fold_in_batches_matches_polyfit(self):
+        values = 100 + 0.001 * np.arange(200_000) + self.rng.normal(0, 3, 200_000)
+        trend = DriftTrend(sensor=self.sensor)
+        for chunk in np.array_split(values, 37):
+            fold(trend, chunk)
+
+        expected_slope, expected_intercept = np.polyfit(np.arange(len(values)), values, 1)
+        self.assertAlmostEqual(slope(trend), expected_slope, delta=abs(expected_slope) * 1e-9)
+        self.assertAlmostEqual(intercept(trend), expected_intercept, delta=abs(expected_intercept) * 1e-9)
+        self.assertEqual(trend.count, len(values))
+        self.assertEqual(trend.last_value, values[-1])
+
+    def test_trend_is_updated_on_ingest(self):
+        self._ingest(range(0, 500))
+        trend = get_trend(self.sensor)
+        self.assertMatchesPolyfit(trend)
+
+        self._ingest(range(500, 800))
+        trend.refresh_from_db()
+        self.assertEqual(trend.count, 800)
+        self.assertFalse(trend.stale)
+        self.assertMatchesPolyfit(trend)
+
+    def test_out_of_order_reading_triggers_rebuild(self):
+        self._ingest(range(0, 1000, 2))
+        get_trend(self.sensor)
+
+        self._ingest([501])
+        self.assertTrue(DriftTrend.objects.get(sensor=self.sensor).stale)
+        self.assertMatchesPolyfit(get_trend(self.sensor))
+
+
+class DriftAccuracyTests(TestCase):
+    """Drift accuracy averages each sensor's per-reading absolute drift from its baseline"""
+
+    def _create(self, name, value, readings, days_ago=0):
+        sensor = Sensor.objects.create(name=name, type="Temperature", value=value, unit="C")
+        timestamp = timezone.now() - timedelta(days=days_ago, hours=1)
+        persist_readings([
+            Reading(sensor=sensor, raw_value=float(v), timestamp=timestamp + timedelta(seconds=i))
+            for i, v in enumerate(readings)
+        ], detect_drift=False)
+        return sensor
+
+    def test_matches_per_reading_drift(self):
+        rng = np.random.default_rng(11)
+        with_value = 25 + rng.normal(0, 1, 300)
+        without_value = 40 + rng.normal(0, 2, 300)
+        self._create("Valued", 25.0, with_value)
+        self._create("Unvalued", 0.0, without_value)
+        self._create("Sparse", 25.0, [100.0] * 5)
+        self._create("Old", 25.0, [100.0] * 50, days_ago=8)
+
+        baseline = without_value.mean()
+        expected = np.mean([
+            np.mean(np.abs((with_value - 25.0) / 25.0 * 100)),
+            np.mean(np.abs((without_value - baseline) / baseline * 100)),
+        ])
+        self.assertAlmostEqual(MLAnalyticsService()._calculate_drift_accuracy(), 100.0 - expected, places=9)
+
+    def test_default_without_recent_readings(self):
+        self._create("Old", 25.0, [30.0] * 50, days_ago=8)
+        self.assertEqual(MLAnalyticsService()._calculate_drift_accuracy(), 92.0)
+
+
+class RawDownsamplingTests(TestCase):
+    """The raw fallback of downsample_history reads columnar arrays and refuses oversized windows"""
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name="Chart Sensor", type="Temperature", value=25.0, unit="C")
+        self.start = timezone.now() - timedelta(hours=1)
+        values = 25 + np.random.default_rng(3).normal(0, 1, 1000)
+        persist_readings([
+            Reading(sensor=self.sensor, raw_value=float(v), timestamp=self.start + timedelta(milliseconds=500 * i))
+            for i, v in enumerate(values)
+        ], detect_drift=False)
+        self.end = self.start + timedelta(minutes=10)
+
+    def test_matches_downsample_of_orm_rows(self):
+        rows = list(
+            Reading.objects.filter(sensor=self.sensor).order_by('timestamp').values_list('timestamp', 'raw_value')
+        )
+        x = np.array([ts.timestamp() for ts, _ in rows])
+        y = np.array([value for _, value in rows])
+        for method, downsample in (('lttb', downsampling.lttb), ('minmax', downsampling.minmax_buckets)):
+            points, source = downsampling.downsample_history(self.sensor, self.start, self.end, 50, method)
+            self.assertEqual(source, 'raw')
+            self.assertEqual(
+                [(p["timestamp"], p["value"]) for p in points],
+                [rows[i] for i in downsample(x, y, 50)],
+            )
+
+    def test_oversized_window_is_refused(self):
+        with mock.patch.object(downsampling, 'MAX_RAW_READINGS', 999):
+            with self.assertRaises(downsampling.WindowTooLarge):
+                downsampling.downsample_history(self.sensor, self.start, self.end, 50)
+            response = self.client.get('/api/readings/history/', {
+                'sensor_name': self.sensor.name, 'max_points': 50,
+                'from': self.start.isoformat(), 'to': self.end.isoformat(),
+            })
+        self.assertEqual(response.status_code, 400)
+
+
+class DashboardSnapshotTests(TestCase):
+    """Ingest keeps the per-sensor dashboard entries current without rewriting the others"""
+
+    def setUp(self):
+        cache.clear()
+        self.sensors = [
+            Sensor.objects.create(name=f"Dashboard {i}", type="Temperature", value=25.0, unit="C")
+            for i in range(3)
+        ]
+        self.now = timezone.now()
+        for i, sensor in enumerate(self.sensors):
+            self._ingest(sensor, 20.0 + i, self.now - timedelta(minutes=5))
+
+    def _ingest(self, sensor, value, timestamp):
+        # The snapshot is updated once the readings are committed
+        with self.captureOnCommitCallbacks(execute=True):
+            persist_readings([Reading(sensor=sensor, raw_value=value, timestamp=timestamp)], detect_drift=False)
+
+    def test_ingest_updates_only_its_sensor(self):
+        dashboard.get_latest_snapshot()
+        with mock.patch.object(dashboard.cache, 'set_many', wraps=dashboard.cache.set_many) as set_many:
+            self._ingest(self.sensors[1], 99.0, self.now)
+            # An older reading does not replace the newer entry
+            self._ingest(self.sensors[2], 50.0, self.now - timedelta(hours=1))
+        self.assertEqual(list(set_many.call_args_list[0].args[0]), [dashboard._sensor_key(self.sensors[1].id)])
+        self.assertEqual(set_many.call_args_list[1].args[0], {})
+
+        snapshot = dashboard.get_latest_snapshot()
+        self.assertEqual(snapshot, dashboard.load_latest_readings())
+        self.assertEqual(snapshot[self.sensors[1].id]['data']['raw_value'], 99.0)
+        self.assertEqual(snapshot[self.sensors[2].id]['data']['raw_value'], 22.0)
+
+    def test_missing_entry_or_new_sensor_rebuilds(self):
+        dashboard.get_latest_snapshot()
+        cache.delete(dashboard._sensor_key(self.sensors[0].id))
+        self.assertEqual(dashboard.get_latest_snapshot(), dashboard.load_latest_readings())
+
+        sensor = Sensor.objects.create(name="Dashboard new", type="Temperature", value=25.0, unit="C")
+        self._ingest(sensor, 30.0, self.now)
+        self.assertIsNone(cache.get(dashboard.SNAPSHOT_CACHE_KEY))
+        self.assertIn(sensor.id, dashboard.get_latest_snapshot())
+
+
+class BatchAnomalyScoringTests(TestCase):
+    """A sensor whose model fails to score falls back to basic detection without failing the batch"""
+
+    def test_failing_model_falls_back_per_sensor(self):
+        broken = Sensor.objects.create(name="Broken model", type="Temperature", value=25.0, unit="C")
+        working = Sensor.objects.create(name="Working model", type="Temperature", value=25.0, unit="C")
+
+        def load_anomaly_model(service, sensor):
+            model = mock.Mock()
+            if sensor == broken:
+                model.decision_function.side_effect = ValueError("feature mismatch")
+            else:
+                model.decision_function.side_effect = lambda features: np.full(len(features), -0.25)
+            return model
+
+        with mock.patch.object(batch_scoring.EnhancedMLServices, 'load_anomaly_model', load_anomaly_model):
+            results = batch_scoring.score_anomalies_batch([
+                {"sensor_id": broken.id, "reading_value": 40.0},
+                {"sensor_id": working.id, "reading_value": 25.0},
+                {"sensor_id": broken.id, "reading_value": 25.0},
+            ])
+
+        self.assertEqual([r['model_used'] for r in results],
+                         ['basic_threshold', 'trained_isolation_forest', 'basic_threshold'])
+        self.assertEqual([r['is_anomaly'] for r in results], [True, True, False])
+        self.assertEqual(results[1]['anomaly_score'], -0.25)
+
+
+class TrainingDispatchTests(TestCase):
+    """Only fleet-wide training goes to the worker pool; a single sensor trains in-process, under the lock"""
+
+    def setUp(self):
+        self.sensors = [
+            Sensor.objects.create(name=f"Training {i}", type="Temperature", value=25.0, unit="C")
+            for i in range(2)
+        ]
+
+    def _train(self, sensor_id=None):
+        def run_task(sensor_id, model_type, incremental=True):
+            return {"status": "success", "message": "inline"}, 0.0
+
+        def train_in_pool(tasks, workers, **kwargs):
+            return {task: ({"status": "success", "message": "pool"}, 0.0) for task in tasks}
+
+        with mock.patch.object(training_pool, '_run_task', side_effect=run_task) as inline, \
+                mock.patch.object(training_pool, 'train_in_pool', side_effect=train_in_pool) as pool:
+            results = ModelTrainer().train_all_models(sensor_id, workers=4)
+        return results, inline, pool
+
+    def test_single_sensor_trains_inline(self):
+        results, inline, pool = self._train(self.sensors[0].id)
+        pool.assert_not_called()
+        self.assertEqual(inline.call_count, len(training_pool.TRAINING_TASKS))
+        self.assertEqual(
+            {result['message'] for result in results[self.sensors[0].name].values()}, {"inline"}
+        )
+
+    def test_all_sensors_use_the_pool(self):
+        results, inline, pool = self._train()
+        inline.assert_not_called()
+        self.assertEqual(pool.call_count, 1)
+        self.assertEqual(len(pool.call_args.args[0]), len(self.sensors) * len(training_pool.TRAINING_TASKS))
+        self.assertEqual(pool.call_args.args[1], 4)
+        self.assertEqual(set(results), {sensor.name for sensor in self.sensors})
+
+    def test_single_model_type_trains_under_the_lock(self):
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        with override_settings(BASE_DIR=models_dir.name), \
+                mock.patch.object(ModelTrainer, 'train_drift_prediction_model',
+                                  return_value={"status": "success", "message": "trained"}) as train:
+            sensor_id = self.sensors[0].id
+            with training_pool.training_lock(sensor_id, 'drift_prediction') as locked:
+                self.assertTrue(locked)
+                busy = self.client.post('/api/ml/train/', {'sensor_id': sensor_id, 'model_type': 'drift'},
+                                        content_type='application/json')
+                # Other models of the sensor are not held up
+                other = ModelTrainer().train_model(sensor_id, 'anomaly')
+            train.assert_not_called()
+            self.assertEqual(busy.status_code, 409)
+            self.assertEqual(busy.json()["status"], "skipped")
+            self.assertNotEqual(other["status"], "skipped")
+
+            response = self.client.post('/api/ml/train/', {'sensor_id': sensor_id, 'model_type': 'drift'},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["message"], "trained")
+            self.assertIn("training_seconds", response.json())
+            train.assert_called_once_with(sensor_id, incremental=True)
+
+        invalid = self.client.post('/api/ml/train/', {'sensor_id': sensor_id, 'model_type': 'forest'},
+                                   content_type='application/json')
+        self.assertEqual(invalid.status_code, 400)
+
+
+class ReadingArraysParityTests(TestCase):
+    """Columnar reading loads must return what the equivalent ORM queries return"""
+
+    def setUp(self):
+        self.sensors = [
+            Sensor.objects.create(name=f"Columnar {i}", type="Temperature", value=25.0, unit="C")
+            for i in range(3)
+        ]
+        self.start = timezone.now() - timedelta(days=2)
+        rng = np.random.default_rng(5)
+        readings = []
+        for sensor in self.sensors[:2]:
+            # Out of insertion order, with pairs of equal timestamps broken by id
+            for offset in rng.permutation(400):
+                readings.append(Reading(
+                    sensor=sensor,
+                    raw_value=float(rng.normal(25, 2)),
+                    timestamp=self.start + timedelta(minutes=int(offset) // 2, microseconds=int(offset) // 2 % 7),
+                ))
+        persist_readings(readings, detect_drift=False)
+
+    def assertMatchesRows(self, arrays, queryset):
+        rows = list(queryset.values_list('timestamp', 'raw_value', 'id'))
+        timestamps, values, ids = arrays
+        np.testing.assert_array_equal(timestamps, datetime64_array([row[0] for row in rows]))
+        np.testing.assert_array_equal(values, np.array([row[1] for row in rows]))
+        np.testing.assert_array_equal(ids, np.array([row[2] for row in rows], dtype=np.int64))
+
+    def test_load_readings_matches_orm(self):
+        sensor = self.sensors[0]
+        readings = Reading.objects.filter(sensor=sensor)
+        start, end = self.start + timedelta(minutes=30), self.start + timedelta(minutes=120)
+
+        self.assertMatchesRows(load_readings(sensor, with_ids=True), readings.order_by('timestamp', 'id'))
+        self.assertMatchesRows(
+            load_readings(sensor.id, start=start, end=end, with_ids=True),
+            readings.filter(timestamp__gte=start, timestamp__lte=end).order_by('timestamp', 'id'),
+        )
+        self.assertMatchesRows(
+            load_readings(sensor, limit=50, descending=True, with_ids=True),
+            readings.order_by('-timestamp', '-id')[:50],
+        )
+        timestamps, values = load_readings(self.sensors[2])
+        self.assertEqual((len(timestamps), len(values)), (0, 0))
+
+    def test_load_readings_by_sensor_matches_orm(self):
+        by_sensor = load_readings_by_sensor([sensor.id for sensor in self.sensors], with_ids=True)
+        self.assertEqual(set(by_sensor), {sensor.id for sensor in self.sensors[:2]})
+        for sensor in self.sensors[:2]:
+            self.assertMatchesRows(
+                by_sensor[sensor.id], Reading.objects.filter(sensor=sensor).order_by('timestamp', 'id')
+            )
+
+
+class RetrainingSchedulerTests(TestCase):
+    """Due jobs come out by priority band, then urgency; failed jobs wait for new data"""
+
+    def setUp(self):
+        self.config = {
+            **retraining_config(),
+            'MIN_NEW_READINGS': 100, 'MIN_NEW_CALIBRATIONS': 2, 'MIN_DRIFT_READINGS': 50, 'DRIFT_THRESHOLD': 0.5,
+        }
+        self.start = timezone.now() - timedelta(days=1)
+
+        # Never trained
+        self.untrained = self._sensor("Untrained")
+        self._ingest(self.untrained, [25.0] * 30)
+        self._calibrate(self.untrained, 6)
+
+        # Trained, then its readings moved 5 std away
+        self.shifted = self._sensor("Shifted")
+        watermark = self._ingest(self.shifted, [25.0] * 20)
+        self._train(self.shifted, 'anomaly', watermark)
+        self._train(self.shifted, 'drift', watermark)
+        self._train(self.shifted, 'calibration', self._calibrate(self.shifted, 5))
+        self._ingest(self.shifted, [30.0] * 60)
+        self._calibrate(self.shifted, 2)
+
+        # Anomaly and drift models trained up to different readings
+        self.busy = self._sensor("Busy")
+        self._train(self.busy, 'anomaly', self._ingest(self.busy, [25.0]))
+        self._train(self.busy, 'drift', self._ingest(self.busy, [25.0] * 49))
+        self._ingest(self.busy, [25.0] * 150)
+        self._train(self.busy, 'calibration', self._calibrate(self.busy, 5))
+
+    def _sensor(self, name):
+        return Sensor.objects.create(name=name, type="Temperature", value=25.0, unit="C")
+
+    def _ingest(self, sensor, values):
+        """Store readings and return the newest id"""
+        readings = [
+            Reading(sensor=sensor, raw_value=value, timestamp=self.start + timedelta(seconds=i))
+            for i, value in enumerate(values)
+        ]
+        persist_readings(readings, detect_drift=False)
+        return Reading.objects.filter(sensor=sensor).latest('id').id
+
+    def _calibrate(self, sensor, count):
+        for _ in range(count):
+            calibration = Calibration.objects.create(sensor=sensor, method='linear', corrected_value=25.0)
+        return calibration.id
+
+    def _train(self, sensor, model_type, watermark):
+        TrainedModel.objects.create(
+            sensor=sensor, model_type=model_type, version=1, path='model.joblib', size_bytes=0,
+            metrics={'value_mean': 25.0, 'value_std': 1.0}, data_watermark=watermark,
+        )
+
+    def _jobs(self, jobs):
+        return [(job['sensor_name'], job['model_type']) for job in jobs]
+
+    def test_plan_orders_by_band_then_urgency(self):
+        with self.assertNumQueries(5):
+            jobs = RetrainingScheduler(self.config).plan()
+        self.assertEqual(self._jobs(jobs), [
+            ("Untrained", 'anomaly'), ("Untrained", 'drift'), ("Untrained", 'calibration'),
+            ("Shifted", 'anomaly'), ("Shifted", 'drift'),
+            ("Busy", 'anomaly'), ("Busy", 'drift'), ("Shifted", 'calibration'),
+        ])
+        self.assertEqual(
+            [job['reason'] for job in jobs[3:]],
+            [
+                'mean shifted by 5.00 std over 60 new readings', 'mean shifted by 5.00 std over 60 new readings',
+                '199 new readings', '150 new readings', '2 new calibrations',
+            ],
+        )
+
+    def test_failed_job_waits_for_new_data(self):
+        scheduler = RetrainingScheduler(self.config)
+
+        def train_tasks(tasks, workers, progress=None):
+            return {
+                task: ({"status": "error" if task == (self.untrained.id, 'anomaly_detection') else "success",
+                        "message": ""}, 0.0)
+                for task in tasks
+            }
+
+        with mock.patch('sensors.services.retraining.train_tasks', side_effect=train_tasks):
+            scheduler.run()
+        # Nothing was actually trained, so every job but the failed one is still due
+        self.assertNotIn(("Untrained", 'anomaly'), self._jobs(scheduler.plan()))
+        self.assertIn(("Untrained", 'drift'), self._jobs(scheduler.plan()))
+
+        self._ingest(self.untrained, [25.0])
+        self.assertEqual(self._jobs(scheduler.plan())[0], ("Untrained", 'anomaly'))
+
+
+class IncrementalTrainingParityTests(TestCase):
+    """Updating a regression model with new data must give the model a full refit gives"""
+
+    def setUp(self):
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        settings_override = override_settings(BASE_DIR=models_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.sensor = Sensor.objects.create(name="Incremental", type="Temperature", value=25.0, unit="C")
+        self.start = timezone.now() - timedelta(days=2)
+        self.rng = np.random.default_rng(13)
+        self.count = 0
+
+    def _ingest(self, count):
+        offsets = np.arange(self.count, self.count + count)
+        values = 25 + 0.002 * offsets + self.rng.normal(0, 0.5, count)
+        persist_readings([
+            Reading(sensor=self.sensor, raw_value=float(v), timestamp=self.start + timedelta(seconds=10 * int(i)))
+            for i, v in zip(offsets, values)
+        ], detect_drift=False)
+        self.count += count
+
+    def _calibrate(self, count):
+        """Calibrations between the readings, each correcting the recent ones"""
+        for _ in range(count):
+            applied_at = self.start + timedelta(seconds=float(self.rng.uniform(60, 10 * self.count)))
+            calibration = Calibration.objects.create(
+                sensor=self.sensor, method='linear', corrected_value=float(self.rng.normal(26, 1))
+            )
+            Calibration.objects.filter(id=calibration.id).update(applied_at=applied_at)
+
+    def assertSameModel(self, updated, refit):
+        self.assertTrue(updated.get('incremental'))
+        self.assertFalse(refit.get('incremental'))
+        self.assertEqual(updated['training_samples'], refit['training_samples'])
+        self.assertAlmostEqual(updated['mse'], refit['mse'], delta=refit['mse'] * 1e-6)
+        updated_model, refit_model = joblib.load(updated['model_path']), joblib.load(refit['model_path'])
+        np.testing.assert_allclose(updated_model.coef_, refit_model.coef_, rtol=1e-6, atol=1e-12)
+        self.assertAlmostEqual(
+            updated_model.intercept_, refit_model.intercept_, delta=abs(refit_model.intercept_) * 1e-6
+        )
+
+    def test_drift_update_matches_refit(self):
+        trainer = ModelTrainer()
+        self._ingest(300)
+        self.assertEqual(trainer.train_drift_prediction_model(self.sensor.id)['status'], 'success')
+        self._ingest(200)
+        updated = trainer.train_drift_prediction_model(self.sensor.id)
+        updated_metrics = TrainedModel.objects.get(sensor=self.sensor, model_type='drift', is_active=True).metrics
+
+        refit = trainer.train_drift_prediction_model(self.sensor.id, incremental=False)
+        refit_metrics = TrainedModel.objects.get(sensor=self.sensor, model_type='drift', is_active=True).metrics
+        self.assertSameModel(updated, refit)
+        for name in ('value_mean', 'value_std'):
+            self.assertAlmostEqual(updated_metrics[name], refit_metrics[name], places=9)
+
+    def test_calibration_update_matches_refit(self):
+        trainer = ModelTrainer()
+        self._ingest(500)
+        self._calibrate(10)
+        self.assertEqual(trainer.train_calibration_model(self.sensor.id)['status'], 'success')
+        self._calibrate(15)
+        updated = trainer.train_calibration_model(self.sensor.id)
+
+        refit = trainer.train_calibration_model(self.sensor.id, incremental=False)
+        self.assertSameModel(updated, refit)
+
+
+class IsolationForestRefreshTests(TestCase):
+    """A refreshed forest keeps its size, its compiled copy and a threshold fit to its whole history"""
+
+    def setUp(self):
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        settings_override = override_settings(BASE_DIR=models_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.sensor = Sensor.objects.create(name="Forest", type="Temperature", value=25.0, unit="C")
+        self.start = timezone.now() - timedelta(days=2)
+        self.rng = np.random.default_rng(21)
+        self.count = 0
+
+    def _ingest(self, count, mean=25.0):
+        persist_readings([
+            Reading(sensor=self.sensor, raw_value=float(v), timestamp=self.start + timedelta(minutes=self.count + i))
+            for i, v in enumerate(self.rng.normal(mean, 0.5, count))
+        ], detect_drift=False)
+        self.count += count
+
+    def _features(self, n, mean):
+        return np.column_stack([
+            self.rng.normal(mean, 0.5, n), self.rng.integers(0, 24, n), self.rng.integers(0, 7, n)
+        ]).astype(np.float64)
+
+    def test_update_keeps_trees_and_compiled_parity(self):
+        trainer = ModelTrainer()
+        self._ingest(600)
+        self.assertEqual(trainer.train_anomaly_detection_model(self.sensor.id)['status'], 'success')
+        self._ingest(150, mean=26.0)
+        result = trainer.train_anomaly_detection_model(self.sensor.id)
+        self.assertTrue(result['incremental'])
+        self.assertEqual(result['replaced_trees'], 20)
+
+        model = joblib.load(result['model_path'])
+        self.assertEqual(model.n_estimators, 100)
+        for trees in (model.estimators_, model.estimators_features_, model._decision_path_lengths,
+                      model._average_path_length_per_tree):
+            self.assertEqual(len(trees), 100)
+
+        X = np.vstack([self._features(300, 25.0), self._features(300, 26.0), self._features(50, 30.0)])
+        compiled = CompiledIsolationForest.load(compiled_path(result['model_path']))
+        np.testing.assert_allclose(compiled.decision_function(X), model.decision_function(X), rtol=0, atol=1e-12)
+        np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
+
+    def test_retained_sample_spans_the_history(self):
+        self._ingest(600)
+        trainer = ModelTrainer()
+        trainer.train_anomaly_detection_model(self.sensor.id)
+        self._ingest(50)
+        previous = TrainedModel.objects.get(sensor=self.sensor, model_type='anomaly', is_active=True)
+
+        values = list(Reading.objects.filter(sensor=self.sensor).order_by('timestamp', 'id')
+                      .values_list('raw_value', flat=True))
+        with mock.patch('sensors.services.model_training.FOREST_OFFSET_SAMPLES', 100):
+            sample = trainer._retained_sample(previous)
+        self.assertEqual(sample.shape, (100, 3))
+        self.assertEqual(sample[:, 0].tolist(), values[5:600:6])
+        self.assertEqual(len(trainer._retained_sample(previous)), 600)
+
+    def test_threshold_mixes_retained_and_recent_data(self):
+        history, recent = self._features(600, 25.0), self._features(256, 27.0)
+        model = IsolationForest(contamination=0.1, random_state=42).fit(history)
+        trained_on = np.vstack([history, recent[:150]])
+
+        rebased = refresh_isolation_forest(copy.deepcopy(model), recent, 20)
+        mixed = refresh_isolation_forest(copy.deepcopy(model), recent, 20, retained=history)
+        np.testing.assert_allclose(
+            rebased.score_samples(trained_on), mixed.score_samples(trained_on), rtol=0, atol=1e-12
+        )
+        # The offset is the contamination quantile of both samples, weighted by their share of the trees
+        scores = np.concatenate([mixed.score_samples(history), mixed.score_samples(recent)])
+        weights = np.concatenate([np.full(600, 80 / 600), np.full(256, 20 / 256)])
+        self.assertEqual(mixed.offset_, weighted_quantile(scores, weights, 0.1))
+        self.assertLess(weights[scores < mixed.offset_].sum() / weights.sum(), 0.1)
+        self.assertGreaterEqual(weights[scores <= mixed.offset_].sum() / weights.sum(), 0.1)
+
+        # Re-based on the shifted recent rows alone, far fewer than 10% of
+        # the history would be flagged
+        flagged = (mixed.predict(trained_on) == -1).mean()
+        self.assertGreater(flagged, 0.06)
+        self.assertLess(flagged, 0.14)
+        self.assertLess((rebased.predict(trained_on) == -1).mean(), flagged)
+
+
+class CalibrationPairsParityTests(TestCase):
+    """_calibration_pairs must give the pairs of the per-calibration reading queries it replaced"""
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name="Pairs", type="Temperature", value=25.0, unit="C")
+        self.start = timezone.now() - timedelta(days=1)
+        rng = np.random.default_rng(17)
+        offsets = np.sort(rng.choice(10_000_000, 300, replace=False))  # Unique microsecond offsets
+        self.timestamps = [self.start + timedelta(microseconds=int(offset) * 997) for offset in offsets]
+        persist_readings([
+            Reading(sensor=self.sensor, raw_value=float(value), timestamp=ts)
+            for ts, value in zip(self.timestamps, rng.normal(25, 2, len(offsets)))
+        ], detect_drift=False)
+
+        applied = [
+            self.start - timedelta(minutes=1),  # Before every reading: no pair
+            self.timestamps[0],                 # Only strictly earlier readings count
+            self.timestamps[1],
+            self.timestamps[2] + timedelta(microseconds=1),
+            self.timestamps[150],
+            self.timestamps[-1] + timedelta(hours=1),
+        ] + [self.start + timedelta(seconds=float(s)) for s in rng.uniform(0, 10_000, 30)]
+        for applied_at in applied:
+            calibration = Calibration.objects.create(
+                sensor=self.sensor, method='linear', corrected_value=float(rng.normal(26, 1))
+            )
+            Calibration.objects.filter(id=calibration.id).update(applied_at=applied_at)
+
+    def _per_calibration_pairs(self, calibrations):
+        raw, corrected = [], []
+        for calibration in calibrations:
+            readings_before = Reading.objects.filter(
+                sensor=self.sensor, timestamp__lt=calibration.applied_at
+            ).order_by('-timestamp')[:3]
+            if readings_before:
+                raw.append(np.mean([r.raw_value for r in readings_before]))
+                corrected.append(calibration.corrected_value)
+        return np.array(raw).reshape(-1, 1), np.array(corrected)
+
+    def test_pairs_match_per_calibration_queries(self):
+        calibrations = list(Calibration.objects.filter(sensor=self.sensor).order_by('applied_at'))
+        X, y = ModelTrainer()._calibration_pairs(self.sensor, calibrations)
+        expected_X, expected_y = self._per_calibration_pairs(calibrations)
+        self.assertEqual(len(y), len(calibrations) - 2)
+        np.testing.assert_array_equal(X, expected_X)
+        np.testing.assert_array_equal(y, expected_y)
+
+    def test_subset_of_calibrations(self):
+        calibrations = list(Calibration.objects.filter(sensor=self.sensor).order_by('-id')[:7])
+        X, y = ModelTrainer()._calibration_pairs(self.sensor, calibrations)
+        expected_X, expected_y = self._per_calibration_pairs(calibrations)
+        np.testing.assert_array_equal(X, expected_X)
+        np.testing.assert_array_equal(y, expected_y)
+
+
+class CalibrationFitTests(TestCase):
+    """Running calibration fits must give LinearRegression's coefficients"""
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name="Fit", type="Temperature", value=25.0, unit="C")
+        self.rng = np.random.default_rng(19)
+
+    def assertMatchesRegression(self, fit, x, y):
+        regression = LinearRegression().fit(np.reshape(x, (-1, 1)), y)
+        slope, intercept = calibration_fit.coefficients(fit)
+        self.assertAlmostEqual(slope, regression.coef_[0], delta=1e-9)
+        self.assertAlmostEqual(intercept, regression.intercept_, delta=abs(regression.intercept_) * 1e-9 + 1e-9)
+
+    def _calibrate(self, values):
+        for value in values:
+            Calibration.objects.create(sensor=self.sensor, method='linear', corrected_value=float(value))
+
+    def _corrected_values(self):
+        return list(
+            Calibration.objects.filter(sensor=self.sensor).order_by('id').values_list('corrected_value', flat=True)
+        )
+
+    def test_fold_in_batches_matches_regression(self):
+        x = self.rng.normal(100, 15, 5000)
+        y = 0.98 * x + 1.5 + self.rng.normal(0, 0.3, len(x))
+        fit = CalibrationFit(sensor=self.sensor)
+        for x_chunk, y_chunk in zip(np.array_split(x, 23), np.array_split(y, 23)):
+            calibration_fit.fold(fit, x_chunk, y_chunk)
+        self.assertEqual(fit.count, len(x))
+        self.assertMatchesRegression(fit, x, y)
+
+    def test_fit_follows_saved_calibrations(self):
+        self._calibrate(self.rng.normal(26, 1, 5))
+        fit = calibration_fit.get_fit(self.sensor.id)
+        self._calibrate(self.rng.normal(26, 1, 7))  # Folded in as they are created
+        fit.refresh_from_db()
+        self.assertFalse(fit.stale)
+        self.assertEqual(fit.count, 12)
+        values = self._corrected_values()
+        self.assertMatchesRegression(fit, *calibration_fit._pairs(values))
+
+    def test_rebuild_after_change_or_delete(self):
+        self._calibrate(self.rng.normal(26, 1, 10))
+        calibration_fit.get_fit(self.sensor.id)
+
+        calibration = Calibration.objects.filter(sensor=self.sensor).first()
+        calibration.corrected_value = 40.0
+        calibration.save()
+        self.assertTrue(CalibrationFit.objects.get(sensor=self.sensor).stale)
+        fit = calibration_fit.get_fit(self.sensor.id)
+        self.assertMatchesRegression(fit, *calibration_fit._pairs(self._corrected_values()))
+
+        Calibration.objects.filter(sensor=self.sensor).last().delete()
+        self.assertTrue(CalibrationFit.objects.get(sensor=self.sensor).stale)
+        fit = calibration_fit.get_fit(self.sensor.id)
+        self.assertEqual(fit.count, 9)
+        self.assertMatchesRegression(fit, *calibration_fit._pairs(self._corrected_values()))
+
+    def test_fixture_rows_invalidate_the_fit(self):
+        self._calibrate([25.0, 26.0])
+        calibration_fit.get_fit(self.sensor.id)
+        Calibration(
+            sensor=self.sensor, method='linear', corrected_value=27.0, applied_at=timezone.now()
+        ).save_base(raw=True)
+        self.assertTrue(CalibrationFit.objects.get(sensor=self.sensor).stale)
+        self.assertEqual(calibration_fit.get_fit(self.sensor.id).count, 3)
+
+    def test_flat_fit(self):
+        x = np.full(10, 25.0)
+        y = self.rng.normal(26, 1, 10)
+        fit = CalibrationFit(sensor=self.sensor)
+        calibration_fit.fold(fit, x[:4], y[:4])
+        calibration_fit.fold(fit, x[4:], y[4:])
+        self.assertEqual(calibration_fit.coefficients(fit)[0], 0.0)
+        self.assertMatchesRegression(fit, x, y)
+
+
+class CalibrationArraysTests(TestCase):
+    """Array calibration endpoint, storing corrected values, and simulated readings that carry them"""
+
+    url = '/api/ml/calibration/apply/arrays/'
+
+    def setUp(self):
+        # No trained models: the basic correction applies
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        settings_override = override_settings(BASE_DIR=models_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.sensor = Sensor.objects.create(name="Arrays", type="Temperature", value=25.0, unit="C")
+        self.other = Sensor.objects.create(name="Arrays other", type="Temperature", value=25.0, unit="C")
+        start = timezone.now() - timedelta(hours=1)
+        self.readings, _ = persist_readings([
+            Reading(sensor=self.sensor, raw_value=20.0 + i, timestamp=start + timedelta(seconds=i))
+            for i in range(5)
+        ], detect_drift=False)
+
+    def _post(self, data):
+        return self.client.post(self.url, data, content_type='application/json')
+
+    def test_raw_values(self):
+        response = self._post({"sensor_id": self.sensor.id, "raw_values": [20.0, 30.0]})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["results"][0]
+        self.assertEqual(result["corrected_values"], [20.5, 29.5])
+        self.assertEqual(result["model_used"], 'basic_linear')
+
+    def test_invalid_arrays_are_item_errors(self):
+        response = self._post({"items": [
+            {"sensor_id": self.sensor.id, "raw_values": []},
+            {"sensor_id": self.sensor.id, "raw_values": 5},
+            {"sensor_id": self.sensor.id, "reading_ids": []},
+            {"sensor_id": self.sensor.id, "raw_values": [25.0], "store": True},
+            {"sensor_id": self.other.id, "reading_ids": [self.readings[0].id]},
+            {"sensor_id": self.sensor.id, "raw_values": [25.0]},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        for result in results[:5]:
+            self.assertIn("error", result)
+        self.assertEqual(results[5]["corrected_values"], [25.0])
+
+    def test_store_on_readings(self):
+        reading_ids = [reading.id for reading in self.readings[:3]]
+        response = self._post({"sensor_id": self.sensor.id, "reading_ids": reading_ids, "store": True})
+        self.assertEqual(response.json()["results"][0]["stored"], 3)
+        stored = dict(Reading.objects.filter(sensor=self.sensor).values_list('id', 'corrected_value'))
+        for reading in self.readings:
+            expected = reading.raw_value + (25.0 - reading.raw_value) * 0.1 if reading.id in reading_ids else None
+            self.assertEqual(stored[reading.id], expected)
+
+    @override_settings(SIMULATED_CALIBRATION_STORAGE='reading')
+    def test_simulated_reading_stores_corrected_value(self):
+        response = self.client.post('/api/readings/simulate/', {"sensor_id": self.sensor.id},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        reading = Reading.objects.get(id=response.json()["reading"]["id"])
+        # Fewer than 2 calibrations: adaptive calibration passes the value through
+        self.assertEqual(reading.corrected_value, reading.raw_value)
+        self.assertEqual(response.json()["corrected_value"], reading.corrected_value)
+        self.assertFalse(Calibration.objects.filter(sensor=self.sensor).exists())
+
+
+class HistoryPaginationTests(TestCase):
+    """Keyset pages on (timestamp, id) cover every reading exactly once, in either order"""
+
+    url = '/api/readings/history/'
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name="Paged", type="Temperature", value=25.0, unit="C")
+        other = Sensor.objects.create(name="Other", type="Temperature", value=25.0, unit="C")
+        start = timezone.now() - timedelta(hours=1)
+        # Runs of equal timestamps, so that pages have to break ties on id
+        persist_readings([
+            Reading(sensor=self.sensor, raw_value=float(i), timestamp=start + timedelta(seconds=i // 3))
+            for i in range(11)
+        ] + [Reading(sensor=other, raw_value=-1.0, timestamp=start)], detect_drift=False)
+        readings = Reading.objects.filter(sensor=self.sensor)
+        self.ascending = list(readings.order_by('timestamp', 'id').values_list('id', flat=True))
+        self.descending = list(readings.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def _get(self, **params):
+        return self.client.get(self.url, {'sensor_name': self.sensor.name, **params})
+
+    def _walk(self, **params):
+        ids, cursor, pages = [], None, 0
+        while True:
+            response = self._get(**params, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertLessEqual(len(body["results"]), int(params.get('limit', history.DEFAULT_PAGE_SIZE)))
+            ids += [result["id"] for result in body["results"]]
+            pages += 1
+            cursor = body["next"]
+            if cursor is None:
+                return ids, pages
+
+    def test_cursor_round_trip(self):
+        for limit in (1, 2, 3, 4, 11, 50):
+            ids, pages = self._walk(limit=limit)
+            self.assertEqual(ids, self.ascending)
+            self.assertEqual(pages, -(-len(ids) // limit))
+
+    def test_descending_order(self):
+        ids, _ = self._walk(limit=4, order='desc')
+        self.assertEqual(ids, self.descending)
+        body = self._get(order='desc', limit=1).json()
+        self.assertEqual(body["results"][0]["raw_value"], 10.0)
+
+    def test_stable_across_equal_timestamps(self):
+        # A page boundary inside a run of equal timestamps must neither skip
+        # nor repeat readings, also when readings are added between pages
+        first = self._get(limit=2).json()
+        persist_readings([
+            Reading(sensor=self.sensor, raw_value=99.0, timestamp=Reading.objects.get(id=self.ascending[0]).timestamp)
+        ], detect_drift=False)
+        ids = [r["id"] for r in first["results"]]
+        cursor = first["next"]
+        while cursor:
+            body = self._get(limit=2, cursor=cursor).json()
+            ids += [r["id"] for r in body["results"]]
+            cursor = body["next"]
+        new_id = Reading.objects.get(raw_value=99.0).id
+        self.assertEqual(ids, self.ascending[:3] + [new_id] + self.ascending[3:])
+
+    def test_limit_bounds(self):
+        self.assertEqual(len(self._get().json()["results"]), 11)
+        for limit in ('0', '-1', 'ten', '1.5'):
+            response = self._get(limit=limit)
+            self.assertEqual(response.status_code, 400, limit)
+            self.assertIn("limit", response.json()["error"])
+        with mock.patch.object(history, 'MAX_PAGE_SIZE', 3):
+            body = self._get(limit=1000).json()
+        self.assertEqual(len(body["results"]), 3)
+        self.assertIsNotNone(body["next"])
+
+    def test_field_selection(self):
+        body = self._get(fields='timestamp,raw_value', limit=5).json()
+        self.assertEqual([set(result) for result in body["results"]], [{'timestamp', 'raw_value'}] * 5)
+        self.assertEqual([result["raw_value"] for result in body["results"]], [0.0, 1.0, 2.0, 3.0, 4.0])
+
+        # Cursors of field-selected pages continue where they left off
+        rest = self._get(fields='raw_value', cursor=body["next"]).json()
+        self.assertEqual([result["raw_value"] for result in rest["results"]], [5.0 + i for i in range(6)])
+
+        response = self._get(fields='timestamp,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["error"])
+
+    def test_malformed_and_tampered_cursors(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        valid = self._get(limit=2).json()["next"]
+        for cursor in (
+            'garbage!', valid[:-3], base64.urlsafe_b64encode(b'\xff\xfe').decode(), encode([1, 2]),
+            encode({'ts': 'yesterday', 'id': 1}), encode({'ts': 12, 'id': 1}),
+            encode({'ts': timezone.now().isoformat(), 'id': 'x'}), encode({'id': 1}),
+        ):
+            response = self._get(cursor=cursor)
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json(), {"error": "Invalid cursor"})
+
+
+class HistoryCorrectedTests(TestCase):
+    """?include=corrected keeps stored corrected values and computes the others"""
+
+    url = '/api/readings/history/'
+
+    def setUp(self):
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        settings_override = override_settings(BASE_DIR=models_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.sensor = Sensor.objects.create(name="Corrected", type="Temperature", value=25.0, unit="C")
+        start = timezone.now() - timedelta(hours=1)
+        persist_readings([
+            Reading(
+                sensor=self.sensor, raw_value=20.0 + i, timestamp=start + timedelta(seconds=i),
+                corrected_value=100.0 + i if i % 2 else None,
+            )
+            for i in range(6)
+        ], detect_drift=False)
+        self.expected = [100.0 + i if i % 2 else 20.0 + i + (5.0 - i) * 0.1 for i in range(6)]
+
+    def _get(self, **params):
+        return self.client.get(self.url, {'sensor_name': self.sensor.name, 'include': 'corrected', **params})
+
+    def test_serialized_and_selected_fields(self):
+        for params in ({}, {'fields': 'id,timestamp'}):
+            response = self._get(**params)
+            self.assertEqual(response.status_code, 200)
+            results = response.json()["results"]
+            self.assertEqual([r["raw_value"] for r in results], [20.0 + i for i in range(6)])
+            for result, expected in zip(results, self.expected):
+                self.assertAlmostEqual(result["corrected_value"], expected, places=12)
+
+    def test_rejected_with_aggregated_history(self):
+        self.assertEqual(self._get(resolution='hour').status_code, 400)
+        self.assertEqual(self._get(max_points=10).status_code, 400)
+        self.assertEqual(self._get(include='calibration').status_code, 400)
+
+    def test_empty_arrays(self):
+        self.assertEqual(len(batch_scoring.corrected_series(self.sensor, [])), 0)
+        self.assertEqual(len(batch_scoring.corrected_series(self.sensor, np.array([]), [])), 0)
+        self.assertEqual(len(batch_scoring.corrected_values({}, [], [], [])), 0)
+
+
+@mock.patch('sensors.services.ml_analytics.MLAnalyticsService.compute_ml_statistics')
+class AnalyticsSnapshotTests(TestCase):
+    """Snapshot staleness, coalesced refreshes and recovery from failed or dead ones"""
+
+    def setUp(self):
+        self.config = {**analytics_snapshot.snapshot_config(), 'MAX_AGE': 300, 'MIN_NEW_READINGS': 10}
+        self.sensor = Sensor.objects.create(name="Analytics", type="Temperature", value=25.0, unit="C")
+
+    def _ingest(self, count):
+        start = timezone.now() - timedelta(hours=1)
+        persist_readings([
+            Reading(sensor=self.sensor, raw_value=25.0, timestamp=start + timedelta(seconds=i)) for i in range(count)
+        ], detect_drift=False)
+
+    def _snapshot(self, **fields):
+        AnalyticsSnapshot.objects.update_or_create(id=analytics_snapshot.SNAPSHOT_ID, defaults=fields)
+        return AnalyticsSnapshot.objects.get(id=analytics_snapshot.SNAPSHOT_ID)
+
+    def test_staleness(self, compute):
+        compute.return_value = {"total_models": 1}
+        self._ingest(5)
+        snapshot = analytics_snapshot.refresh_snapshot(self.config)
+        self.assertFalse(analytics_snapshot.is_stale(snapshot, self.config))
+
+        self._ingest(9)
+        self.assertFalse(analytics_snapshot.is_stale(snapshot, self.config))
+        self._ingest(1)
+        self.assertTrue(analytics_snapshot.is_stale(snapshot, self.config))
+
+        snapshot = analytics_snapshot.refresh_snapshot(self.config)
+        snapshot.computed_at -= timedelta(seconds=301)
+        self.assertTrue(analytics_snapshot.is_stale(snapshot, self.config))
+
+    def test_stale_snapshot_is_served_while_refreshing(self, compute):
+        self._snapshot(statistics={"total_models": 1}, computed_at=timezone.now() - timedelta(hours=1))
+        with mock.patch.object(analytics_snapshot, '_start_background_refresh') as start:
+            statistics = analytics_snapshot.snapshot_statistics()
+        start.assert_called_once()
+        compute.assert_not_called()
+        self.assertEqual(statistics["total_models"], 1)
+        self.assertTrue(statistics["refreshing"])
+
+    def test_concurrent_refreshes_coalesce(self, compute):
+        self._snapshot(refresh_started_at=timezone.now())
+        self.assertIsNone(analytics_snapshot.refresh_snapshot(self.config))
+        compute.assert_not_called()
+
+    def test_dead_claim_is_taken_over(self, compute):
+        compute.return_value = {"total_models": 2}
+        timeout = self.config['REFRESH_TIMEOUT']
+        self._snapshot(refresh_started_at=timezone.now() - timedelta(seconds=timeout + 1))
+        snapshot = analytics_snapshot.refresh_snapshot(self.config)
+        self.assertEqual(snapshot.statistics, {"total_models": 2})
+        self.assertIsNone(snapshot.refresh_started_at)
+
+    def test_failed_refresh_keeps_previous_snapshot(self, compute):
+        computed_at = timezone.now() - timedelta(hours=1)
+        self._snapshot(statistics={"total_models": 3}, computed_at=computed_at)
+        compute.side_effect = RuntimeError("database is locked")
+        with self.assertRaises(RuntimeError):
+            analytics_snapshot.refresh_snapshot(self.config)
+        snapshot = AnalyticsSnapshot.objects.get(id=analytics_snapshot.SNAPSHOT_ID)
+        self.assertEqual((snapshot.statistics, snapshot.computed_at), ({"total_models": 3}, computed_at))
+        self.assertIsNone(snapshot.refresh_started_at)
+
+    def test_first_snapshot_computed_elsewhere(self, compute):
+        self._snapshot(refresh_started_at=timezone.now())
+        response = self.client.get('/api/ml/analytics/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(self.config['RETRY_AFTER']))
+        compute.assert_not_called()
+
+
+class BatchIngestTests(TestCase):
+    """Batch uploads store the valid items of any sensors and report the rest per item"""
+
+    url = '/api/readings/batch/'
+
+    def setUp(self):
+        self.temperature = Sensor.objects.create(name="Batch T", type="Temperature", value=25.0, unit="C")
+        self.pressure = Sensor.objects.create(name="Batch P", type="Pressure", value=100.0, unit="kPa")
+        self.flow = Sensor.objects.create(name="Batch F", type="Flow", value=0.0, unit="l/s")
+
+    def _post(self, items):
+        return self.client.post(self.url, items, content_type='application/json')
+
+    def _drift_anomaly(self, sensor, value):
+        """The drift rule the single-reading endpoint has always applied"""
+        ideal = sensor.value or 1
+        drift = (value - ideal) / ideal * 100
+        threshold = {"Temperature": 3, "Pressure": 2, "Humidity": 2, "Vibration": 5, "Flow": 5}.get(sensor.type, 3)
+        if abs(drift) > threshold:
+            return ("Drift", value, ideal, drift, "High" if abs(drift) <= 5 else "Critical")
+        return None
+
+    def test_mixed_sensors_with_item_errors(self):
+        response = self._post({"readings": [
+            {"sensor": self.temperature.id, "raw_value": 25.5},
+            {"sensor": 999999, "raw_value": 1.0},
+            {"sensor": self.pressure.id, "raw_value": "high"},
+            {"sensor": self.pressure.id, "raw_value": 104.0, "timestamp": "2024-01-01T00:00:00Z"},
+            {"sensor": self.flow.id, "raw_value": 3.0, "timestamp": "yesterday"},
+            {"raw_value": 1.0},
+        ]})
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body["created"], body["failed"]), (2, 4))
+        self.assertEqual([error["index"] for error in body["errors"]], [1, 2, 4, 5])
+        self.assertIn("sensor", body["errors"][0]["errors"])
+        self.assertIn("raw_value", body["errors"][1]["errors"])
+        self.assertIn("timestamp", body["errors"][2]["errors"])
+        self.assertEqual(Reading.objects.filter(sensor=self.temperature).count(), 1)
+        self.assertEqual(
+            Reading.objects.get(sensor=self.pressure).timestamp.isoformat(), "2024-01-01T00:00:00+00:00"
+        )
+
+    def test_all_invalid_is_400(self):
+        response = self._post([{"sensor": 999999, "raw_value": 1.0}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Reading.objects.count(), 0)
+
+    def test_batch_size_limit(self):
+        response = self._post([{"sensor": self.temperature.id, "raw_value": 25.0}] * (MAX_BATCH_SIZE + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Reading.objects.count(), 0)
+        self.assertEqual(self._post({"readings": "nope"}).status_code, 400)
+
+    def test_drift_anomalies_match_single_reading_rule(self):
+        items = [
+            (sensor, value)
+            for sensor, values in (
+                (self.temperature, [25.0, 25.7, 25.8, 26.3, 20.0]),
+                (self.pressure, [100.0, 102.0, 102.5, 95.0, 106.0]),
+                (self.flow, [0.0, 0.04, 0.06, -1.0]),
+            )
+            for value in values
+        ]
+        response = self._post([{"sensor": sensor.id, "raw_value": value} for sensor, value in items])
+        self.assertEqual(response.status_code, 201)
+
+        anomalies = {anomaly.reading_id: anomaly for anomaly in Anomaly.objects.filter(detector='rule')}
+        self.assertEqual(response.json()["anomalies_created"], len(anomalies))
+        readings = Reading.objects.order_by('id')
+        self.assertEqual(len(readings), len(items))
+        for reading, (sensor, value) in zip(readings, items):
+            expected = self._drift_anomaly(sensor, value)
+            anomaly = anomalies.get(reading.id)
+            if expected is None:
+                self.assertIsNone(anomaly)
+                continue
+            self.assertEqual(anomaly.sensor_id, sensor.id)
+            self.assertEqual(
+                (anomaly.type, anomaly.value, anomaly.expected, anomaly.severity), expected[:3] + expected[4:]
+            )
+            self.assertAlmostEqual(anomaly.deviation, expected[3], places=9)
+
+        # The single-reading endpoint stores the same anomaly for the same value
+        single = self.client.post('/api/readings/', {"sensor": self.pressure.id, "raw_value": 106.0},
+                                  content_type='application/json')
+        anomaly = Anomaly.objects.get(reading_id=single.json()["id"])
+        self.assertEqual((anomaly.type, anomaly.severity), ("Drift", "Critical"))
+        self.assertAlmostEqual(anomaly.deviation, 6.0, places=9)
+
+
+class ReadingBufferTests(TransactionTestCase):
+    """The write-behind buffer commits every queued reading and isolates the ones that fail"""
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name="Buffer Sensor", type="Temperature", value=25.0, unit="C")
+
+    def _buffer(self, **kwargs):
+        buffer = ingest_buffer.ReadingBuffer(**kwargs)
+        self.addCleanup(buffer.stop)
+        return buffer
+
+    def _reading(self, value=25.0, sensor_id=None):
+        return Reading(sensor_id=sensor_id or self.sensor.id, raw_value=value, timestamp=timezone.now())
+
+    def test_commit_mode_returns_saved_readings(self):
+        buffer = self._buffer(durability='commit')
+        readings = [buffer.submit(self._reading(25.0 + i)) for i in range(3)]
+        self.assertTrue(all(reading.pk is not None for reading in readings))
+        self.assertEqual(
+            list(Reading.objects.order_by('id').values_list('id', flat=True)), [r.pk for r in readings]
+        )
+        self.assertEqual(buffer.stats()['committed'], 3)
+
+    def test_flush_and_stop_drain_the_queue(self):
+        buffer = self._buffer(durability='enqueue', batch_size=2, flush_interval=10.0)
+        for i in range(5):
+            buffer.submit(self._reading(25.0 + i))
+        buffer.flush(timeout=10)
+        self.assertEqual(Reading.objects.count(), 5)
+
+        for i in range(3):
+            buffer.submit(self._reading(30.0 + i))
+        buffer.stop()
+        self.assertEqual(Reading.objects.count(), 8)
+        self.assertEqual(buffer.stats(), {'queued': 0, 'committed': 8, 'failed': 0, 'durability': 'enqueue'})
+        with self.assertRaises(ingest_buffer.BufferFull):
+            buffer.submit(self._reading())
+
+    def test_full_queue_times_out(self):
+        release = threading.Event()
+        writing = threading.Event()
+
+        def blocked_persist(readings, detect_drift=True):
+            writing.set()
+            release.wait(10)
+            return persist_readings(readings, detect_drift=detect_drift)
+
+        buffer = self._buffer(durability='enqueue', max_queue_size=1, batch_size=1, enqueue_timeout=0.05)
+        with mock.patch.object(ingest_buffer, 'persist_readings', blocked_persist):
+            buffer.submit(self._reading())    # taken by the writer, which blocks
+            writing.wait(10)
+            buffer.submit(self._reading())    # fills the queue
+            with self.assertRaises(ingest_buffer.BufferFull):
+                buffer.submit(self._reading())
+            release.set()
+            buffer.stop()
+        self.assertEqual(Reading.objects.count(), 2)
+
+    def test_failing_reading_does_not_fail_its_batch(self):
+        buffer = ingest_buffer.ReadingBuffer()
+        pending = [
+            ingest_buffer._PendingReading(self._reading(25.0), True),
+            ingest_buffer._PendingReading(self._reading(26.0, sensor_id=999999), False),
+            ingest_buffer._PendingReading(self._reading(27.0), False),
+            ingest_buffer._PendingReading(self._reading(28.0), True),
+        ]
+        with self.assertLogs(ingest_buffer.logger, 'WARNING') as logs:
+            buffer._write(pending)
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING', 'ERROR'])
+
+        self.assertTrue(all(p.done.is_set() for p in pending))
+        good = [p for i, p in enumerate(pending) if i != 1]
+        self.assertTrue(all(p.error is None and p.reading.pk is not None for p in good))
+        self.assertIsNotNone(pending[1].error)
+        self.assertIsNone(pending[1].reading.pk)
+        self.assertEqual(
+            sorted(Reading.objects.values_list('raw_value', flat=True)), [25.0, 27.0, 28.0]
+        )
+        self.assertEqual((buffer.committed, buffer.failed), (3, 1))
+
+    def test_enqueue_mode_is_accepted_without_an_id(self):
+        config = {**ingest_buffer.DEFAULT_BUFFER_SETTINGS, 'ENABLED': True, 'DURABILITY': 'enqueue'}
+        ingest_buffer._buffer = None
+        self.addCleanup(setattr, ingest_buffer, '_buffer', None)
+        with override_settings(READING_BUFFER=config):
+            response = self.client.post('/api/readings/', {"sensor": self.sensor.id, "raw_value": 25.5},
+                                        content_type='application/json')
+            ingest_buffer.get_reading_buffer().stop()
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn('id', response.json())
+        self.assertEqual(response.json()['raw_value'], 25.5)
+        self.assertEqual(Reading.objects.count(), 1)
+
+
+class LiveUpdatesTests(TestCase):
+    """Committed changes fan out to interested subscribers; slow and gone ones are handled"""
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name="Live", type="Temperature", value=25.0, unit="C")
+        self.other = Sensor.objects.create(name="Live Other", type="Temperature", value=25.0, unit="C")
+
+    def _subscribe(self, sensor_ids=None):
+        subscription = live_updates.hub.subscribe(sensor_ids)
+        self.addCleanup(live_updates.hub.unsubscribe, subscription)
+        return subscription
+
+    def _events(self, subscription):
+        events = []
+        while (event := subscription.get(timeout=0.01)) is not None:
+            events.append(event)
+        return events
+
+    def test_fan_out(self):
+        hub = live_updates.LiveUpdateHub()
+        everything, mine, others = hub.subscribe(), hub.subscribe({1, 2}), hub.subscribe({3})
+        self.assertEqual(hub.subscriber_count(), 3)
+        hub.publish('reading', 2, {'value': 1})
+        hub.publish('reading', 3, {'value': 2})
+
+        self.assertEqual([e['data'] for e in self._events(everything)], [{'value': 1}, {'value': 2}])
+        self.assertEqual(self._events(mine), [{'event': 'reading', 'data': {'value': 1}}])
+        self.assertEqual(self._events(others), [{'event': 'reading', 'data': {'value': 2}}])
+
+        hub.unsubscribe(mine)
+        hub.publish('reading', 1, {})
+        self.assertEqual(self._events(mine), [])
+        self.assertEqual(hub.subscriber_count(), 2)
+
+    def test_overflow_resyncs(self):
+        subscription = live_updates.Subscription(max_pending=3)
+        for i in range(3):
+            subscription.deliver({'event': 'reading', 'data': i})
+        # The fourth event finds the queue full: the backlog is replaced by one resync
+        subscription.deliver({'event': 'reading', 'data': 3})
+        self.assertEqual(self._events(subscription), [live_updates.RESYNC_EVENT])
+        subscription.deliver({'event': 'reading', 'data': 4})
+        self.assertEqual(self._events(subscription), [{'event': 'reading', 'data': 4}])
+
+    def test_async_subscriber(self):
+        async def receive():
+            hub = live_updates.LiveUpdateHub()
+            subscription = hub.subscribe(loop=asyncio.get_running_loop())
+            # Published from another thread, like the ingestion commit hooks
+            publisher = threading.Thread(target=hub.publish, args=('anomaly', 1, {'id': 7}))
+            publisher.start()
+            event = await subscription.aget(timeout=5)
+            publisher.join()
+            return event, await subscription.aget(timeout=0.01)
+
+        self.assertEqual(asyncio.run(receive()), ({'event': 'anomaly', 'data': {'id': 7}}, None))
+
+    def test_published_only_on_commit(self):
+        subscription = self._subscribe({self.sensor.id})
+        reading = Reading(sensor=self.sensor, raw_value=30.0, timestamp=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            persist_readings([reading])
+            self.assertEqual(self._events(subscription), [])
+
+        events = self._events(subscription)
+        self.assertEqual([e['event'] for e in events], ['reading', 'anomaly'])
+        self.assertEqual(events[0]['data']['id'], reading.id)
+        self.assertEqual(events[1]['data']['reading'], reading.id)
+
+        # Nothing is published for a rolled back write
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                persist_readings([Reading(sensor=self.sensor, raw_value=40.0, timestamp=timezone.now())])
+                raise RuntimeError
+        self.assertEqual(self._events(subscription), [])
+
+    def test_stream_unsubscribes_on_disconnect(self):
+        before = live_updates.hub.subscriber_count()
+        response = self.client.get('/api/sensors/stream/', {'sensor_ids': f'{self.sensor.id}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+        self.assertTrue(next(stream).decode().startswith('event: snapshot\n'))
+        self.assertEqual(live_updates.hub.subscriber_count(), before + 1)
+
+        live_updates.hub.publish('reading', self.other.id, {'id': 1})
+        live_updates.hub.publish('reading', self.sensor.id, {'id': 2})
+        self.assertEqual(next(stream).decode(), 'event: reading\ndata: {"id": 2}\n\n')
+
+        response.close()
+        self.assertEqual(live_updates.hub.subscriber_count(), before)
+        self.assertEqual(self.client.get('/api/sensors/stream/', {'sensor_ids': 'a,b'}).status_code, 400)
+
+
+class StreamingAnomalyParityTests(TestCase):
+    """The in-memory windows classify every reading exactly like the query-per-reading rules"""
+
+    def setUp(self):
+        self.detector = streaming_anomaly.detector
+        self.detector.reset()
+        self.addCleanup(self.detector.reset)
+        self.sensors = [
+            Sensor.objects.create(name="Stream A", type="Temperature", value=25.0, unit="C"),
+            Sensor.objects.create(name="Stream B", type="Pressure", value=100.0, unit="kPa"),
+            Sensor.objects.create(name="Stream C", type="Flow", value=0.0, unit="l/s"),
+        ]
+        self.rng = np.random.default_rng(11)
+        self.start = timezone.now() - timedelta(hours=1)
+
+    def _value(self, sensor):
+        baseline = sensor.value or 1.0
+        roll = self.rng.random()
+        if roll < 0.1:
+            return baseline * self.rng.uniform(0.0, 0.3)      # dropout
+        if roll < 0.2:
+            return baseline * self.rng.uniform(1.3, 2.0)      # spike
+        return float(baseline + self.rng.normal(0, 0.08 * baseline))
+
+    def _expected(self, reading):
+        return classify_reading(reading.raw_value, reading.sensor.value or 0, recent_values(reading.sensor))
+
+    def test_same_results_as_detect_anomaly(self):
+        second, seen = 0, set()
+        for step in range(120):
+            batch = []
+            for _ in range(self.rng.integers(1, 4)):
+                sensor = self.sensors[self.rng.integers(len(self.sensors))]
+                # Mostly in order, with repeated timestamps and late arrivals
+                roll = self.rng.random()
+                if roll < 0.8:
+                    second += 1
+                offset = second - self.rng.integers(1, 20) if roll > 0.95 else second
+                batch.append(Reading(
+                    sensor=sensor, raw_value=self._value(sensor),
+                    timestamp=self.start + timedelta(seconds=int(offset)),
+                ))
+            with self.captureOnCommitCallbacks(execute=True):
+                persist_readings(batch, detect_drift=False)
+            if step == 60:
+                self.detector.reset()    # a restart: windows reload from the database
+
+            for reading in batch:
+                result = self.detector.classify(reading)
+                self.assertEqual(result, self._expected(reading), (step, reading.id))
+                seen.add(result and result[0])
+            for sensor in self.sensors:
+                self.assertEqual(
+                    self.detector.recent_values(sensor.id), recent_values(sensor), (step, sensor.name)
+                )
+        # The sequence exercises the rules, not just the quiet path
+        self.assertGreaterEqual(len(seen - {None}), 3)
+
+    def test_detect_records_the_same_anomaly(self):
+        sensor = self.sensors[0]
+        for i, value in enumerate([25.0, 25.1, 24.9, 25.0, 40.0]):
+            reading = Reading(sensor=sensor, raw_value=value, timestamp=self.start + timedelta(seconds=i))
+            with self.captureOnCommitCallbacks(execute=True):
+                persist_readings([reading], detect_drift=False)
+
+        self.assertEqual(self.detector.detect(reading), 'Drift')
+        self.assertEqual(detect_anomaly(reading), 'Drift')
+        streamed, queried = Anomaly.objects.filter(sensor=sensor).order_by('id')
+        fields = ('type', 'value', 'expected', 'deviation', 'severity', 'detector')
+        self.assertEqual(
+            [getattr(streamed, f) for f in fields], [getattr(queried, f) for f in fields]
+        )
+
+
+class MLAnomalyWatermarkTests(TestCase):
+    """Each reading is scored once, and again only if its anomalies were not written"""
+
+    def setUp(self):
+        anomaly_ml._models.clear()
+        self.addCleanup(anomaly_ml._models.clear)
+        self.sensor = Sensor.objects.create(name="ML Watermark", type="Temperature", value=25.0, unit="C")
+        self.start = timezone.now() - timedelta(hours=1)
+        self.rng = np.random.default_rng(5)
+        self._ingest(list(25 + self.rng.normal(0, 0.2, 60)) + [60.0, -10.0])
+
+    def _ingest(self, values):
+        offset = Reading.objects.filter(sensor=self.sensor).count()
+        readings = [
+            Reading(sensor=self.sensor, raw_value=float(v), timestamp=self.start + timedelta(seconds=offset + i))
+            for i, v in enumerate(values)
+        ]
+        persist_readings(readings, detect_drift=False)
+        return readings
+
+    def _detect(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return anomaly_ml.ml_anomaly_detection(self.sensor.id)
+
+    def _ml_anomalies(self):
+        return Anomaly.objects.filter(sensor=self.sensor, detector='ml')
+
+    def test_second_call_creates_no_duplicates(self):
+        first = self._detect()
+        self.assertTrue(first)
+        self.assertEqual(self._ml_anomalies().count(), len(first))
+        self.assertEqual(self._detect(), [])
+        self.assertEqual(self._ml_anomalies().count(), len(first))
+
+    def test_only_new_readings_are_scored(self):
+        self._detect()
+        state = anomaly_ml._models[self.sensor.id]
+        seen = Reading.objects.filter(sensor=self.sensor).order_by('-id').values_list('id', flat=True)[0]
+        self.assertEqual(state.watermark, seen)
+
+        new = self._ingest([25.1, 80.0, 24.9])
+        with mock.patch.object(state.model, 'predict', wraps=state.model.predict) as predict:
+            anomalies = self._detect()
+        self.assertEqual(predict.call_args.args[0].ravel().tolist(), [25.1, 80.0, 24.9])
+        self.assertIn(new[1].id, {a.reading_id for a in anomalies})
+        self.assertTrue(all(a.reading_id > seen for a in anomalies))
+        self.assertEqual(state.watermark, new[-1].id)
+
+    def test_failed_write_is_retried(self):
+        with mock.patch.object(Anomaly.objects, 'bulk_create', side_effect=DatabaseError("locked")):
+            with self.assertRaises(DatabaseError):
+                self._detect()
+        self.assertEqual(self._ml_anomalies().count(), 0)
+
+        state = anomaly_ml._models[self.sensor.id]
+        with mock.patch.object(state.model, 'predict', side_effect=ValueError("bad input")):
+            with self.assertRaises(ValueError):
+                self._detect()
+
+        anomalies = self._detect()
+        self.assertTrue(anomalies)
+        self.assertEqual(self._ml_anomalies().count(), len(anomalies))
+        flagged = set(self._ml_anomalies().values_list('value', flat=True))
+        self.assertTrue({60.0, -10.0} <= flagged)
+
+
+class ModelCacheTests(TestCase):
+    """The model LRU evicts by artifact size and reloads replaced files"""
+
+    def setUp(self):
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        self.dir = models_dir.name
+
+    def _dump(self, name, size):
+        path = os.path.join(self.dir, name)
+        joblib.dump(np.zeros(size), path)
+        return path, os.path.getsize(path)
+
+    def test_byte_weighted_eviction(self):
+        small, small_size = self._dump('small.pkl', 100)
+        large, large_size = self._dump('large.pkl', 2000)
+        other, other_size = self._dump('other.pkl', 100)
+        cache_ = ModelCache(max_bytes=large_size + small_size + other_size // 2)
+
+        cache_.get((1, 'a'), small)
+        cache_.get((2, 'a'), large)
+        cache_.get((1, 'a'), small)       # now the most recently used
+        cache_.get((3, 'a'), other)       # over budget: the large, least recent entry goes
+        stats = cache_.stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['evictions']), (2, small_size + other_size, 1))
+
+        loader = mock.Mock(side_effect=joblib.load)
+        cache_.get((1, 'a'), small, loader)
+        cache_.get((3, 'a'), other, loader)
+        loader.assert_not_called()
+        cache_.get((2, 'a'), large, loader)
+        loader.assert_called_once_with(large)
+
+        # An artifact larger than the whole budget is returned but not kept
+        huge, _ = self._dump('huge.pkl', 10000)
+        self.assertEqual(len(cache_.get((4, 'a'), huge)), 10000)
+        self.assertNotIn((4, 'a'), cache_._entries)
+        self.assertLessEqual(cache_.stats()['bytes'], cache_.max_bytes)
+
+    def test_reloads_replaced_file(self):
+        path, _ = self._dump('model.pkl', 10)
+        cache_ = ModelCache()
+        first = cache_.get((1, 'a'), path)
+        self.assertIs(cache_.get((1, 'a'), path), first)
+
+        # Replaced by a rename, as a retrain in another process would do
+        replacement = os.path.join(self.dir, 'model.pkl.tmp')
+        joblib.dump(np.ones(10), replacement)
+        os.replace(replacement, path)
+        reloaded = cache_.get((1, 'a'), path)
+        self.assertEqual(reloaded.tolist(), [1.0] * 10)
+
+        # Rewritten in place with the same size: the mtime tells
+        joblib.dump(np.full(10, 2.0), path)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(cache_.get((1, 'a'), path).tolist(), [2.0] * 10)
+
+        os.remove(path)
+        self.assertIsNone(cache_.get((1, 'a'), path))
+        self.assertEqual(cache_.stats()['entries'], 0)
+
+    def test_stats_counters(self):
+        path, size = self._dump('model.pkl', 10)
+        cache_ = ModelCache()
+        self.assertIsNone(cache_.get((1, 'a'), os.path.join(self.dir, 'missing.pkl')))
+        for _ in range(3):
+            cache_.get((1, 'a'), path)
+        os.utime(path, ns=(0, 10 ** 9))
+        cache_.get((1, 'a'), path)
+        cache_.invalidate(sensor_id=1)
+        cache_.get((1, 'a'), path)
+
+        stats = cache_.stats()
+        self.assertEqual(
+            {k: stats[k] for k in ('hits', 'misses', 'stale', 'loads', 'evictions', 'entries', 'bytes')},
+            {'hits': 2, 'misses': 4, 'stale': 1, 'loads': 3, 'evictions': 0, 'entries': 1, 'bytes': size},
+        )
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 6)
+
+
+class CompiledForestParityTests(TestCase):
+    """The compiled forest scores like the sklearn IsolationForest it was compiled from"""
+
+    def setUp(self):
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        self.dir = models_dir.name
+        self.rng = np.random.default_rng(3)
+
+    def _assert_parity(self, model, compiled, X):
+        np.testing.assert_allclose(compiled.decision_function(X), model.decision_function(X), rtol=0, atol=1e-12)
+        np.testing.assert_allclose(compiled.score_samples(X), model.score_samples(X), rtol=0, atol=1e-12)
+        np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
+
+    def test_parity_and_round_trip(self):
+        cases = (
+            (IsolationForest(contamination=0.1, random_state=42), 1),
+            (IsolationForest(n_estimators=50, max_samples=64, random_state=0), 3),
+            (IsolationForest(n_estimators=30, max_features=0.5, contamination=0.05, random_state=1), 4),
+        )
+        for model, n_features in cases:
+            train = self.rng.normal(25, 1, (500, n_features))
+            model.fit(train)
+            # Inliers, outliers and values exactly on split thresholds
+            X = np.vstack([
+                self.rng.normal(25, 1, (200, n_features)),
+                self.rng.normal(25, 8, (200, n_features)),
+                train[:50],
+            ])
+            compiled = CompiledIsolationForest.from_sklearn(model)
+            self._assert_parity(model, compiled, X)
+            self.assertIn(-1, compiled.predict(X))
+
+            path = compiled_path(os.path.join(self.dir, f'model_{n_features}.pkl'))
+            self.assertTrue(path.endswith(f'model_{n_features}.npz'))
+            compiled.save(path)
+            self._assert_parity(model, CompiledIsolationForest.load(path), X)
+
+    def test_single_sample_and_feature_check(self):
+        model = IsolationForest(random_state=42).fit(self.rng.normal(0, 1, (100, 2)))
+        compiled = CompiledIsolationForest.from_sklearn(model)
+        sample = np.array([0.5, -0.5])
+        np.testing.assert_allclose(
+            compiled.decision_function(sample), model.decision_function(sample.reshape(1, -1)), atol=1e-12
+        )
+        with self.assertRaises(ValueError):
+            compiled.decision_function(np.zeros((3, 3)))
+
+
+class FleetForecastTests(TestCase):
+    """Stored forecasts match on-demand predictions and are dropped when the drift model changes"""
+
+    def setUp(self):
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        settings_override = override_settings(BASE_DIR=models_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.rng = np.random.default_rng(9)
+        self.start = timezone.now() - timedelta(days=1)
+        self.sensors = [
+            Sensor.objects.create(name="Forecast A", type="Temperature", value=25.0, unit="C"),
+            Sensor.objects.create(name="Forecast B", type="Pressure", value=100.0, unit="kPa"),
+            Sensor.objects.create(name="Forecast C", type="Flow", value=5.0, unit="l/s"),
+        ]
+        for sensor in self.sensors:
+            self._ingest(sensor, 40)
+        self.trainer = ModelTrainer()
+        for sensor in self.sensors[:2]:
+            self.assertEqual(self.trainer.train_drift_prediction_model(sensor.id)['status'], 'success')
+
+    def _ingest(self, sensor, count):
+        offset = Reading.objects.filter(sensor=sensor).count()
+        values = sensor.value * (1 + 0.001 * np.arange(offset, offset + count)) + self.rng.normal(0, 0.1, count)
+        persist_readings([
+            Reading(sensor=sensor, raw_value=float(v), timestamp=self.start + timedelta(minutes=offset + i))
+            for i, v in enumerate(values)
+        ], detect_drift=False)
+
+    def _assert_parity(self, sensor):
+        stored = fleet_forecast.stored_forecast(sensor.id)
+        expected = EnhancedMLServices().predict_drift_with_trained_model(sensor.id)
+        self.assertIsNotNone(stored, sensor.name)
+        self.assertEqual(stored['model_used'], expected['model_used'])
+        self.assertEqual(stored.get('confidence'), expected.get('confidence'))
+        np.testing.assert_allclose(stored['predictions'], expected['predictions'], rtol=1e-9, atol=1e-9)
+
+    def test_parity_with_on_demand_predictions(self):
+        result = fleet_forecast.forecast_fleet()
+        self.assertEqual((result['sensors'], result['model_based'], result['trend_based']), (3, 2, 1))
+        for sensor in self.sensors:
+            self._assert_parity(sensor)
+        self.assertEqual(fleet_forecast.stored_forecast(self.sensors[2].id)['model_used'], 'simple_linear_trend')
+        self.assertIsNone(fleet_forecast.stored_forecast(self.sensors[0].id, future_points=10))
+
+    def test_retrained_drift_model_drops_the_forecast(self):
+        fleet_forecast.forecast_fleet()
+        retrained, other = self.sensors[0], self.sensors[1]
+        self._ingest(retrained, 10)
+        result = self.trainer.train_drift_prediction_model(retrained.id)
+        self.assertTrue(result.get('incremental'))
+
+        self.assertIsNone(fleet_forecast.stored_forecast(retrained.id))
+        self.assertFalse(DriftForecast.objects.filter(sensor=retrained).exists())
+        self._assert_parity(other)
+
+        # A full retrain drops it as well
+        fleet_forecast.forecast_fleet([retrained.id])
+        self._assert_parity(retrained)
+        self.trainer.train_drift_prediction_model(retrained.id, incremental=False)
+        self.assertIsNone(fleet_forecast.stored_forecast(retrained.id))
+
+
+class ModelRegistryTests(TestCase):
+    """Saved models are tracked in TrainedModel, which model listings read instead of the directory"""
+
+    def setUp(self):
+        models_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(models_dir.cleanup)
+        settings_override = override_settings(BASE_DIR=models_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.trainer = ModelTrainer()
+        self.sensor = Sensor.objects.create(name="Registry", type="Temperature", value=25.0, unit="C")
+        self.other = Sensor.objects.create(name="Registry Other", type="Pressure", value=100.0, unit="kPa")
+        self.model = LinearRegression().fit(np.arange(10.0).reshape(-1, 1), np.arange(10.0))
+
+    def _path(self, model_type, sensor):
+        return self.trainer._model_path(model_type, sensor.name, sensor.id)
+
+    def _sync(self):
+        out = StringIO()
+        call_command('sync_model_registry', stdout=out)
+        return out.getvalue()
+
+    def test_save_model_upserts_the_active_version(self):
+        path = self._path('drift', self.sensor)
+        first = save_model(self.model, path, self.sensor.id, 'drift', training_samples=10, metrics={'mse': 0.5})
+        second = save_model(self.model, path, self.sensor.id, 'drift', training_samples=12, data_watermark=7)
+
+        versions = TrainedModel.objects.filter(sensor=self.sensor, model_type='drift').order_by('version')
+        self.assertEqual(
+            [(v.id, v.version, v.is_active) for v in versions], [(first.id, 1, False), (second.id, 2, True)]
+        )
+        self.assertEqual(second.path, os.path.basename(path))
+        self.assertEqual(second.size_bytes, os.path.getsize(path))
+        self.assertEqual((second.training_samples, second.data_watermark, second.metrics), (12, 7, {}))
+        self.assertEqual(first.metrics, {'mse': 0.5})
+
+    def test_listings_read_the_registry(self):
+        save_model(self.model, self._path('drift', self.sensor), self.sensor.id, 'drift', training_samples=10)
+        save_model(self.model, self._path('calibration', self.other), self.other.id, 'calibration')
+        old = save_model(self.model, self._path('drift', self.other), self.other.id, 'drift')
+        TrainedModel.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=30))
+        # Files the registry does not know about are not listed
+        joblib.dump(self.model, self._path('anomaly', self.sensor))
+
+        with mock.patch('os.listdir', side_effect=AssertionError("directory scanned")), \
+                mock.patch('os.scandir', side_effect=AssertionError("directory scanned")), \
+                mock.patch('glob.glob', side_effect=AssertionError("directory scanned")):
+            info = self.trainer.get_model_info()
+            recent = count_recent_models()
+
+        self.assertEqual(
+            sorted((i['model_type'], i['sensor_id'], i['version']) for i in info),
+            [('calibration', self.other.id, 1), ('drift', self.sensor.id, 1), ('drift', self.other.id, 1)],
+        )
+        drift = next(i for i in info if i['sensor_id'] == self.sensor.id)
+        self.assertEqual((drift['filename'], drift['sensor_name'], drift['training_samples']),
+                         (os.path.basename(self._path('drift', self.sensor)), self.sensor.name, 10))
+        self.assertEqual(recent, 2)
+
+    def test_sync_adds_missing_files_and_drops_deleted_ones(self):
+        kept = save_model(self.model, self._path('drift', self.sensor), self.sensor.id, 'drift')
+        deleted = save_model(self.model, self._path('calibration', self.sensor), self.sensor.id, 'calibration')
+        os.remove(self._path('calibration', self.sensor))
+        joblib.dump(self.model, self._path('anomaly', self.other))
+        joblib.dump(self.model, os.path.join(self.trainer.models_dir, 'drift_model_Gone_999999.joblib'))
+
+        output = self._sync()
+        self.assertIn('1 model(s) registered, 1 missing model(s) deactivated', output)
+        self.assertIn('drift_model_Gone_999999.joblib: no matching sensor, skipped', output)
+
+        active = TrainedModel.objects.filter(is_active=True)
+        self.assertEqual(
+            sorted((m.sensor_id, m.model_type) for m in active),
+            sorted([(self.sensor.id, 'drift'), (self.other.id, 'anomaly')]),
+        )
+        self.assertEqual(active.get(model_type='drift').id, kept.id)
+        self.assertFalse(TrainedModel.objects.get(id=deleted.id).is_active)
+
+        # A second run has nothing to do
+        self.assertIn('0 model(s) registered, 0 missing model(s) deactivated', self._sync())
@@ -1,12 +1,14 @@
 from django.urls import path
 from .views import (
-    SensorListCreateAPIView, SensorDetailAPIView, SensorDashboardAPIView,
-    ReadingListCreateAPIView, ReadingHistoryAPIView,
+    SensorListCreateAPIView, SensorDetailAPIView, SensorDashboardAPIView, LiveStreamView,
+    ReadingListCreateAPIView, ReadingBatchCreateAPIView, ReadingHistoryAPIView,
     CalibrationApplyAPIView, CalibrationHistoryAPIView,
     AnomalyListCreateAPIView, AnomalyDetectAPIView,
     ReportGenerateAPIView, SimulateReadingAPIView, DriftPredictionAPIView,
     ModelTrainingAPIView, EnhancedAnomalyDetectionAPIView, 
     EnhancedDriftPredictionAPIView, EnhancedCalibrationAPIView, AutoTrainModelsAPIView,
+    BatchAnomalyDetectionAPIView, BatchDriftPredictionAPIView, BatchCalibrationAPIView, CalibrationArraysAPIView,
+    DriftForecastAPIView,
     MLAnalyticsAPIView, CalibrationSchedulerAPIView,
     CustomTokenObtainPairView, UserRegistrationAPIView, UserProfileAPIView,
     ChangePasswordAPIView, LogoutAPIView
@@ -17,9 +19,11 @@ urlpatterns = [
     path("sensors/", SensorListCreateAPIView.as_view(), name="sensor-list-create"),
     path("sensors/<int:pk>/", SensorDetailAPIView.as_view(), name="sensor-detail"),
     path("sensors/dashboard/", SensorDashboardAPIView.as_view(), name="sensor-dashboard"),
+    path("sensors/stream/", LiveStreamView.as_view(), name="sensor-stream"),
 
     # Readings
     path('readings/', ReadingListCreateAPIView.as_view(), name='reading-list-create'),
+    path('readings/batch/', ReadingBatchCreateAPIView.as_view(), name='reading-batch-create'),
     path('readings/history/', ReadingHistoryAPIView.as_view(), name='reading-history'),
 
     # Calibration
@@ -38,8 +42,13 @@ urlpatterns = [
     # Model Training & Enhanced ML
     path('ml/train/', ModelTrainingAPIView.as_view(), name='model-training'),
     path('ml/anomaly/detect/', EnhancedAnomalyDetectionAPIView.as_view(), name='enhanced-anomaly-detection'),
+    path('ml/anomaly/detect/batch/', BatchAnomalyDetectionAPIView.as_view(), name='batch-anomaly-detection'),
     path('ml/drift/predict/', EnhancedDriftPredictionAPIView.as_view(), name='enhanced-drift-prediction'),
+    path('ml/drift/predict/batch/', BatchDriftPredictionAPIView.as_view(), name='batch-drift-prediction'),
+    path('ml/drift/forecast/', DriftForecastAPIView.as_view(), name='drift-forecast'),
     path('ml/calibration/apply/', EnhancedCalibrationAPIView.as_view(), name='enhanced-calibration'),
+    path('ml/calibration/apply/batch/', BatchCalibrationAPIView.as_view(), name='batch-calibration'),
+    path('ml/calibration/apply/arrays/', CalibrationArraysAPIView.as_view(), name='calibration-arrays'),
     path('ml/auto-train/', AutoTrainModelsAPIView.as_view(), name='auto-train-models'),
     path('ml/analytics/', MLAnalyticsAPIView.as_view(), name='ml-analytics'),
     path('ml/calibration-schedule/', CalibrationSchedulerAPIView.as_view(), name='calibration-scheduler'),
@@ -6,7 +6,12 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from .models import Sensor, Reading, Calibration, Anomaly, Report
+from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from .models import Sensor, Reading, Calibration, Anomaly, Report, DriftForecast
 from .serializers import (
     SensorSerializer,
     ReadingSerializer,
@@ -17,7 +22,22 @@ from .serializers import (
 from .authentication import UserRegistrationSerializer, CustomTokenObtainPairSerializer, get_tokens_for_user
 from .services.simulation import generate_sensor_reading
 from .services.anomaly import predict_drift
-from django.http import HttpResponse
+from .services.ingestion import ingest_readings_batch, MAX_BATCH_SIZE
+from .services.ingest_buffer import store_reading, BufferFull
+from .services.rollups import RESOLUTIONS, select_resolution, rollup_series, rollup_bounds
+from .services.downsampling import downsample_history, WindowTooLarge, METHODS as DOWNSAMPLING_METHODS
+from .services.dashboard import dashboard_readings, get_latest_snapshot, invalidate_latest_snapshot
+from .services.history import (
+    InvalidHistoryQuery, MAX_PAGE_SIZE, parse_limit, parse_fields, parse_include, history_page, history_page_values,
+    page_corrected_values,
+)
+from .services.live_updates import hub as live_hub, publish_anomalies
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework.utils.encoders import JSONEncoder
+import asyncio
+import json
 from .services import report as report_service
 
 # ---------------- SENSOR VIEWS ----------------
@@ -30,6 +50,15 @@ class SensorDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Sensor.objects.all()
     serializer_class = SensorSerializer
 
+    # The dashboard snapshot embeds sensor name/type/baseline
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_latest_snapshot()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_latest_snapshot()
+
 
 # ---------------- READING VIEWS ----------------
 class ReadingListCreateAPIView(APIView):
@@ -37,40 +66,58 @@ class ReadingListCreateAPIView(APIView):
         serializer = ReadingSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=400)
-        reading = serializer.save()
-
-        sensor = reading.sensor
-        ideal_value = sensor.value or 1
-        actual_value = reading.raw_value
-
-        # Calculate drift as percentage
-        drift_percent = ((actual_value - ideal_value) / ideal_value) * 100
-
-        # Use dynamic threshold based on sensor type
-        threshold_map = {
-            "Temperature": 3,
-            "Pressure": 2,    # example: smaller threshold
-            "Humidity": 2,    # example: smaller threshold
-            "Vibration": 5,
-            "Flow": 5,
-        }
-        threshold = threshold_map.get(sensor.type, 3)
-
-        if abs(drift_percent) > threshold:
-            severity = "High" if abs(drift_percent) <= 5 else "Critical"
-            Anomaly.objects.create(
-                sensor=sensor,
-                type="Drift",
-                value=actual_value,
-                expected=ideal_value,
-                deviation=drift_percent,
-                severity=severity,
-                resolved=False
-            )
 
-        return Response(ReadingSerializer(reading).data, status=201)
+        # Stores the reading and raises a Drift anomaly if it exceeds the
+        # sensor type's threshold
+        reading = Reading(**serializer.validated_data)
+        try:
+            store_reading(reading)
+        except BufferFull as e:
+            return Response({"error": str(e)}, status=503)
+
+        queued = reading.pk is None
+        data = ReadingSerializer(reading).data
+        if queued:
+            # 'enqueue' durability: accepted, but not written (and without an id) yet
+            data.pop('id')
+            return Response(data, status=202)
+        return Response(data, status=201)
+
+
+class ReadingBatchCreateAPIView(APIView):
+    def post(self, request):
+        """Ingest an array of readings for any number of sensors"""
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('readings')
+        if not isinstance(items, list):
+            return Response({"error": "Expected a list of readings"}, status=400)
+        if len(items) > MAX_BATCH_SIZE:
+            return Response({"error": f"Batch too large (max {MAX_BATCH_SIZE} readings)"}, status=400)
 
+        readings, anomalies, errors = ingest_readings_batch(items)
 
+        return Response({
+            "created": len(readings),
+            "anomalies_created": len(anomalies),
+            "failed": len(errors),
+            "errors": errors,
+        }, status=201 if readings or not errors else 400)
+
+
+def _parse_time(value):
+    """Parse an ISO date or datetime query parameter into an aware datetime"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            return None
+        parsed = datetime.combine(date, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
 
 
 class ReadingHistoryAPIView(APIView):
@@ -78,6 +125,19 @@ class ReadingHistoryAPIView(APIView):
         sensor_name = request.query_params.get('sensor_name')
         start = request.query_params.get('from')
         end = request.query_params.get('to')
+        resolution = request.query_params.get('resolution')
+
+        if request.query_params.get('include') and (resolution or request.query_params.get('max_points')):
+            # Aggregated and downsampled points are not readings with a corrected value
+            return Response({"error": "include is not supported with resolution or max_points"}, status=400)
+        if resolution:
+            return self._rollup_history(sensor_name, start, end, resolution)
+        if request.query_params.get('max_points'):
+            return self._downsampled_history(
+                sensor_name, start, end,
+                request.query_params.get('max_points'),
+                request.query_params.get('method', 'lttb')
+            )
 
         readings = Reading.objects.all()
         if sensor_name:
@@ -85,8 +145,97 @@ class ReadingHistoryAPIView(APIView):
         if start and end:
             readings = readings.filter(timestamp__range=[start, end])
 
-        serializer = ReadingSerializer(readings, many=True)
-        return Response(serializer.data)
+        # Keyset pagination on (timestamp, id); ?order=desc pages newest first
+        try:
+            limit = parse_limit(request.query_params.get('limit'))
+            fields = parse_fields(request.query_params.get('fields'))
+            cursor = request.query_params.get('cursor')
+            descending = request.query_params.get('order') == 'desc'
+            # ?include=corrected adds each reading's calibrated value
+            include_corrected = 'corrected' in parse_include(request.query_params.get('include'))
+
+            if fields:
+                results, next_cursor = history_page_values(
+                    readings, fields, limit, cursor, descending, include_corrected
+                )
+            else:
+                page, next_cursor = history_page(readings.select_related('sensor'), limit, cursor, descending)
+                results = ReadingSerializer(page, many=True).data
+                if include_corrected:
+                    for result, corrected in zip(results, page_corrected_values(page)):
+                        result['corrected_value'] = corrected
+        except InvalidHistoryQuery as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({"results": results, "next": next_cursor})
+
+    def _rollup_history(self, sensor_name, start, end, resolution):
+        """Aggregated history served from the reading rollups"""
+        if resolution != 'auto' and resolution not in RESOLUTIONS:
+            return Response({"error": f"resolution must be one of: auto, {', '.join(RESOLUTIONS)}"}, status=400)
+        if not sensor_name:
+            return Response({"error": "sensor_name required when resolution is set"}, status=400)
+
+        sensor = Sensor.objects.filter(name=sensor_name).first()
+        if not sensor:
+            return Response({"error": "Sensor not found"}, status=404)
+
+        start, end = _parse_time(start), _parse_time(end)
+        if resolution == 'auto':
+            if not (start and end):
+                first, last = rollup_bounds(sensor.id)
+                start, end = start or first, end or last
+            # Coarsest resolution that still gives the chart enough points
+            resolution = (select_resolution(start, end) if start and end else None) or 'minute'
+
+        buckets = rollup_series(sensor.id, resolution, start, end)
+        return Response({
+            "sensor_name": sensor.name,
+            "resolution": resolution,
+            "buckets": [
+                {
+                    "timestamp": b.bucket_start,
+                    "count": b.count,
+                    "min": b.min_value,
+                    "max": b.max_value,
+                    "mean": b.mean,
+                }
+                for b in buckets
+            ],
+        })
+
+    def _downsampled_history(self, sensor_name, start, end, max_points, method):
+        """Shape-preserving downsample of a sensor's history to max_points"""
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            return Response({"error": "max_points must be an integer"}, status=400)
+        if max_points < 3 or max_points > MAX_PAGE_SIZE:
+            return Response({"error": f"max_points must be between 3 and {MAX_PAGE_SIZE}"}, status=400)
+        if method not in DOWNSAMPLING_METHODS:
+            return Response({"error": f"method must be one of: {', '.join(DOWNSAMPLING_METHODS)}"}, status=400)
+        if not sensor_name:
+            return Response({"error": "sensor_name required when max_points is set"}, status=400)
+
+        sensor = Sensor.objects.filter(name=sensor_name).first()
+        if not sensor:
+            return Response({"error": "Sensor not found"}, status=404)
+
+        start, end = _parse_time(start), _parse_time(end)
+        if not (start and end):
+            first, last = rollup_bounds(sensor.id)
+            start, end = start or first, end or last
+
+        try:
+            points, source = downsample_history(sensor, start, end, max_points, method)
+        except WindowTooLarge as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({
+            "sensor_name": sensor.name,
+            "method": method,
+            "source": source,
+            "points": points,
+        })
 
 
 
@@ -124,6 +273,9 @@ class AnomalyListCreateAPIView(generics.ListCreateAPIView):
             queryset = queryset.filter(sensor__name=sensor_name)
         return queryset
 
+    def perform_create(self, serializer):
+        anomaly = serializer.save()
+        transaction.on_commit(lambda: publish_anomalies([anomaly]))
 
 
 class AnomalyDetectAPIView(APIView):
@@ -146,15 +298,19 @@ class ReportGenerateAPIView(APIView):
     def post(self, request):
         sensor_id = request.data.get('sensor_id')
         report_type = request.data.get('format', 'csv')  # default csv
+        include = request.data.get('include')
+        if include not in (None, '', 'corrected'):
+            return Response({"error": "include must be 'corrected'"}, status=400)
+        include_corrected = include == 'corrected'
 
         if report_type == 'csv':
-            output, filename = report_service.generate_csv_report(sensor_id)
+            output, filename = report_service.generate_csv_report(sensor_id, include_corrected)
             response = HttpResponse(output, content_type='text/csv')
         elif report_type == 'excel':
-            output, filename = report_service.generate_excel_report(sensor_id)
+            output, filename = report_service.generate_excel_report(sensor_id, include_corrected)
             response = HttpResponse(output, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
         elif report_type == 'pdf':
-            output, filename = report_service.generate_pdf_report(sensor_id)
+            output, filename = report_service.generate_pdf_report(sensor_id, include_corrected)
             response = HttpResponse(output, content_type='application/pdf')
         else:
             return Response({"error": "Invalid format"}, status=400)
@@ -167,20 +323,37 @@ class ReportGenerateAPIView(APIView):
 from .services.calibrations_ai import adaptive_calibration
 from .services.anomaly_ml import ml_anomaly_detection
 from .services.model_training import ModelTrainer
+from .services.training_pool import MODEL_TYPE_TASKS
 from .services.enhanced_ml_services import EnhancedMLServices
+from .services.model_cache import model_cache
+from .services.fleet_forecast import FORECAST_POINTS, forecast_fleet, stored_forecast
+from .services.batch_scoring import (
+    MAX_SCORING_BATCH_SIZE, score_anomalies_batch, apply_calibrations_batch, apply_calibration_arrays,
+    predict_drifts_batch
+)
 from .services.ml_analytics import MLAnalyticsService
+from .services.analytics_snapshot import SnapshotPending, snapshot_statistics
 from .services.calibration_scheduler import CalibrationScheduler
 
 class SimulateReadingAPIView(APIView):
     def post(self, request):
         sensor_id = request.data.get('sensor_id')
-        reading = generate_sensor_reading(sensor_id)
-        if not reading:
-            return Response({"error": "Sensor not found"}, status=404)
+        if getattr(settings, 'SIMULATED_CALIBRATION_STORAGE', 'calibration') == 'reading':
+            # Corrected value stored on the reading itself, no Calibration row
+            reading = generate_sensor_reading(
+                sensor_id, correct=lambda raw_value: adaptive_calibration(sensor_id, raw_value)
+            )
+            if not reading:
+                return Response({"error": "Sensor not found"}, status=404)
+            corrected_value = reading.corrected_value
+        else:
+            reading = generate_sensor_reading(sensor_id)
+            if not reading:
+                return Response({"error": "Sensor not found"}, status=404)
 
-        # Apply adaptive calibration
-        corrected_value = adaptive_calibration(sensor_id, reading.raw_value)
-        Calibration.objects.create(sensor_id=sensor_id, method="adaptive", params={}, corrected_value=corrected_value)
+            # Apply adaptive calibration
+            corrected_value = adaptive_calibration(sensor_id, reading.raw_value)
+            Calibration.objects.create(sensor_id=sensor_id, method="adaptive", params={}, corrected_value=corrected_value)
 
         # Detect ML anomalies
         ml_anomaly_detection(sensor_id)
@@ -204,14 +377,80 @@ from django.utils.timezone import now
 
 class SensorDashboardAPIView(APIView):
     def get(self, request):
-        sensors = Sensor.objects.all()
-        data = []
-        for sensor in sensors:
-            latest = sensor.readings.order_by('-timestamp').first()
-            if latest:
-                serialized = ReadingSerializer(latest).data
-                data.append(serialized)
-        return Response(data)
+        # Served from the cached latest-reading snapshot, which ingestion
+        # keeps current; a cache miss rebuilds it with one query
+        return Response(dashboard_readings())
+
+
+# ---------------- LIVE STREAM VIEWS ----------------
+# Seconds between keep-alive comments on an idle stream
+STREAM_HEARTBEAT_INTERVAL = 15
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n"
+
+
+class LiveStreamView(View):
+    """
+    Server-Sent Events stream of newly ingested readings and anomalies.
+    ?sensor_ids=1,2 limits the stream to those sensors (default: all).
+    Starts with a 'snapshot' event holding the current dashboard readings,
+    then sends 'reading' and 'anomaly' events as they are committed. A
+    'resync' event means the client fell behind and should reload.
+
+    Under WSGI every open stream holds a worker thread; serve it through
+    asgi.py to keep connections cheap.
+    """
+
+    def get(self, request):
+        sensor_ids = request.GET.get('sensor_ids')
+        if sensor_ids:
+            try:
+                sensor_ids = {int(s) for s in sensor_ids.split(',') if s.strip()}
+            except ValueError:
+                return JsonResponse({"error": "sensor_ids must be a comma separated list of integers"}, status=400)
+
+        latest = get_latest_snapshot()
+        snapshot = [
+            latest[sensor_id]['data'] for sensor_id in sorted(latest)
+            if not sensor_ids or sensor_id in sensor_ids
+        ]
+        if isinstance(request, ASGIRequest):
+            events = self._async_events(sensor_ids, snapshot)
+        else:
+            events = self._sync_events(sensor_ids, snapshot)
+
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _sync_events(self, sensor_ids, snapshot):
+        subscription = live_hub.subscribe(sensor_ids)
+        try:
+            yield _sse('snapshot', snapshot)
+            while True:
+                event = subscription.get(timeout=STREAM_HEARTBEAT_INTERVAL)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield _sse(event['event'], event['data'])
+        finally:
+            live_hub.unsubscribe(subscription)
+
+    async def _async_events(self, sensor_ids, snapshot):
+        subscription = live_hub.subscribe(sensor_ids, loop=asyncio.get_running_loop())
+        try:
+            yield _sse('snapshot', snapshot)
+            while True:
+                event = await subscription.aget(timeout=STREAM_HEARTBEAT_INTERVAL)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield _sse(event['event'], event['data'])
+        finally:
+            live_hub.unsubscribe(subscription)
 
 
 # ---------------- MODEL TRAINING VIEWS ----------------
@@ -229,22 +468,20 @@ class ModelTrainingAPIView(APIView):
             if not sensor_id:
                 return Response({"error": "sensor_id required for specific model training"}, status=400)
             
-            if model_type == 'anomaly':
-                results = trainer.train_anomaly_detection_model(sensor_id)
-            elif model_type == 'drift':
-                results = trainer.train_drift_prediction_model(sensor_id)
-            elif model_type == 'calibration':
-                results = trainer.train_calibration_model(sensor_id)
-            else:
+            if model_type not in MODEL_TYPE_TASKS:
                 return Response({"error": "Invalid model_type"}, status=400)
+            results = trainer.train_model(sensor_id, model_type)
+            if results['status'] == 'skipped':
+                # Another request or process is training this model right now
+                return Response(results, status=409)
         
         return Response(results, status=200)
     
     def get(self, request):
-        """Get information about trained models"""
+        """Get information about trained models and the model cache"""
         trainer = ModelTrainer()
         models_info = trainer.get_model_info()
-        return Response({"models": models_info})
+        return Response({"models": models_info, "cache": model_cache.stats()})
 
 
 class EnhancedAnomalyDetectionAPIView(APIView):
@@ -272,8 +509,11 @@ class EnhancedDriftPredictionAPIView(APIView):
         if not sensor_id:
             return Response({"error": "sensor_id required"}, status=400)
         
-        ml_service = EnhancedMLServices()
-        result = ml_service.predict_drift_with_trained_model(sensor_id, future_points)
+        # Precomputed by the fleet forecasting job when available
+        result = stored_forecast(sensor_id, future_points)
+        if result is None:
+            ml_service = EnhancedMLServices()
+            result = ml_service.predict_drift_with_trained_model(sensor_id, future_points)
         
         return Response(result)
 
@@ -293,6 +533,101 @@ class EnhancedCalibrationAPIView(APIView):
         return Response(result)
 
 
+def _batch_items(request):
+    """Items of a batch scoring request: a list, or {"items": [...]}"""
+    items = request.data
+    if isinstance(items, dict):
+        items = items.get('items')
+    if not isinstance(items, list):
+        return None, Response({"error": "Expected a list of items"}, status=400)
+    if len(items) > MAX_SCORING_BATCH_SIZE:
+        return None, Response({"error": f"Batch too large (max {MAX_SCORING_BATCH_SIZE} items)"}, status=400)
+    return items, None
+
+
+class BatchAnomalyDetectionAPIView(APIView):
+    def post(self, request):
+        """Score many (sensor_id, reading_value, timestamp) items; results in input order"""
+        items, error = _batch_items(request)
+        if error:
+            return error
+        return Response({"results": score_anomalies_batch(items)})
+
+
+class BatchDriftPredictionAPIView(APIView):
+    def post(self, request):
+        """Drift predictions for many (sensor_id, future_points) items; results in input order"""
+        items, error = _batch_items(request)
+        if error:
+            return error
+        return Response({"results": predict_drifts_batch(items)})
+
+
+class BatchCalibrationAPIView(APIView):
+    def post(self, request):
+        """Calibrate many (sensor_id, raw_value) items; results in input order"""
+        items, error = _batch_items(request)
+        if error:
+            return error
+        return Response({"results": apply_calibrations_batch(items)})
+
+
+class CalibrationArraysAPIView(APIView):
+    def post(self, request):
+        """
+        Calibrate arrays of raw values, or of stored readings by id, for one
+        sensor ({sensor_id, ...}) or many (a list or {"items": [...]});
+        results in input order
+        """
+        if isinstance(request.data, dict) and 'items' not in request.data:
+            items = [request.data]
+        else:
+            items, error = _batch_items(request)
+            if error:
+                return error
+        # Malformed arrays are left for the per-item validation to report
+        size = sum(
+            len(values)
+            for item in items if isinstance(item, dict)
+            for values in (item.get('raw_values'), item.get('reading_ids')) if isinstance(values, list)
+        )
+        if size > MAX_SCORING_BATCH_SIZE:
+            return Response({"error": f"Batch too large (max {MAX_SCORING_BATCH_SIZE} values)"}, status=400)
+        return Response({"results": apply_calibration_arrays(items)})
+
+
+class DriftForecastAPIView(APIView):
+    def get(self, request):
+        """Latest precomputed drift forecasts of all sensors"""
+        forecasts = DriftForecast.objects.select_related('sensor').order_by('sensor_id')
+        return Response({"forecasts": [
+            {
+                "sensor_id": f.sensor_id,
+                "sensor_name": f.sensor.name,
+                "predictions": f.predictions,
+                "model_used": f.model_used,
+                "confidence": f.confidence,
+                "generated_at": f.generated_at,
+            }
+            for f in forecasts
+        ]})
+
+    def post(self, request):
+        """Recompute drift forecasts for all sensors (or sensor_ids)"""
+        sensor_ids = request.data.get('sensor_ids')
+        future_points = request.data.get('future_points', FORECAST_POINTS)
+        try:
+            future_points = int(future_points)
+            if sensor_ids is not None:
+                sensor_ids = [int(s) for s in sensor_ids]
+        except (TypeError, ValueError):
+            return Response({"error": "sensor_ids must be a list of integers and future_points an integer"}, status=400)
+        if not 1 <= future_points <= 100:
+            return Response({"error": "future_points must be between 1 and 100"}, status=400)
+
+        return Response(forecast_fleet(sensor_ids, future_points))
+
+
 class AutoTrainModelsAPIView(APIView):
     def post(self, request):
         """Automatically train models if needed"""
@@ -309,10 +644,11 @@ class AutoTrainModelsAPIView(APIView):
 
 class MLAnalyticsAPIView(APIView):
     def get(self, request):
-        """Get ML analytics and statistics"""
-        analytics_service = MLAnalyticsService()
-        stats = analytics_service.get_ml_statistics()
-        return Response(stats)
+        """Get ML analytics and statistics, from the last snapshot (age_seconds tells how old)"""
+        try:
+            return Response(snapshot_statistics())
+        except SnapshotPending as e:
+            return Response({"error": str(e)}, status=503, headers={"Retry-After": str(e.retry_after)})
     
     def post(self, request):
         """Trigger automatic model training"""
@@ -331,9 +667,11 @@ class CalibrationSchedulerAPIView(APIView):
         
         scheduler = CalibrationScheduler()
         
-        # Get drift predictions first
-        ml_service = EnhancedMLServices()
-        drift_result = ml_service.predict_drift_with_trained_model(int(sensor_id), 5)
+        # Get drift predictions first, precomputed when available
+        drift_result = stored_forecast(int(sensor_id), 5)
+        if drift_result is None:
+            ml_service = EnhancedMLServices()
+            drift_result = ml_service.predict_drift_with_trained_model(int(sensor_id), 5)
         
         if 'predictions' in drift_result:
             schedule_result = scheduler.predict_calibration_schedule(int(sensor_id), drift_result['predictions'])
@@ -58,10 +58,10 @@ export const SensorProvider: React.FC<SensorProviderProps> = ({ children }) => {
   const fetchReadings = async (sensorId: number, sensorName: string) => {
     try {
       const res = await axios.get(
-        `http://127.0.0.1:8000/api/readings/history/?sensor_name=${sensorName}`
+        `http://127.0.0.1:8000/api/readings/history/?sensor_name=${sensorName}&order=desc&limit=1`
       );
-      if (res.data.length > 0) {
-        const latest = res.data[res.data.length - 1];
+      if (res.data.results.length > 0) {
+        const latest = res.data.results[0];
         setReadings(prev => ({
           ...prev,
           [sensorId]: [...(prev[sensorId] || []), latest].slice(-50) // Keep last 50 readings